@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class LibappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'LibApp'
+
+    def ready(self):
+        from .metrics import watch_queries
+        from .search import install_search_indexes
+
+        # SQLite's book text index lives on triggers that table rebuilds drop,
+        # check it once the migrations ran
+        post_migrate.connect(install_search_indexes, sender=self)
+        # Every connection counts the queries of the request using it
+        connection_created.connect(watch_queries)
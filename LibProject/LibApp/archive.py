@@ -0,0 +1,80 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from .models import ArchivedTransaction, Transaction
+
+# Archiving of old transaction history. Transactions dated before the horizon
+# (ARCHIVE_AFTER_DAYS ago) are moved to ArchivedTransaction with their ids, a
+# range of ids at a time: one INSERT ... SELECT and one DELETE in a short
+# database transaction, so the hot table is only ever locked for one batch.
+# Searches and exports include the archive when asked to. Loans and the
+# dashboard counters do not refer to transactions, moving them changes neither.
+#
+# On MySQL the archive table is partitioned by date (see migration 0006) and a
+# partition per year is split off before rows of that year are moved in. The
+# transaction table itself cannot be partitioned: MySQL does not allow foreign
+# keys on partitioned tables.
+
+DEFAULT_BATCH_SIZE = 5000
+
+COLUMNS = ('id', 'book_id', 'member_id', 'transaction_type', 'transaction_date', 'fee_charged', 'amount_paid')
+MOVE_SQL = '''
+INSERT INTO {archive} ({columns})
+SELECT {columns} FROM {transaction}
+WHERE id > %s AND id <= %s AND transaction_date < %s
+'''
+
+def archive_horizon():
+    return timezone.now() - timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 730))
+
+def add_year_partitions(first_year, last_year):
+    # Split a partition per year off the catch-all one, for the years after
+    # the last existing partition. MySQL only
+    table = connection.ops.quote_name(ArchivedTransaction._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT partition_name FROM information_schema.partitions '
+                       'WHERE table_schema = DATABASE() AND table_name = %s', [ArchivedTransaction._meta.db_table])
+        years = [int(name[1:]) for (name,) in cursor.fetchall() if name and name != 'pmax']
+        for year in range(max(years, default=first_year - 1) + 1, last_year + 1):
+            cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO "
+                           f"(PARTITION p{year} VALUES LESS THAN ('{year + 1}-01-01'), "
+                           f"PARTITION pmax VALUES LESS THAN (MAXVALUE))")
+
+def archive_transactions(before=None, batch_size=DEFAULT_BATCH_SIZE, pause=0, progress=None):
+    # Move the transactions dated before `before` (the horizon by default) to
+    # the archive, sleeping `pause` seconds between batches. Returns the number
+    # of transactions moved. progress, if given, is called with the running
+    # count after each batch
+    from .search_cache import invalidate
+    before = before or archive_horizon()
+    old = Transaction.objects.filter(transaction_date__lt=before)
+    bounds = old.aggregate(first_id=Min('pk'), last_id=Max('pk'), first=Min('transaction_date'), last=Max('transaction_date'))
+    if bounds['first_id'] is None:
+        return 0
+    if connection.vendor == 'mysql':
+        add_year_partitions(bounds['first'].year, bounds['last'].year)
+
+    quote = connection.ops.quote_name
+    sql = MOVE_SQL.format(archive=quote(ArchivedTransaction._meta.db_table),
+                          transaction=quote(Transaction._meta.db_table),
+                          columns=', '.join(quote(column) for column in COLUMNS))
+    cutoff = connection.ops.adapt_datetimefield_value(before)
+    moved = 0
+    for start in range(bounds['first_id'] - 1, bounds['last_id'], batch_size):
+        end = start + batch_size
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [start, end, cutoff])
+            # No signal receivers and nothing refers to transactions, so this
+            # is a single DELETE
+            deleted, _ = old.filter(pk__gt=start, pk__lte=end).delete()
+            moved += deleted
+            invalidate(Transaction, ArchivedTransaction)
+        if progress:
+            progress(moved)
+        if pause:
+            time.sleep(pause)
+    return moved
@@ -0,0 +1,338 @@
+import heapq
+import sys
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError
+from .models import Book, Member
+from .search import tokenize
+
+# Per-process search-as-you-type indexes. Each index maps row ids to one text
+# column and is organised around the distinct words of that column:
+#   - a sorted word list answers prefix lookups with two bisections,
+#   - a trigram -> words map answers infix lookups ("piens" in "sapiens") and
+#     gathers the candidates of typo-tolerant lookups ("sapeins"), which are
+#     then ranked by edit distance,
+#   - a word -> row ids posting array turns matched words into rows.
+# The vocabulary is far smaller than the table, so lookups stay fast on very
+# large catalogs and the per-row cost is one label string and a few postings.
+
+MAX_CANDIDATES = 200
+# Words of the vocabulary edit distances are computed for, per fuzzy term
+MAX_FUZZY_WORDS = 100
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+def trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+def grams(word):
+    # The word's trigrams and the two marking its start and end, which keep
+    # a typo in a short word from losing every shared trigram
+    padded = f'${word}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def max_edits(term):
+    # Typos tolerated in a term, by its length
+    return 0 if len(term) < 3 else 1 if len(term) < 6 else 2
+
+def single_edits(word):
+    # Every string one insertion, deletion, substitution or swap away
+    letters = set(ALPHABET).union(word)
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    edits = {a + b[1:] for a, b in splits if b}
+    edits.update(a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1)
+    edits.update(a + c + b[1:] for a, b in splits if b for c in letters)
+    edits.update(a + c + b for a, b in splits for c in letters)
+    edits.discard(word)
+    return edits
+
+def edit_distance(a, b, limit):
+    # Optimal string alignment distance: insertions, deletions, substitutions
+    # and swaps of adjacent letters. Anything over limit is limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return min(current[-1], limit + 1)
+
+
+class AutocompleteIndex:
+    def __init__(self, name):
+        self.name = name
+        self.ready = False
+        self._lock = threading.RLock()
+        self._labels = {}
+        self._words = []
+        self._postings = {}
+        self._trigrams = defaultdict(set)
+
+    def __len__(self):
+        return len(self._labels)
+
+    def load(self, rows):
+        # Replace the contents with (id, text) rows
+        with self._lock:
+            self._labels = {}
+            self._postings = {}
+            self._trigrams = defaultdict(set)
+            for entry_id, text in rows:
+                self._labels[entry_id] = text
+                for word in set(tokenize(text)):
+                    posting = self._postings.get(word)
+                    if posting is None:
+                        posting = self._postings[word] = array('q')
+                    posting.append(entry_id)
+            self._words = sorted(self._postings)
+            for word in self._words:
+                for trigram in grams(word):
+                    self._trigrams[trigram].add(word)
+            self.ready = True
+
+    def add(self, entry_id, text):
+        with self._lock:
+            if not self.ready or self._labels.get(entry_id) == text:
+                return
+            self._remove(entry_id)
+            self._labels[entry_id] = text
+            for word in set(tokenize(text)):
+                posting = self._postings.get(word)
+                if posting is None:
+                    posting = self._postings[word] = array('q')
+                    insort(self._words, word)
+                    for trigram in grams(word):
+                        self._trigrams[trigram].add(word)
+                posting.append(entry_id)
+
+    def remove(self, entry_id):
+        with self._lock:
+            if self.ready:
+                self._remove(entry_id)
+
+    def _remove(self, entry_id):
+        text = self._labels.pop(entry_id, None)
+        if text is None:
+            return
+        for word in set(tokenize(text)):
+            posting = self._postings[word]
+            posting.remove(entry_id)
+            if not posting:
+                # Last row using the word, drop it from the vocabulary
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+                for trigram in grams(word):
+                    self._trigrams[trigram].discard(word)
+                    if not self._trigrams[trigram]:
+                        del self._trigrams[trigram]
+
+    def _matching_words(self, term):
+        # Words starting with the term, or containing it when none does
+        start = bisect_left(self._words, term)
+        end = bisect_left(self._words, term + '\uffff', start)
+        if start < end:
+            return self._words[start:end]
+        if len(term) < 3:
+            return []
+        word_sets = sorted((self._trigrams.get(trigram, ()) for trigram in trigrams(term)), key=len)
+        candidates = set(word_sets[0]).intersection(*word_sets[1:])
+        return [word for word in candidates if term in word]
+
+    def query(self, text, limit=10, distinct=True):
+        # Distinct labels whose words match every query term by prefix (or
+        # infix), labels starting with the whole query first, then shortest.
+        # distinct=False returns every matching row, rows sharing a label too,
+        # for pickers that resolve the ids
+        terms = tokenize(text)
+        if not terms:
+            return []
+        with self._lock:
+            matches = []
+            for term in set(terms):
+                words = self._matching_words(term)
+                if not words:
+                    return []
+                matches.append((term, words))
+            if len(matches) > 1:
+                matches.sort(key=lambda match: sum(len(self._postings[word]) for word in match[1]))
+
+            # Walk the rows of the most selective term. The other terms are
+            # checked with a substring test first, the word match only runs
+            # on the rows that pass it
+            other_terms = [(term, set(words)) for term, words in matches[1:]]
+            seen, candidates = set(), []
+            for word in sorted(matches[0][1], key=len):
+                for entry_id in self._postings[word]:
+                    label = self._labels[entry_id]
+                    key = label if distinct else entry_id
+                    if key in seen:
+                        continue
+                    if other_terms:
+                        lowered = label.lower()
+                        if not all(term in lowered for term, _ in other_terms):
+                            continue
+                        label_words = set(tokenize(label))
+                        if not all(label_words & words for _, words in other_terms):
+                            continue
+                    seen.add(key)
+                    candidates.append((entry_id, label))
+                    if len(candidates) >= MAX_CANDIDATES:
+                        break
+                if len(candidates) >= MAX_CANDIDATES:
+                    break
+
+        prefix = normalize(text)
+        candidates.sort(key=lambda item: (not normalize(item[1]).startswith(prefix), len(item[1]), item[1]))
+        return [{'id': entry_id, 'label': label} for entry_id, label in candidates[:limit]]
+
+    def _fuzzy_words(self, term):
+        # {word: edit distance} of the words within the term's allowance. One
+        # typo away is found exactly, by looking up every single edit of the
+        # term: a typo near the start of a short word leaves it no trigram in
+        # common with the intended one. Two typos away is only tried among the
+        # words sharing the most trigrams with the term. Short terms can't be
+        # told apart from typos and match by prefix instead
+        limit = max_edits(term)
+        if not limit:
+            start = bisect_left(self._words, term)
+            end = bisect_left(self._words, term + '\uffff', start)
+            return dict.fromkeys(self._words[start:end], 0)
+        found = {word: 1 for word in single_edits(term) if word in self._postings}
+        if term in self._postings:
+            found[term] = 0
+        if limit > 1:
+            shared = Counter()
+            for trigram in grams(term):
+                shared.update(self._trigrams.get(trigram, ()))
+            candidates = heapq.nlargest(MAX_FUZZY_WORDS, (item for item in shared.items() if item[0] not in found
+                                                          and abs(len(item[0]) - len(term)) <= limit), key=lambda item: item[1])
+            for word, _ in candidates:
+                if edit_distance(term, word, limit) <= limit:
+                    found[word] = limit
+        return found
+
+    def fuzzy(self, text, limit=10):
+        # Rows whose words match every query term within a few typos, ranked
+        # by the total edit distance, then shortest label. Unlike query()
+        # every row is returned, not one per distinct label
+        terms = tokenize(text)
+        if not terms:
+            return []
+        with self._lock:
+            matches = []
+            for term in set(terms):
+                words = self._fuzzy_words(term)
+                if not words:
+                    return []
+                matches.append(words)
+            matches.sort(key=lambda words: sum(len(self._postings[word]) for word in words))
+
+            # Walk the rows of the most selective term, closest words first
+            first, others = matches[0], matches[1:]
+            candidates = []
+            for word in sorted(first, key=lambda word: (first[word], len(word))):
+                for entry_id in self._postings[word]:
+                    label = self._labels[entry_id]
+                    distance = first[word]
+                    label_words = set(tokenize(label)) if others else ()
+                    for words in others:
+                        common = words.keys() & label_words
+                        if not common:
+                            break
+                        distance += min(words[w] for w in common)
+                    else:
+                        candidates.append((distance, len(label), entry_id, label))
+                    if len(candidates) >= MAX_CANDIDATES:
+                        break
+                if len(candidates) >= MAX_CANDIDATES:
+                    break
+
+        candidates.sort()
+        return [{'id': entry_id, 'label': label, 'distance': distance}
+                for distance, _, entry_id, label in candidates[:limit]]
+
+    def stats(self):
+        # Approximate memory held by the index, containers and their contents
+        with self._lock:
+            labels = sys.getsizeof(self._labels) + sum(sys.getsizeof(text) for text in self._labels.values())
+            words = sys.getsizeof(self._words) + sum(sys.getsizeof(word) for word in self._words)
+            postings = sys.getsizeof(self._postings) + sum(sys.getsizeof(p) for p in self._postings.values())
+            trigram_map = sys.getsizeof(self._trigrams) + sum(
+                sys.getsizeof(trigram) + sys.getsizeof(words) for trigram, words in self._trigrams.items())
+            return {
+                'entries': len(self._labels),
+                'words': len(self._words),
+                'trigrams': len(self._trigrams),
+                'memory_bytes': labels + words + postings + trigram_map,
+            }
+
+
+# One index per suggested column, (model, field) they are built from
+INDEXES = {
+    'book_title': (Book, 'title'),
+    'book_author': (Book, 'author'),
+    'member_name': (Member, 'name'),
+    'member_id': (Member, 'member_id'),
+}
+
+_indexes = {kind: AutocompleteIndex(kind) for kind in INDEXES}
+_build_lock = threading.Lock()
+
+def _load(kind):
+    # Stream the indexed column from the database in chunks
+    model, field = INDEXES[kind]
+    _indexes[kind].load(model.objects.values_list('pk', field).iterator(chunk_size=5000))
+
+def build_indexes():
+    with _build_lock:
+        for kind in INDEXES:
+            _load(kind)
+
+def warm_up():
+    # Called by the WSGI/ASGI entry points so the first lookups don't pay for the
+    # build, a database that is not reachable yet defers it to first use instead
+    try:
+        build_indexes()
+    except DatabaseError:
+        pass
+
+def get_index(kind):
+    # Indexes are built once per process, on first use if not warmed at startup
+    index = _indexes[kind]
+    if not index.ready:
+        with _build_lock:
+            if not index.ready:
+                _load(kind)
+    return index
+
+async def aget_index(kind):
+    # get_index for async views, a build reads the whole table so it runs in a
+    # worker thread
+    index = _indexes[kind]
+    if index.ready:
+        return index
+    return await sync_to_async(get_index)(kind)
+
+def index_stats():
+    return {kind: index.stats() for kind, index in _indexes.items() if index.ready}
+
+def update_entry(model, instance):
+    for kind, (indexed_model, field) in INDEXES.items():
+        if indexed_model is model:
+            _indexes[kind].add(instance.pk, getattr(instance, field))
+
+def remove_entry(model, entry_id):
+    for kind, (indexed_model, field) in INDEXES.items():
+        if indexed_model is model:
+            _indexes[kind].remove(entry_id)
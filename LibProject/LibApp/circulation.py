@@ -0,0 +1,119 @@
+from collections import Counter, defaultdict, deque
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.db.models import F
+from .models import Book, Loan, Member, Transaction, MAX_OUTSTANDING_DEBT, loan_period
+from .search_cache import invalidate
+from .stats import adjust, issues_key
+
+# Batch circulation: a member's stack of issues and returns applied in one
+# database transaction. The book and member rows are locked once, every item is
+# checked against the running stock and debt, accepted items are inserted with
+# one bulk INSERT and each book and the member get a single aggregated UPDATE.
+# Loans follow the same way: one bulk INSERT of the issues and one UPDATE
+# closing the loans the returns end.
+
+ACTIONS = ('issue', 'return')
+MAX_BATCH_SIZE = 100
+
+def parse_amount(value):
+    amount = Decimal(str(value if value not in (None, '') else 0))
+    if not amount.is_finite() or amount < 0:
+        raise InvalidOperation
+    return amount.quantize(Decimal('0.01'))
+
+def parse_item(item):
+    # Returns (book id, action, fee charged, amount paid) or raises ValueError
+    if not isinstance(item, dict):
+        raise ValueError('Item must be an object.')
+    if item.get('action') not in ACTIONS:
+        raise ValueError('Action must be issue or return.')
+    try:
+        book_id = int(item.get('book'))
+    except (TypeError, ValueError):
+        raise ValueError('Book must be a book id.')
+    try:
+        fee_charged = parse_amount(item.get('fee_charged'))
+        amount_paid = parse_amount(item.get('amount_paid'))
+    except (InvalidOperation, ValueError):
+        raise ValueError('Fee charged and amount paid must be positive amounts.')
+    return book_id, item['action'], fee_charged, amount_paid
+
+def apply_batch(member_id, items):
+    # Apply the items in order and return one result per item, raises
+    # Member.DoesNotExist for an unknown member
+    results = [{'index': index, 'success': False} for index in range(len(items))]
+    parsed = {}
+    for index, item in enumerate(items):
+        try:
+            parsed[index] = parse_item(item)
+        except ValueError as e:
+            results[index]['error'] = str(e)
+
+    with transaction.atomic():
+        # Lock the rows in the same order as Transaction.save: books, then member
+        book_ids = sorted({book_id for book_id, _, _, _ in parsed.values()})
+        stock = dict(Book.objects.select_for_update().filter(pk__in=book_ids)
+                     .order_by('pk').values_list('pk', 'quantity_available'))
+        member = Member.objects.select_for_update().get(pk=member_id)
+        debt = member.outstanding_debt
+        # The member's open loans of these books, oldest first per book, then
+        # the loans opened by this batch
+        open_loans = defaultdict(deque)
+        for loan_id, book_id in (Loan.objects.select_for_update().open().filter(member_id=member.pk, book_id__in=book_ids)
+                                 .order_by('issued_at', 'pk').values_list('pk', 'book_id')):
+            open_loans[book_id].append(loan_id)
+
+        transactions, stock_change = [], Counter()
+        for index, (book_id, action, fee_charged, amount_paid) in parsed.items():
+            result = results[index]
+            result.update(book=book_id, action=action)
+            if book_id not in stock:
+                result['error'] = 'Book does not exist.'
+                continue
+            if action == 'issue':
+                if stock[book_id] + stock_change[book_id] <= 0:
+                    result['error'] = 'No copies of this book are available.'
+                    continue
+                if debt + fee_charged - amount_paid > MAX_OUTSTANDING_DEBT:
+                    result['error'] = f'Outstanding debt cannot exceed {MAX_OUTSTANDING_DEBT}.'
+                    continue
+                debt += fee_charged - amount_paid
+                stock_change[book_id] -= 1
+            else:
+                stock_change[book_id] += 1
+            result['success'] = True
+            transactions.append(Transaction(book_id=book_id, member_id=member.pk, transaction_type=action,
+                                            fee_charged=fee_charged, amount_paid=amount_paid))
+
+        Transaction.objects.bulk_create(transactions)
+        # Pair the items now that bulk_create has dated them
+        new_loans, returned = [], []
+        for t in transactions:
+            loans = open_loans[t.book_id]
+            if t.transaction_type == 'issue':
+                loan = Loan(book_id=t.book_id, member_id=member.pk, issued_at=t.transaction_date,
+                            due_at=t.transaction_date + loan_period())
+                new_loans.append(loan)
+                loans.append(loan)
+            elif loans:
+                loan = loans.popleft()
+                if isinstance(loan, Loan):
+                    loan.returned_at = t.transaction_date
+                else:
+                    returned.append(loan)
+        Loan.objects.bulk_create(new_loans)
+        if returned:
+            Loan.objects.filter(pk__in=returned).update(returned_at=transactions[-1].transaction_date)
+        for book_id, change in stock_change.items():
+            if change:
+                Book.objects.filter(pk=book_id).update(quantity_available=F('quantity_available') + change)
+        if debt != member.outstanding_debt:
+            Member.objects.filter(pk=member.pk).update(outstanding_debt=F('outstanding_debt') + (debt - member.outstanding_debt))
+        on_loan = -sum(stock_change.values())
+        adjust({'books_on_loan': on_loan, 'copies_available': -on_loan, 'outstanding_debt': debt - member.outstanding_debt,
+                issues_key(): sum(1 for t in transactions if t.transaction_type == 'issue')})
+        # bulk_create and update() send no signals
+        invalidate(Transaction, Book, Member)
+
+    return results
@@ -0,0 +1,147 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .isbn import book_key
+from .models import ArchivedTransaction, Book, Member, Transaction
+
+# Full dumps of the transaction history, members and books for auditors, as CSV
+# or NDJSON. Rows are read in primary key order one chunk at a time, each chunk
+# a keyset range query (id > last id of the previous chunk), and written out
+# as they arrive, so memory stays flat however many rows there are. A plain
+# queryset.iterator() would not do: MySQL client libraries fetch the whole
+# result before the first row is returned.
+
+DEFAULT_CHUNK_SIZE = 2000
+
+TRANSACTION_COLUMNS = (('id', 'transaction_date', 'transaction_type', 'book__isbn', 'book__title',
+                        'member__member_id', 'member__name', 'fee_charged', 'amount_paid'),
+                       ('id', 'transaction_date', 'transaction_type', 'isbn', 'title',
+                        'member_id', 'member_name', 'fee_charged', 'amount_paid'))
+
+# (model, columns as values_list() lookups, header names)
+EXPORTS = {
+    'transactions': (Transaction, *TRANSACTION_COLUMNS),
+    'archived_transactions': (ArchivedTransaction, *TRANSACTION_COLUMNS),
+    'members': (Member,
+                ('id', 'member_id', 'name', 'email', 'outstanding_debt'),
+                ('id', 'member_id', 'name', 'email', 'outstanding_debt')),
+    'books': (Book,
+              ('id', 'isbn', 'title', 'author', 'quantity_available', 'quantity_total'),
+              ('id', 'isbn', 'title', 'author', 'quantity_available', 'quantity_total')),
+}
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+def parse_day(value, name):
+    # A YYYY-MM-DD date as the aware datetime starting that day
+    day = parse_date(value) if value else None
+    if day is None:
+        raise ValueError(f'{name} must be a date as YYYY-MM-DD.')
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def export_queryset(kind, since=None, until=None, member=None, book=None, archived=False):
+    # The rows of one export as a values_list queryset. Filters select through
+    # the transaction history: a date range (until inclusive) and a member_id
+    # and/or ISBN. Members and books are those with matching transactions, in
+    # the archive too if archived is set, or the one member or book named.
+    # Raises KeyError for an unknown kind and ValueError for a malformed date
+    model, columns, _ = EXPORTS[kind]
+    history = {}
+    if since:
+        history['transaction_date__gte'] = parse_day(since, 'since')
+    if until:
+        history['transaction_date__lt'] = parse_day(until, 'until') + timedelta(days=1)
+    if member and kind != 'members':
+        history['member__member_id'] = member
+    if book and kind != 'books':
+        history.update({f'book__{field}': value for field, value in book_key(book).items()})
+
+    queryset = model.objects.all()
+    if kind in ('transactions', 'archived_transactions'):
+        # Leaving out the history of deleted books and members until it is purged
+        queryset = queryset.filter(**history, book__deleted_at__isnull=True, member__deleted_at__isnull=True)
+    else:
+        if kind == 'members' and member:
+            queryset = queryset.filter(member_id=member)
+        if kind == 'books' and book:
+            queryset = queryset.filter(**book_key(book))
+        if history:
+            related = 'member_id' if kind == 'members' else 'book_id'
+            sources = (Transaction, ArchivedTransaction) if archived else (Transaction,)
+            queryset = queryset.filter(Q(*(Q(pk__in=source.objects.filter(**history).values(related))
+                                           for source in sources), _connector=Q.OR))
+    return queryset.values_list(*columns)
+
+def chunks(queryset, chunk_size):
+    # Keyset chunks of rows, the primary key comes first in every row
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_id).order_by('pk')[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+async def achunks(queryset, chunk_size):
+    # chunks() through the async ORM, for responses served over ASGI
+    last_id = 0
+    while True:
+        rows = [row async for row in queryset.filter(pk__gt=last_id).order_by('pk')[:chunk_size]]
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+class Echo:
+    # File-like object csv.writer writes to, handing each line back
+    def write(self, value):
+        return value
+
+class CsvEncoder:
+    def __init__(self, header):
+        self.writer = csv.writer(Echo())
+        self.header = header
+
+    def start(self):
+        return self.writer.writerow(self.header)
+
+    def encode(self, rows):
+        return ''.join(self.writer.writerow([value.isoformat() if isinstance(value, datetime) else value
+                                             for value in row]) for row in rows)
+
+class NdjsonEncoder:
+    def __init__(self, header):
+        self.header = header
+
+    def start(self):
+        return ''
+
+    def encode(self, rows):
+        return ''.join(json.dumps(dict(zip(self.header, row)), cls=DjangoJSONEncoder) + '\n' for row in rows)
+
+ENCODERS = {
+    'csv': CsvEncoder,
+    'ndjson': NdjsonEncoder,
+}
+
+def stream_export(queryset, kind, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Text of the export, one piece per chunk of rows
+    encoder = ENCODERS[file_format](EXPORTS[kind][2])
+    if header := encoder.start():
+        yield header
+    for rows in chunks(queryset, chunk_size):
+        yield encoder.encode(rows)
+
+async def astream_export(queryset, kind, file_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    encoder = ENCODERS[file_format](EXPORTS[kind][2])
+    if header := encoder.start():
+        yield header
+    async for rows in achunks(queryset, chunk_size):
+        yield encoder.encode(rows)
@@ -0,0 +1,94 @@
+from datetime import datetime, time
+from decimal import Decimal
+from django.conf import settings
+from django.db import NotSupportedError, connection, transaction
+from django.db.models import (DateTimeField, DecimalField, F, Func, IntegerField, OuterRef, Subquery, Sum,
+                              Value)
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+from .models import Loan, Member
+
+# Late fees for open loans, accrued by a nightly job (accrue_fees from cron).
+# A loan's fee on a given day is the daily rate times the whole days since it
+# fell due, capped per loan. Each run raises every open loan's fee_accrued to
+# that amount and adds the difference to the member's debt, so running twice
+# on the same day charges nothing more and a missed night is caught up by the
+# next run. The work is a handful of set-based statements per chunk of
+# members, each reading the members' open loans through the (returned_at,
+# member) index once. Fees can take a member past MAX_OUTSTANDING_DEBT,
+# which then stops further issues.
+
+DEFAULT_CHUNK_SIZE = 2000
+
+class DaysBetween(Func):
+    # Whole days from the first datetime expression to the second
+    arity = 2
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # julianday() is a float, round to milliseconds before dividing
+        (start, start_params), (end, end_params) = (compiler.compile(e) for e in self.get_source_expressions())
+        sql = f'CAST(ROUND((julianday({end}) - julianday({start})) * 86400000) AS INTEGER) / 86400000'
+        return sql, (*end_params, *start_params)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='TIMESTAMPDIFF(DAY, %(expressions)s)', **extra_context)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f'DaysBetween is not implemented for {connection.vendor}')
+
+def late_fee_rate():
+    return Decimal(str(getattr(settings, 'LATE_FEE_PER_DAY', '0.50')))
+
+def late_fee_cap():
+    return Decimal(str(getattr(settings, 'LATE_FEE_MAX', '20.00')))
+
+def fee_due(cutoff):
+    # A loan's late fee at the cutoff, as an expression over its due date
+    money = DecimalField(max_digits=10, decimal_places=2)
+    days = DaysBetween(F('due_at'), Value(cutoff, output_field=DateTimeField()))
+    return Least(days * Value(late_fee_rate(), output_field=money), Value(late_fee_cap(), output_field=money),
+                 output_field=money)
+
+def accrue_fees(day=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    # Bring the fees of every open loan up to date as of the start of day
+    # (today by default). Returns (loans charged, amount added to debts).
+    # progress, if given, is called with the running totals after each chunk
+    from .search_cache import invalidate
+    from .stats import adjust
+    cutoff = timezone.make_aware(datetime.combine(day or timezone.localdate(), time.min))
+    target = fee_due(cutoff)
+    charged, amount, last_id = 0, Decimal(0), 0
+    overdue = Loan.objects.open().filter(due_at__lt=cutoff, fee_accrued__lt=target)
+    # Per member, without the chunk's range so it is an index lookup by member
+    owed = (overdue.filter(member_id=OuterRef('pk')).order_by().values('member_id')
+            .annotate(owed=Sum(target - F('fee_accrued'))).values('owed'))
+    while True:
+        ids = list(Member.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            break
+        behind = overdue.filter(member_id__gt=last_id, member_id__lte=ids[-1])
+        # Every member of the chunk, the ones with nothing overdue add 0.
+        # Narrowing them down would take another pass over the loans
+        members = Member.objects.filter(pk__gt=last_id, pk__lte=ids[-1])
+        with transaction.atomic():
+            # Members before loans, the lock order of Transaction.save. Once
+            # the loans are locked a return can no longer close one of them
+            # between charging the member and recording the fee
+            debts = sum(members.select_for_update().values_list('outstanding_debt', flat=True))
+            if connection.features.has_select_for_update:
+                list(behind.select_for_update().values_list('pk'))
+            members.update(outstanding_debt=F('outstanding_debt') + Coalesce(Subquery(owed), Value(Decimal(0))))
+            # The amount charged is what the locked members' debts grew by,
+            # rather than another pass over the loans to add it up
+            added = members.aggregate(debt=Sum('outstanding_debt'))['debt'] - debts
+            charged += behind.update(fee_accrued=target)
+            adjust({'outstanding_debt': added})
+            amount += added
+        last_id = ids[-1]
+        if progress:
+            progress(charged, amount)
+    if charged:
+        # update() sends no signals
+        invalidate(Member)
+    return charged, amount
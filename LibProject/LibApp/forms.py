@@ -1,7 +1,34 @@
 from django import forms
-from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.forms import PasswordResetForm, UserCreationForm
 from django.contrib.auth.models import User
+from django.template import loader
+from django.urls import reverse
 from . models import Purchases, Book, Member, Transaction
+from .isbn import book_key
+from .tasks import enqueue
+
+class LookupSelect(forms.Select):
+    # A select holding only the chosen option, other options are fetched from
+    # the lookup endpoint as the user types instead of rendering the whole table
+    template_name = 'widgets/lookup_select.html'
+
+    def __init__(self, kind, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+
+    def optgroups(self, name, value, attrs=None):
+        # Ignore values that can't be a key, the field reports them as invalid
+        selected = [v for v in value if str(v).isdigit()]
+        queryset = self.choices.queryset.filter(pk__in=selected) if selected else []
+        options = [self.create_option(name, '', self.choices.field.empty_label or '', not selected, 0)]
+        for index, instance in enumerate(queryset, start=1):
+            options.append(self.create_option(name, instance.pk, self.choices.field.label_from_instance(instance), True, index))
+        return [(None, options, 0)]
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['lookup_url'] = f"{reverse('lookup')}?kind={self.kind}"
+        return context
 
 class SignupForm(UserCreationForm):
     email = forms.EmailField()
@@ -10,22 +37,59 @@ class SignupForm(UserCreationForm):
         model = User
         fields = ['username', 'email', 'password1', 'password2']
 
+def check_not_purging(model, field, value, key=None):
+    # The unique checks of a model form go through the default manager, which
+    # leaves out soft-deleted rows; their values stay taken until the purge.
+    # key is the filter finding the row, the field's value by default
+    if model.all_objects.filter(**(key or {field: value}), deleted_at__isnull=False).exists():
+        raise forms.ValidationError(f'This {field} belongs to a deleted {model._meta.model_name} that is still being purged.')
+    return value
+
 class PurchasesForm(forms.ModelForm):
     class Meta:
         model = Purchases
         fields = ['title', 'author', 'isbn', 'quantity_purchased']
 
+    def clean_isbn(self):
+        isbn = self.cleaned_data['isbn']
+        return check_not_purging(Book, 'isbn', isbn, book_key(isbn))
+
 class BooksForm(forms.ModelForm):
     class Meta:
         model = Book
         fields = ['title', 'author', 'isbn', 'quantity_available', 'quantity_total']
 
+    def clean_isbn(self):
+        isbn = self.cleaned_data['isbn']
+        # The same ISBN in another form is the same book
+        if Book.objects.filter(**book_key(isbn)).exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError('A book with this ISBN already exists.')
+        return check_not_purging(Book, 'isbn', isbn, book_key(isbn))
+
 class MembersForm(forms.ModelForm):
     class Meta:
         model = Member
         fields = ['name', 'email', 'member_id']
 
+    def clean_member_id(self):
+        return check_not_purging(Member, 'member_id', self.cleaned_data['member_id'])
+
 class TransactionsForm(forms.ModelForm):
     class Meta:
         model = Transaction
-        fields = ['book', 'member', 'transaction_type', 'fee_charged', 'amount_paid']
\ No newline at end of file
+        fields = ['book', 'member', 'transaction_type', 'fee_charged', 'amount_paid']
+        widgets = {
+            'book': LookupSelect('book'),
+            'member': LookupSelect('member'),
+        }
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    # Renders the reset mail in the request and leaves sending it to the task
+    # worker, a slow mail server no longer holds up the page
+    def send_mail(self, subject_template_name, email_template_name, context, from_email, to_email,
+                  html_email_template_name=None):
+        subject = ''.join(loader.render_to_string(subject_template_name, context).splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html = loader.render_to_string(html_email_template_name, context) if html_email_template_name else None
+        enqueue('send_email', subject, body, from_email, [to_email], html)
@@ -0,0 +1,179 @@
+import csv
+import json
+import time
+from collections import defaultdict
+from itertools import islice
+from django.db import transaction
+from django.db.models import F, Q
+from .autocomplete import update_entry
+from .isbn import normalize_isbn
+from .models import Book, Purchases
+from .search_cache import invalidate
+from .stats import adjust
+
+# Bulk stock intake from supplier manifests. Rows are streamed from a CSV or
+# NDJSON file and applied in chunks: one query resolves the chunk's ISBNs, new
+# books and purchase records are bulk inserted and existing ones get their
+# quantities added by a few set-based UPDATE statements.
+
+MAX_REPORTED_REJECTS = 1000
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.books_created = 0
+        self.books_updated = 0
+        self.rejected = []
+        self.rejected_count = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0
+
+    def reject(self, line, error):
+        self.rejected_count += 1
+        if len(self.rejected) < MAX_REPORTED_REJECTS:
+            self.rejected.append({'line': line, 'error': error})
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'books_created': self.books_created,
+            'books_updated': self.books_updated,
+            'rejected_count': self.rejected_count,
+            'rejected': self.rejected,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+def read_csv(stream):
+    # Yields (line number, row) with a header line naming the columns
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+def read_ndjson(stream):
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+def clean_row(row):
+    # Same limits as the Purchases and Book columns, raises ValueError
+    if row is None:
+        raise ValueError('Malformed line')
+    cleaned = {}
+    for field in ('title', 'author', 'isbn'):
+        value = str(row.get(field) or '').strip()
+        max_length = Purchases._meta.get_field(field).max_length
+        if not value:
+            raise ValueError(f'Missing {field}')
+        if len(value) > max_length:
+            raise ValueError(f'{field} is longer than {max_length} characters')
+        cleaned[field] = value
+    try:
+        quantity = int(row.get('quantity_purchased'))
+    except (TypeError, ValueError):
+        raise ValueError('quantity_purchased must be a whole number')
+    if quantity <= 0:
+        raise ValueError('quantity_purchased must be positive')
+    cleaned['quantity_purchased'] = quantity
+    return cleaned
+
+def add_quantities(model, ids_by_key, quantities, fields):
+    # Add each row's quantity to the counters with one UPDATE per distinct
+    # quantity, manifests repeat the same few quantities over many rows
+    ids_by_quantity = defaultdict(list)
+    for key, quantity in quantities.items():
+        ids_by_quantity[quantity].append(ids_by_key[key])
+    for quantity, ids in ids_by_quantity.items():
+        model.objects.filter(pk__in=ids).update(**{field: F(field) + quantity for field in fields})
+
+def apply_chunk(rows, report):
+    # rows are (line number, cleaned row). Merge repeated ISBNs within the
+    # chunk, whatever form they are written in, first title and author win.
+    # Books are keyed by their ISBN-13, or as written when it is no valid ISBN
+    manifest = {}
+    keys = [normalize_isbn(row['isbn']) or row['isbn'] for _, row in rows]
+    for key, (_, row) in zip(keys, rows):
+        entry = manifest.setdefault(key, dict(row, quantity_purchased=0))
+        entry['quantity_purchased'] += row['quantity_purchased']
+
+    with transaction.atomic():
+        # Deleted books keep their ISBN until they are purged, their rows are rejected
+        books = list(Book.all_objects.filter(Q(isbn13__in=manifest) | Q(isbn__in=manifest))
+                     .values_list('isbn13', 'isbn', 'pk', 'deleted_at'))
+        book_ids = {isbn13 or isbn: pk for isbn13, isbn, pk, deleted_at in books if deleted_at is None}
+        deleted = {isbn13 or isbn for isbn13, isbn, _, deleted_at in books if deleted_at is not None}
+        for key, (line_number, row) in zip(keys, rows):
+            if key in deleted:
+                report.reject(line_number, 'ISBN belongs to a deleted book that is still being purged')
+        for isbn in deleted:
+            del manifest[isbn]
+        quantities = {isbn: entry['quantity_purchased'] for isbn, entry in manifest.items()}
+
+        new_books = [Book(title=entry['title'], author=entry['author'], isbn=entry['isbn'], isbn13=normalize_isbn(key),
+                          quantity_available=entry['quantity_purchased'], quantity_total=entry['quantity_purchased'])
+                     for key, entry in manifest.items() if key not in book_ids]
+        Book.objects.bulk_create(new_books)
+        existing = {key: quantity for key, quantity in quantities.items() if key in book_ids}
+        if existing:
+            add_quantities(Book, book_ids, existing, ('quantity_available', 'quantity_total'))
+        # Neither path goes through Book.save, move the dashboard counter and
+        # invalidate the cached searches here
+        adjust({'copies_available': sum(quantities.values())})
+        invalidate(Book)
+
+        # Purchases keep one ledger row per ISBN as first written, as
+        # Purchases.save does
+        ledger = {entry['isbn']: key for key, entry in manifest.items()}
+        purchase_ids = dict(Purchases.objects.filter(isbn__in=ledger).values_list('isbn', 'pk'))
+        Purchases.objects.bulk_create([Purchases(title=entry['title'], author=entry['author'], isbn=entry['isbn'],
+                                                 quantity_purchased=entry['quantity_purchased'])
+                                       for entry in manifest.values() if entry['isbn'] not in purchase_ids])
+        if purchase_ids:
+            add_quantities(Purchases, purchase_ids, {isbn: quantities[ledger[isbn]] for isbn in purchase_ids},
+                           ('quantity_purchased',))
+
+        if new_books:
+            # bulk_create sends no post_save, refresh the autocomplete indexes here
+            created = list(Book.objects.filter(isbn__in=[book.isbn for book in new_books]).only('pk', 'title', 'author'))
+            transaction.on_commit(lambda: index_books(created))
+
+    report.imported += sum(1 for key in keys if key not in deleted)
+    report.books_created += len(new_books)
+    report.books_updated += len(existing)
+
+def index_books(books):
+    for book in books:
+        update_entry(Book, book)
+
+def import_manifest(stream, file_format='csv', chunk_size=1000):
+    # Import a text stream and return the ImportReport
+    report = ImportReport()
+    rows = READERS[file_format](stream)
+    while True:
+        batch = list(islice(rows, chunk_size))
+        if not batch:
+            break
+        chunk = []
+        for line_number, row in batch:
+            report.rows += 1
+            try:
+                chunk.append((line_number, clean_row(row)))
+            except ValueError as e:
+                report.reject(line_number, str(e))
+        if chunk:
+            apply_chunk(chunk, report)
+    report.elapsed = time.perf_counter() - report.started
+    return report
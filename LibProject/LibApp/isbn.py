@@ -0,0 +1,150 @@
+import re
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from .models import Book
+
+# ISBNs are stored as entered, with or without hyphens and spaces and in either
+# the 10 or the 13 digit form. Book.isbn13 holds the same number as a bare
+# ISBN-13, filled in by Book.save and for older rows by migration 0011 (or
+# backfill_isbn13), and every ISBN match goes through its unique index: a full
+# ISBN in any form is an exact lookup, a partial one a range scan over the
+# ISBN-13 prefix. Books whose stored ISBN is no valid ISBN have no ISBN-13; a
+# query that can't be part of a valid ISBN matches the stored ISBN by prefix,
+# through its case-insensitive index.
+
+SEPARATORS = re.compile(r'[\s-]')
+# A scanned EAN-13 can carry a 2 or 5 digit add-on, usually the price
+ADDON_LENGTHS = (15, 18)
+# Books a partial ISBN is resolved to before searching their history
+MAX_RESOLVED_BOOKS = 500
+
+UPDATE_SQL = 'UPDATE {book} SET isbn13 = %s WHERE id = %s'
+
+def isbn13_check_digit(digits):
+    return str((10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10)
+
+def isbn10_check_digit(digits):
+    check = (11 - sum(int(d) * (10 - i) for i, d in enumerate(digits)) % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+def normalize_isbn(value):
+    # The bare ISBN-13 of an ISBN-10, an ISBN-13 or a barcode scan, or None
+    # when the value is not a valid ISBN
+    code = SEPARATORS.sub('', value or '').upper()
+    if len(code) == 10 and code[:9].isdigit() and code[9] == isbn10_check_digit(code[:9]):
+        digits = '978' + code[:9]
+        return digits + isbn13_check_digit(digits)
+    if not code.isdigit() or not code.startswith(('978', '979')):
+        return None
+    if len(code) in ADDON_LENGTHS:
+        code = code[:13]
+    if len(code) == 13 and code[12] == isbn13_check_digit(code[:12]):
+        return code
+    return None
+
+def isbn_prefix(query):
+    # The ISBN-13 prefix of a partly typed ISBN, or None when it can't be one.
+    # Digits that could still be the start of 978 or 979 are taken as an
+    # ISBN-13, anything else as the start of an ISBN-10
+    code = SEPARATORS.sub('', query)
+    if not code.isdigit() or len(code) >= 13:
+        # Full length codes are whole ISBNs, valid ones were matched already
+        return None if code else ''
+    if code.startswith(('978', '979')) or '978'.startswith(code) or '979'.startswith(code):
+        return code
+    return '978' + code if len(code) < 10 else None
+
+def isbn_lookup(field, query):
+    # Filter arguments matching books by a full or partial ISBN in any form,
+    # against field (isbn13 or a path to it). None when the query can't be part
+    # of a valid ISBN, empty when it is empty
+    isbn13 = normalize_isbn(query)
+    if isbn13:
+        return {field: isbn13}
+    prefix = isbn_prefix(query)
+    if prefix is None:
+        return None
+    # A range rather than LIKE so every backend can use the index
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix + '\uffff'} if prefix else {}
+
+def stored_isbn_lookup(field, query):
+    # Filter arguments matching the stored ISBNs, against field (isbn or a path
+    # to it), for the queries isbn_lookup has none for
+    return {f'{field}__istartswith': query.strip()}
+
+async def ahistory_isbn_lookup(query):
+    # isbn_lookup for transactions and other rows of books, through the async
+    # ORM. A partial ISBN is resolved to its books first, while they are few:
+    # their rows come from the book index and only those are sorted. A prefix
+    # matching a large part of the catalog is left to the join, where walking
+    # the rows in id order reaches a page of matches soonest, which a LIKE
+    # match lets the database do rather than sort every matching row
+    match = isbn_lookup('isbn13', query)
+    if match is None:
+        # Stored ISBNs that are no valid ISBN are rare, their books are picked
+        # by a subquery of the same statement
+        return {'book_id__in': Book.all_objects.filter(**stored_isbn_lookup('isbn', query)).values('pk')}
+    if not match or 'isbn13' in match:
+        return isbn_lookup('book__isbn13', query)
+    book_ids = [pk async for pk in Book.objects.filter(**match).values_list('pk', flat=True)[:MAX_RESOLVED_BOOKS + 1]]
+    if len(book_ids) <= MAX_RESOLVED_BOOKS:
+        return {'book_id__in': book_ids}
+    return {'book__isbn13__startswith': isbn_prefix(query)}
+
+def book_key(isbn):
+    # Filter arguments finding the book of an ISBN as entered. Values that are
+    # not a valid ISBN can only match as they were stored, and so do valid ones
+    # no book has the ISBN-13 of: a book left without one, a duplicate the
+    # backfill could not fill in
+    isbn13 = normalize_isbn(isbn)
+    if isbn13 and Book.all_objects.filter(isbn13=isbn13).exists():
+        return {'isbn13': isbn13}
+    return {'isbn': isbn}
+
+def backfill_isbn13(chunk_size=5000, progress=None):
+    # Fill in isbn13 for the books saved without it, a range of ids per
+    # database transaction. Returns (books updated, conflicts): a conflict is a
+    # (pk, isbn) whose ISBN-13 another book already has, left empty to be
+    # merged by hand. progress, if given, is called with the last id done
+    from .search_cache import invalidate
+    updated, conflicts = fill_isbn13(Book.all_objects.all(), DEFAULT_DB_ALIAS, chunk_size, progress)
+    if updated:
+        invalidate(Book)
+    return updated, conflicts
+
+def fill_isbn13(books, using, chunk_size=5000, progress=None):
+    # backfill_isbn13 over a queryset of every book, in the database using.
+    # Migration 0011 has a frozen copy of this and of normalize_isbn
+    books = books.using(using)
+    connection = connections[using]
+    updated, conflicts, last_id = 0, [], 0
+    while True:
+        # Ranges of the primary key: filtering on the empty isbn13 instead would
+        # have the database walk the isbn13 index and sort every chunk
+        chunk = list(books.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'isbn', 'isbn13')[:chunk_size])
+        if not chunk:
+            break
+        rows = [(pk, isbn) for pk, isbn, isbn13 in chunk if isbn13 is None]
+        normalized = {pk: normalize_isbn(isbn) for pk, isbn in rows}
+        with transaction.atomic(using=connection.alias):
+            taken = set(books.filter(isbn13__in=[value for value in normalized.values() if value])
+                        .values_list('isbn13', flat=True))
+            changed = []
+            for pk, isbn in rows:
+                value = normalized[pk]
+                if value is None:
+                    continue
+                if value in taken:
+                    conflicts.append((pk, isbn))
+                    continue
+                taken.add(value)
+                changed.append((value, pk))
+            # One prepared UPDATE by primary key per book. bulk_update would
+            # send a CASE over the whole batch that is evaluated for every row.
+            # No signals either way, nothing but the ISBN search reads the column
+            with connection.cursor() as cursor:
+                cursor.executemany(UPDATE_SQL.format(book=connection.ops.quote_name(books.model._meta.db_table)), changed)
+        updated += len(changed)
+        last_id = chunk[-1][0]
+        if progress:
+            progress(last_id)
+    return updated, conflicts
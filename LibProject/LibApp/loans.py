@@ -0,0 +1,104 @@
+from collections import defaultdict
+from django.db import connection, transaction
+from django.db.models import F, Max
+from .models import ArchivedTransaction, Book, Loan, Transaction, loan_period
+
+# Loans rebuilt from the transaction history. A member's issues and returns of
+# one book are paired first in, first out, as Transaction.save pairs them: a
+# return closes the oldest issue still open at its date and a return with
+# nothing open closes nothing. The pairing is one INSERT ... SELECT per range
+# of book ids. A running sum over the range's transactions, +1 for an issue and
+# -1 for a return, counts the member's copies on loan but falls below zero on
+# returns with nothing open: a return taking the sum to a new low under zero is
+# such a return and is dropped. Numbering the remaining issues and returns of a
+# book with ROW_NUMBER() then pairs the n-th issue with the n-th return, which
+# is never dated before it, and grouping by that number puts them in one row.
+# No join, and no rows travel through Python. The archived history is numbered
+# with the live one: an issue may have been archived while its return was not.
+# Window functions need SQLite 3.25 or MySQL 8. Date arithmetic is written
+# differently by every database, so due dates start as the issue date and are
+# moved on by the loan period with an ORM update. Late fees already charged to
+# a member stay on the rebuilt loan with the same book, member and issue date,
+# so accrue_fees does not charge them again.
+
+DEFAULT_CHUNK_SIZE = 5000
+
+PAIR_SQL = '''
+INSERT INTO {loan} (book_id, member_id, issued_at, due_at, returned_at, fee_accrued)
+SELECT book_id, member_id,
+       MAX(CASE WHEN transaction_type = 'issue' THEN transaction_date END),
+       MAX(CASE WHEN transaction_type = 'issue' THEN transaction_date END),
+       MAX(CASE WHEN transaction_type = 'return' THEN transaction_date END),
+       0
+FROM (
+    SELECT book_id, member_id, transaction_type, transaction_date,
+           ROW_NUMBER() OVER (PARTITION BY book_id, member_id, transaction_type ORDER BY transaction_date, id) AS n
+    FROM (
+        SELECT id, book_id, member_id, transaction_type, transaction_date, on_loan,
+               MIN(on_loan) OVER (PARTITION BY book_id, member_id ORDER BY transaction_date, id
+                                  ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS low
+        FROM (
+            SELECT id, book_id, member_id, transaction_type, transaction_date,
+                   SUM(CASE WHEN transaction_type = 'issue' THEN 1 ELSE -1 END)
+                       OVER (PARTITION BY book_id, member_id ORDER BY transaction_date, id
+                             ROWS UNBOUNDED PRECEDING) AS on_loan
+            FROM (
+                SELECT id, book_id, member_id, transaction_type, transaction_date
+                FROM {transaction} WHERE book_id >= %s AND book_id < %s
+                UNION ALL
+                SELECT id, book_id, member_id, transaction_type, transaction_date
+                FROM {archive} WHERE book_id >= %s AND book_id < %s
+            ) history
+        ) summed
+    ) balanced
+    WHERE on_loan >= 0 OR on_loan >= low
+) numbered
+GROUP BY book_id, member_id, n
+HAVING MAX(CASE WHEN transaction_type = 'issue' THEN transaction_date END) IS NOT NULL
+'''
+
+def backfill_loans(chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    # Replace the loans of every book, chunk_size books per database
+    # transaction. Returns the number of loans written. progress, if given, is
+    # called with the last book id done
+    quote = connection.ops.quote_name
+    sql = PAIR_SQL.format(loan=quote(Loan._meta.db_table), transaction=quote(Transaction._meta.db_table),
+                          archive=quote(ArchivedTransaction._meta.db_table))
+    last_id = Book.objects.aggregate(last=Max('pk'))['last'] or 0
+    written = 0
+    for start in range(1, last_id + 1, chunk_size):
+        end = start + chunk_size
+        loans = Loan.objects.filter(book_id__gte=start, book_id__lt=end)
+        with transaction.atomic():
+            fees = charged_fees(loans)
+            loans.delete()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [start, end, start, end])
+                written += cursor.rowcount
+            loans.update(due_at=F('due_at') + loan_period())
+            restore_fees(loans, fees)
+        if progress:
+            progress(min(end - 1, last_id))
+    return written
+
+def charged_fees(loans):
+    # The fees charged on the loans, {(book, member, issued at): [fees]}. Only
+    # overdue loans have any, few of the chunk's
+    fees = defaultdict(list)
+    for book_id, member_id, issued_at, fee in (loans.filter(fee_accrued__gt=0).order_by('pk')
+                                               .values_list('book_id', 'member_id', 'issued_at', 'fee_accrued')):
+        fees[book_id, member_id, issued_at].append(fee)
+    return fees
+
+def restore_fees(loans, fees):
+    # Put the charged fees back on the rebuilt loans of the same issue
+    if not fees:
+        return
+    rebuilt = []
+    for loan in loans.filter(issued_at__in={issued_at for _, _, issued_at in fees}).order_by('pk').only(
+            'book_id', 'member_id', 'issued_at'):
+        charged = fees.get((loan.book_id, loan.member_id, loan.issued_at))
+        if charged:
+            loan.fee_accrued = charged.pop(0)
+            rebuilt.append(loan)
+    Loan.objects.bulk_update(rebuilt, ['fee_accrued'], batch_size=1000)
@@ -0,0 +1,55 @@
+import re
+from .autocomplete import aget_index
+from .isbn import isbn_lookup, stored_isbn_lookup
+from .models import Book, Member
+from .search import asearch_books
+
+# Remote lookups behind the book and member pickers of the transaction forms.
+# Every lookup is answered from an index: ISBN-13 and member_id prefixes are range
+# scans on their unique indexes, book titles go through the full-text index and
+# member names through the in-memory autocomplete index. The lookups serve an
+# async view and read through the async ORM.
+
+MAX_LOOKUP_RESULTS = 20
+ISBN_QUERY = re.compile(r'^[\d\s-]+[xX]?$')
+
+def prefix_range(field, prefix):
+    # A range rather than LIKE so every backend can use the column's index
+    return {f'{field}__gte': prefix, f'{field}__lt': prefix + '\uffff'}
+
+async def lookup_books(query, limit):
+    if ISBN_QUERY.match(query):
+        match = isbn_lookup('isbn13', query)
+        if match is None:
+            books = Book.objects.filter(**stored_isbn_lookup('isbn', query)).order_by('pk')
+        else:
+            books = Book.objects.filter(**match).order_by('isbn13')
+        return [book async for book in books[:limit]]
+    books, _ = await asearch_books('title', query, None, limit)
+    return books
+
+async def lookup_members(query, limit):
+    members = [member async for member in
+               Member.objects.filter(**prefix_range('member_id', query)).order_by('member_id')[:limit]]
+    if len(members) < limit:
+        found = {member.pk for member in members}
+        index = await aget_index('member_name')
+        # One entry per member, namesakes included
+        ids = [suggestion['id'] for suggestion in index.query(query, limit=limit, distinct=False)
+               if suggestion['id'] not in found]
+        by_id = await Member.objects.ain_bulk(ids[:limit - len(members)])
+        members += [by_id[pk] for pk in ids if pk in by_id]
+    return members
+
+LOOKUPS = {
+    'book': lookup_books,
+    'member': lookup_members,
+}
+
+async def lookup(kind, query, limit=10):
+    # Raises KeyError for an unknown kind
+    query = query.strip()
+    if not query:
+        return []
+    return [{'id': instance.pk, 'label': str(instance)}
+            for instance in await LOOKUPS[kind](query, min(limit, MAX_LOOKUP_RESULTS))]
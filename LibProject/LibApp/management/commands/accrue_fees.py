@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from LibApp.fees import DEFAULT_CHUNK_SIZE, accrue_fees
+
+class Command(BaseCommand):
+    help = ('Charge late fees on overdue open loans, run nightly (e.g. from cron). Safe to run again: '
+            'a loan is only ever charged up to its fee for the day')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to accrue fees as of, YYYY-MM-DD, today by default')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Members per database transaction')
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = parse_date(options['date'])
+            except ValueError:
+                pass
+            if day is None:
+                raise CommandError('--date must be a date as YYYY-MM-DD.')
+        started = time.perf_counter()
+        def progress(charged, amount):
+            self.stdout.write(f'\rloans charged: {charged}', ending='')
+            self.stdout.flush()
+        charged, amount = accrue_fees(day, options['chunk_size'], progress)
+        self.stdout.write(f'\n{charged} loans charged {amount:.2f} in {time.perf_counter() - started:.1f} s')
@@ -0,0 +1,34 @@
+import time
+from datetime import datetime, time as day_start
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from LibApp.archive import DEFAULT_BATCH_SIZE, archive_horizon, archive_transactions
+
+class Command(BaseCommand):
+    help = ('Move transactions older than ARCHIVE_AFTER_DAYS (or --before a date) to the archive table, '
+            'in short batches. Run it periodically, e.g. weekly from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive transactions dated before this day, YYYY-MM-DD')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Transaction ids per batch')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        before = archive_horizon()
+        if options['before']:
+            try:
+                day = parse_date(options['before'])
+            except ValueError:
+                day = None
+            if day is None:
+                raise CommandError('--before must be a date as YYYY-MM-DD.')
+            before = timezone.make_aware(datetime.combine(day, day_start.min))
+
+        started = time.perf_counter()
+        def progress(moved):
+            self.stdout.write(f'\rtransactions archived: {moved}', ending='')
+            self.stdout.flush()
+        moved = archive_transactions(before, options['batch_size'], options['sleep'], progress)
+        self.stdout.write(f'\n{moved} transactions dated before {before:%Y-%m-%d} archived '
+                          f'in {time.perf_counter() - started:.1f} s')
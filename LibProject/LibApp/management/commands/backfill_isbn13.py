@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from LibApp.isbn import backfill_isbn13
+
+class Command(BaseCommand):
+    help = ('Fill in the normalized ISBN-13 of the books saved before it existed. Safe to run again, '
+            'only books without one are read')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Books per database transaction')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        def progress(book_id):
+            self.stdout.write(f'\rbooks: {book_id}', ending='')
+            self.stdout.flush()
+        updated, conflicts = backfill_isbn13(options['chunk_size'], progress)
+        self.stdout.write(f'\n{updated} books updated in {time.perf_counter() - started:.1f} s')
+        for pk, isbn in conflicts:
+            # Left without an ISBN-13 until the duplicates are merged
+            self.stderr.write(f'book {pk}: {isbn} is the ISBN of another book')
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from LibApp.loans import DEFAULT_CHUNK_SIZE, backfill_loans
+from LibApp.models import Loan
+
+class Command(BaseCommand):
+    help = ('Rebuild the loans from the issue and return transactions, archived ones included, pairing each '
+            'member\'s issues and returns of a book in order. Safe to run again, every chunk of books replaces '
+            'its loans and keeps the late fees already charged')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Books per database transaction')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        def progress(book_id):
+            self.stdout.write(f'\rbooks: {book_id}', ending='')
+            self.stdout.flush()
+        written = backfill_loans(options['chunk_size'], progress)
+        self.stdout.write(f'\n{written} loans, {Loan.objects.open().count()} open, '
+                          f'in {time.perf_counter() - started:.1f} s')
@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from LibApp.phonetic import backfill_name_keys
+
+class Command(BaseCommand):
+    help = ('Fill in the phonetic name key and words of the members saved before they existed, or whose name was changed '
+            'by a bulk update. Safe to run again, only stale keys are written')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Members per database transaction')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        def progress(member_id):
+            self.stdout.write(f'\rmembers: {member_id}', ending='')
+            self.stdout.flush()
+        updated = backfill_name_keys(options['chunk_size'], progress)
+        self.stdout.write(f'\n{updated} members updated in {time.perf_counter() - started:.1f} s')
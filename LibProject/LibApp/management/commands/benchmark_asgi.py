@@ -0,0 +1,176 @@
+import asyncio
+import io
+import json
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+from LibApp.autocomplete import build_indexes
+from LibApp.models import Book, Member, Transaction
+from .benchmark_book_search import WORDS, SURNAMES
+from .benchmark_endpoints import percentile
+
+# Cache backend that stores nothing, so every search reaches the database
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'benchmark': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare the throughput of one worker process serving the read endpoints through the WSGI '
+            'handler (one request at a time, or a thread per request) and through the ASGI handler with '
+            'many requests in flight. --db-latency-ms adds a network round trip to every query, as a '
+            'database server would, which a local SQLite file does not have')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight, and WSGI threads')
+        parser.add_argument('--db-latency-ms', type=float, default=2.0)
+        parser.add_argument('--cache', action='store_true', help='Keep the search result cache on')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help='Write the results to this file')
+
+    def handle(self, *args, **options):
+        if not Book.objects.exists() or not Member.objects.exists() or not Transaction.objects.exists():
+            raise CommandError('The database needs books, members and transactions, see generate_data')
+        build_indexes()
+        # POSTs carry a CSRF cookie and the matching header, as the pages send
+        self.csrf_token = get_random_string(32)
+        requests = self.make_requests(random.Random(options['seed']), options['requests'])
+        concurrency = options['concurrency']
+
+        latency = options['db_latency_ms'] / 1000
+        def round_trip(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+        def add_latency(connection, **kwargs):
+            # First in the list, inside the request metrics' query timer, so
+            # the database time they record includes the round trip
+            if round_trip not in connection.execute_wrappers:
+                connection.execute_wrappers.insert(0, round_trip)
+        if latency:
+            # Every thread opens its own connection, the wrapper goes on each
+            connection_created.connect(add_latency)
+            for connection in connections.all():
+                add_latency(connection)
+        # The main thread's connection is not used by the handlers
+        connections.close_all()
+
+        caches = {} if options['cache'] else {'CACHES': NO_CACHE, 'SEARCH_CACHE_ALIAS': 'benchmark'}
+        results = {}
+        try:
+            # The endpoints are measured, not the rate limiter
+            with override_settings(RATE_LIMITS={}, **caches):
+                wsgi, asgi = WSGIHandler(), ASGIHandler()
+                self.run('wsgi, sync worker', results, lambda: self.run_wsgi(wsgi, requests, 1))
+                self.run(f'wsgi, {concurrency} threads', results, lambda: self.run_wsgi(wsgi, requests, concurrency))
+                self.run(f'asgi, {concurrency} in flight', results, lambda: asyncio.run(self.run_asgi(asgi, requests, concurrency)))
+        finally:
+            connection_created.disconnect(add_latency)
+
+        baseline = results['wsgi, sync worker']['rps']
+        self.stdout.write(f"\nASGI throughput is {results[f'asgi, {concurrency} in flight']['rps'] / baseline:.1f}x "
+                          f"the sync WSGI worker's and {results[f'asgi, {concurrency} in flight']['rps'] / results[f'wsgi, {concurrency} threads']['rps']:.1f}x "
+                          f"the threaded one's")
+        if options['json_path']:
+            with open(options['json_path'], 'w') as output:
+                json.dump({'options': {key: options[key] for key in ('requests', 'concurrency', 'db_latency_ms', 'cache')},
+                           'results': results}, output, indent=2)
+
+    def run(self, label, results, serve):
+        started = time.perf_counter()
+        timings, status = serve()
+        elapsed = time.perf_counter() - started
+        ordered = sorted(timings)
+        results[label] = result = {
+            'rps': len(timings) / elapsed,
+            'p50_ms': percentile(ordered, 50) * 1000,
+            'p99_ms': percentile(ordered, 99) * 1000,
+            'status': {str(code): n for code, n in sorted(status.items())},
+        }
+        self.stdout.write(f"{label:<24} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:8.2f}  "
+                          f"p99 {result['p99_ms']:8.2f} ms  {result['status']}")
+
+    def make_requests(self, rng, count):
+        # A mix of the async read endpoints: (method, path, query string, JSON body)
+        book_isbns = list(Book.objects.order_by('?').values_list('isbn', flat=True)[:200])
+        member_ids = list(Member.objects.order_by('?').values_list('member_id', flat=True)[:200])
+        makers = [
+            lambda: ('POST', reverse('search_for_book'), '', {'q': rng.choice(WORDS)[:5], 'field': 'title'}),
+            lambda: ('POST', reverse('search_for_book'), '', {'q': rng.choice(book_isbns)[:rng.randint(6, 13)], 'field': 'isbn'}),
+            lambda: ('POST', reverse('search_for_member'), '', {'q': rng.choice(SURNAMES)[:4], 'field': 'name'}),
+            lambda: ('POST', reverse('search_for_member'), '', {'q': rng.choice(member_ids), 'field': 'member_id'}),
+            lambda: ('POST', reverse('search_for_transaction'), '', {'q': rng.choice(member_ids), 'field': 'member'}),
+            lambda: ('GET', reverse('lookup'), urlencode({'kind': 'book', 'q': rng.choice(WORDS)[:4]}), None),
+            lambda: ('GET', reverse('lookup'), urlencode({'kind': 'member', 'q': rng.choice(SURNAMES)[:4]}), None),
+            lambda: ('GET', reverse('autocomplete'), urlencode({'kind': 'member_name', 'q': rng.choice(SURNAMES)[:3]}), None),
+        ]
+        return [rng.choice(makers)() for _ in range(count)]
+
+    def run_wsgi(self, handler, requests, threads):
+        csrf_token = self.csrf_token
+        def serve(request):
+            method, path, query, data = request
+            body = json.dumps(data).encode() if data is not None else b''
+            environ = {
+                'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': '127.0.0.1', 'SERVER_PORT': '8000', 'HTTP_HOST': '127.0.0.1',
+                'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+                'HTTP_COOKIE': f'csrftoken={csrf_token}', 'HTTP_X_CSRFTOKEN': csrf_token,
+                'wsgi.input': io.BytesIO(body), 'wsgi.url_scheme': 'http',
+            }
+            status = []
+            started = time.perf_counter()
+            response = handler(environ, lambda code, headers: status.append(int(code.split()[0])))
+            b''.join(response)
+            response.close()
+            return time.perf_counter() - started, status[0]
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            served = list(pool.map(serve, requests))
+        return [seconds for seconds, _ in served], Counter(code for _, code in served)
+
+    async def run_asgi(self, handler, requests, concurrency):
+        csrf_token = self.csrf_token
+        in_flight = asyncio.Semaphore(concurrency)
+
+        async def serve(request):
+            method, path, query, data = request
+            body = json.dumps(data).encode() if data is not None else b''
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method,
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 8000),
+                'headers': [(b'host', b'127.0.0.1'), (b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode()),
+                            (b'cookie', f'csrftoken={csrf_token}'.encode()), (b'x-csrftoken', csrf_token.encode())],
+            }
+            messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # The client stays connected until the response is sent
+                await asyncio.Future()
+            status = []
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            async with in_flight:
+                started = time.perf_counter()
+                await handler(scope, receive, send)
+                return time.perf_counter() - started, status[0]
+
+        served = await asyncio.gather(*(serve(request) for request in requests))
+        return [seconds for seconds, _ in served], Counter(code for _, code in served)
+
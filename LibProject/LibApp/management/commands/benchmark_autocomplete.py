@@ -0,0 +1,84 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from LibApp.autocomplete import AutocompleteIndex
+from .benchmark_book_search import WORDS, SURNAMES
+
+class Command(BaseCommand):
+    help = ('Measure autocomplete index build time, memory and lookup latency on generated entries, '
+            'for prefix lookups and typo-tolerant ones')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = list(WORDS) + [self.pseudo_word(rng) for _ in range(50000)]
+        surnames = list(SURNAMES) + [self.pseudo_word(rng).title() for _ in range(20000)]
+
+        # A title-like and a name-like column, the two shapes the live indexes hold
+        columns = {
+            'titles': lambda: ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(2, 5))).title(),
+            'names': lambda: f'{rng.choice(surnames)} {rng.choice(surnames)}',
+        }
+        for name, make_text in columns.items():
+            rows = [(entry_id, make_text()) for entry_id in range(1, options['entries'] + 1)]
+            index = AutocompleteIndex(name)
+            start = time.perf_counter()
+            index.load(rows)
+            build_seconds = time.perf_counter() - start
+
+            # Prefixes of one or two words taken from random entries
+            queries = []
+            for _ in range(options['queries']):
+                words = rows[rng.randrange(len(rows))][1].split()
+                picked = words[:rng.randint(1, 2)]
+                picked[-1] = picked[-1][:rng.randint(2, len(picked[-1]))]
+                queries.append(' '.join(picked))
+
+            # Whole words of random entries with a typo in one of them
+            typos = []
+            for _ in range(options['queries']):
+                words = rows[rng.randrange(len(rows))][1].lower().split()[:rng.randint(1, 2)]
+                n = rng.randrange(len(words))
+                words[n] = self.misspell(rng, words[n])
+                typos.append(' '.join(words))
+
+            stats = index.stats()
+            self.stdout.write(
+                f"{name:>7}: {stats['entries']} entries, {stats['words']} words, "
+                f"{stats['memory_bytes'] / 1024 / 1024:.1f} MiB, built in {build_seconds:.1f} s"
+            )
+            for label, lookup, texts in (('prefix', index.query, queries), ('fuzzy', index.fuzzy, typos)):
+                timings, found = [], 0
+                for text in texts:
+                    start = time.perf_counter()
+                    found += bool(lookup(text))
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                self.stdout.write(
+                    f"{label:>16}: p50 {self.percentile(timings, 50):.2f} ms  p95 {self.percentile(timings, 95):.2f} ms  "
+                    f"p99 {self.percentile(timings, 99):.2f} ms, {found / len(texts):.0%} found"
+                )
+
+    def pseudo_word(self, rng):
+        return ''.join(rng.choice('bdfgklmnprstvz') + rng.choice('aeiou') for _ in range(rng.randint(2, 4)))
+
+    def misspell(self, rng, word):
+        # One swap, substitution, deletion or insertion, in words long enough to tolerate it
+        if len(word) < 4:
+            return word
+        n = rng.randrange(1, len(word) - 1)
+        edit = rng.choice(('swap', 'substitute', 'delete', 'insert'))
+        if edit == 'swap':
+            return word[:n - 1] + word[n] + word[n - 1] + word[n + 1:]
+        if edit == 'substitute':
+            return word[:n] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[n + 1:]
+        if edit == 'delete':
+            return word[:n] + word[n + 1:]
+        return word[:n] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[n:]
+
+    def percentile(self, timings, pct):
+        return timings[min(len(timings) - 1, int(len(timings) * pct / 100))]
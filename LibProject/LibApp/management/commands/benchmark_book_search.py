@@ -0,0 +1,92 @@
+import itertools
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from LibApp.models import Book
+from LibApp.search import search_books
+
+WORDS = ('history', 'river', 'garden', 'shadow', 'empire', 'silent', 'winter', 'journey', 'stone', 'crown',
+         'ocean', 'secret', 'memory', 'fire', 'island', 'night', 'kingdom', 'letters', 'machine', 'origin',
+         'promise', 'storm', 'mountain', 'golden', 'broken', 'summer', 'wolves', 'glass', 'city', 'forest')
+SURNAMES = ('Harari', 'Darwin', 'Peterson', 'Brown', 'Marquez', 'Okafor', 'Tanaka', 'Novak', 'Silva', 'Kariuki',
+            'Larsen', 'Moreau', 'Ivanova', 'Mwangi', 'Chen', 'Haddad', 'Rossi', 'Kowalski', 'Otieno', 'Fischer')
+ISBN_PREFIX = 'BENCH'
+
+class Command(BaseCommand):
+    help = 'Compare full-text book search with the icontains scan on a generated catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated books afterwards')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rare_words = sorted({self.pseudo_word(rng) for _ in range(5000)})
+        self.generate(rng, options['books'], rare_words)
+
+        # Word prefixes as typed at the desk: words shared by a large share of
+        # the catalog, words carried by a few hundred books and misses
+        query_sets = {'common': [], 'rare': [], 'miss': []}
+        for _ in range(options['queries']):
+            field = rng.choice(('title', 'author'))
+            word = rng.choice(WORDS if field == 'title' else SURNAMES)
+            query_sets['common'].append((field, word[:rng.randint(4, 6)]))
+            query_sets['rare'].append(('title', rng.choice(rare_words)))
+            query_sets['miss'].append((field, 'zq' + self.pseudo_word(rng)))
+        page_size = options['page_size']
+
+        def icontains(field, query):
+            return list(Book.objects.filter(**{f'{field}__icontains': query}).order_by('pk')[:page_size])
+
+        def fulltext(field, query):
+            return search_books(field, query, None, page_size)[0]
+
+        try:
+            for (name, search), (kind, queries) in itertools.product(
+                    (('icontains', icontains), ('fulltext', fulltext)), query_sets.items()):
+                timings = self.run(search, queries)
+                self.stdout.write(
+                    f'{name:>10} {kind:>6}: mean {statistics.mean(timings):8.2f} ms  '
+                    f'p50 {self.percentile(timings, 50):8.2f} ms  p95 {self.percentile(timings, 95):8.2f} ms  '
+                    f'p99 {self.percentile(timings, 99):8.2f} ms'
+                )
+        finally:
+            if not options['keep']:
+                Book.objects.filter(isbn__startswith=ISBN_PREFIX).delete()
+
+    def pseudo_word(self, rng):
+        return ''.join(rng.choice('bdfgklmnprstvz') + rng.choice('aeiou') for _ in range(3))
+
+    def generate(self, rng, count, rare_words):
+        # Books are written in bulk batches. Titles combine a few common words
+        # with one word from a large vocabulary, authors come from a short list
+        existing = Book.objects.filter(isbn__startswith=ISBN_PREFIX).count()
+        batch = []
+        for n in range(existing, count):
+            words = rng.sample(WORDS, rng.randint(1, 3)) + [rng.choice(rare_words)]
+            title = ' '.join(words).title()
+            author = f'{rng.choice(SURNAMES)} {rng.choice(SURNAMES)}'
+            batch.append(Book(title=title, author=author, isbn=f'{ISBN_PREFIX}{n:012d}', quantity_available=1, quantity_total=1))
+            if len(batch) == 10000:
+                Book.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Book.objects.bulk_create(batch)
+        self.stdout.write(f'Catalog of {count} generated books on {connection.vendor}')
+
+    def run(self, search, queries):
+        timings = []
+        for field, query in queries:
+            start = time.perf_counter()
+            search(field, query)
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def percentile(self, timings, pct):
+        ordered = sorted(timings)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,57 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from LibApp.models import Book, Member, Transaction
+
+ISBN_PREFIX = 'CHECKOUT'
+
+class Command(BaseCommand):
+    help = 'Compare issuing and returning a stack of books one request at a time with one batch request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=50, help='Books in the stack, at most 100')
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST='127.0.0.1')
+        self.cleanup()
+        # Each round issues every book twice, once per path
+        copies = 2 * options['rounds']
+        books = [Book.objects.create(title=f'Checkout {n}', author='Checkout', isbn=f'{ISBN_PREFIX}{n:05d}',
+                                     quantity_available=copies, quantity_total=copies)
+                 for n in range(options['items'])]
+        member = Member.objects.create(name='Checkout Desk', email='checkout@example.com', member_id='CHECKOUT')
+
+        try:
+            for action in ('issue', 'return'):
+                sequential, batch = [], []
+                for _ in range(options['rounds']):
+                    # Alternate the two paths so neither always sees a warm cache
+                    start = time.perf_counter()
+                    for book in books:
+                        client.post(reverse('newtransaction'), {'book': book.pk, 'member': member.pk,
+                                                                 'transaction_type': action, 'fee_charged': '0',
+                                                                 'amount_paid': '0'})
+                    sequential.append(time.perf_counter() - start)
+
+                    items = [{'book': book.pk, 'action': action} for book in books]
+                    start = time.perf_counter()
+                    client.post(reverse('batch_checkout'), json.dumps({'member': member.pk, 'items': items}),
+                                content_type='application/json')
+                    batch.append(time.perf_counter() - start)
+
+                recorded = Transaction.objects.filter(member=member, transaction_type=action).count()
+                sequential_ms, batch_ms = min(sequential) * 1000, min(batch) * 1000
+                self.stdout.write(
+                    f'{action:>6} x{len(books)}: sequential {sequential_ms:.1f} ms, batch {batch_ms:.1f} ms '
+                    f'({sequential_ms / batch_ms:.1f}x), {recorded} transactions recorded'
+                )
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        Transaction.objects.filter(book__isbn__startswith=ISBN_PREFIX).delete()
+        Book.objects.filter(isbn__startswith=ISBN_PREFIX).delete()
+        Member.objects.filter(member_id='CHECKOUT').delete()
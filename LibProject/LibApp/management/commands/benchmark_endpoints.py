@@ -0,0 +1,196 @@
+import json
+import platform
+import random
+import time
+from collections import Counter
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from LibApp import urls
+from LibApp.metrics import QueryTimer
+from LibApp.models import Book, Member, Transaction
+from .benchmark_book_search import WORDS, SURNAMES
+
+BENCHMARK_USER = 'benchmark'
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = ('Drive every LibApp view against the current database and report throughput, latency '
+            'percentiles and query counts, optionally as JSON to compare runs. Requests that write '
+            'are rolled back, so the dataset is left as it was (see generate_data)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--only', nargs='*', help='Run only these URL names')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', dest='json_path', help='Write the results to this file')
+        parser.add_argument('--compare', help='A previous --json file to compare p50 and p99 with')
+
+    # The endpoints are measured, not the rate limiter
+    @override_settings(RATE_LIMITS={})
+    def handle(self, *args, **options):
+        if not Book.objects.exists() or not Member.objects.exists() or not Transaction.objects.exists():
+            raise CommandError('The database needs books, members and transactions, see generate_data')
+        self.rng = random.Random(options['seed'])
+        self.bounds = {model: (model.objects.order_by('pk').values_list('pk', flat=True).first(),
+                               model.objects.order_by('-pk').values_list('pk', flat=True).first())
+                       for model in (Book, Member, Transaction)}
+
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USER)
+        client = Client(HTTP_HOST='127.0.0.1')
+        client.force_login(user)
+
+        scenarios = self.scenarios()
+        missing = sorted({getattr(pattern, 'name', None) for pattern in urls.urlpatterns} - {None} - {s[0] for s in scenarios})
+        if missing:
+            self.stderr.write(f"No scenario for: {', '.join(missing)}")
+        if options['only']:
+            scenarios = [s for s in scenarios if s[0] in options['only']]
+
+        results = {}
+        for url_name, label, writes, make_request in scenarios:
+            key = f'{url_name}:{label}' if label else url_name
+            results[key] = self.run(client, writes, make_request, options['requests'], options['warmup'])
+            result = results[key]
+            self.stdout.write(
+                f"{key:<38} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.2f}  p95 {result['p95_ms']:7.2f}  "
+                f"p99 {result['p99_ms']:7.2f} ms  queries {result['queries_mean']:6.1f} (max {result['queries_max']})  "
+                f"{dict(result['status'])}"
+            )
+
+        report = {
+            'started': timezone.now().isoformat(),
+            'vendor': connection.vendor,
+            'python': platform.python_version(),
+            'dataset': {model.__name__: model.objects.count() for model in (Book, Member, Transaction)},
+            'requests_per_scenario': options['requests'],
+            'results': results,
+        }
+        if options['json_path']:
+            with open(options['json_path'], 'w') as output:
+                json.dump(report, output, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def run(self, client, writes, make_request, count, warmup):
+        timings, queries, status = [], [], Counter()
+        for n in range(warmup + count):
+            method, path, kwargs = make_request()
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer), transaction.atomic():
+                start = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - start
+                if writes:
+                    # Measure the write, then leave the data as it was
+                    transaction.set_rollback(True)
+            if n >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(timer.queries)
+                status[response.status_code] += 1
+        ordered = sorted(timings)
+        return {
+            'rps': count / (sum(timings) / 1000),
+            'p50_ms': percentile(ordered, 50),
+            'p95_ms': percentile(ordered, 95),
+            'p99_ms': percentile(ordered, 99),
+            'queries_mean': sum(queries) / len(queries),
+            'queries_max': max(queries),
+            'status': {str(code): n for code, n in sorted(status.items())},
+        }
+
+    def compare(self, path, results):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)['results']
+        self.stdout.write(f'\nCompared with {path}:')
+        for key, result in results.items():
+            if key in previous:
+                before = previous[key]
+                self.stdout.write(
+                    f"{key:<38} p50 {before['p50_ms']:7.2f} -> {result['p50_ms']:7.2f} ms "
+                    f"({result['p50_ms'] / before['p50_ms']:5.2f}x)  p99 {before['p99_ms']:7.2f} -> "
+                    f"{result['p99_ms']:7.2f} ms ({result['p99_ms'] / before['p99_ms']:5.2f}x)"
+                )
+
+    def pick(self, model):
+        # A random existing primary key, ids have gaps once rows are deleted
+        low, high = self.bounds[model]
+        return model.objects.filter(pk__gte=self.rng.randint(low, high)).order_by('pk').values_list('pk', flat=True).first()
+
+    def post_json(self, url_name, data):
+        return 'post', reverse(url_name), {'data': json.dumps(data), 'content_type': 'application/json'}
+
+    def scenarios(self):
+        # (URL name, variant label, writes, request maker) for every view
+        rng = self.rng
+        get = lambda url_name, *args, **params: ('get', reverse(url_name, args=args), {'data': params})
+        isbn_prefix = lambda: Book.objects.get(pk=self.pick(Book)).isbn[:rng.randint(4, 8)]
+        member_code = lambda: Member.objects.get(pk=self.pick(Member)).member_id
+        member_id_prefix = lambda: member_code()[:rng.randint(3, 6)]
+
+        def new_transaction():
+            return 'post', reverse('newtransaction'), {'data': {
+                'book': self.pick(Book), 'member': self.pick(Member), 'transaction_type': 'return',
+                'fee_charged': '0', 'amount_paid': '0'}}
+
+        def manifest():
+            lines = ['title,author,isbn,quantity_purchased'] + [
+                f'{rng.choice(WORDS).title()},{rng.choice(SURNAMES)},BENCH{rng.randrange(10 ** 8):08d},{rng.randint(1, 5)}'
+                for _ in range(20)]
+            upload = SimpleUploadedFile('manifest.csv', '\n'.join(lines).encode())
+            return 'post', reverse('import_purchases'), {'data': {'manifest': upload}}
+
+        return [
+            ('login', '', False, lambda: get('login')),
+            ('lib_dashboard', '', False, lambda: get('lib_dashboard')),
+            ('dashboard_stats', '', False, lambda: get('dashboard_stats')),
+            ('password_reset', '', False, lambda: get('password_reset')),
+            ('signup', '', False, lambda: get('signup')),
+            ('newbook', 'form', False, lambda: get('newbook')),
+            ('newbook', 'post', True, lambda: ('post', reverse('newbook'), {'data': {
+                'title': 'Benchmark Book', 'author': 'Benchmark', 'isbn': f'BENCH{rng.randrange(10 ** 8):08d}',
+                'quantity_purchased': 1}})),
+            ('import_purchases', 'form', False, lambda: get('import_purchases')),
+            ('import_purchases', 'post', True, manifest),
+            ('export', 'member_history', False, lambda: get('export', 'transactions', member=member_code())),
+            ('searchbook', '', False, lambda: get('searchbook')),
+            ('search_for_book', 'title', False, lambda: self.post_json('search_for_book', {'q': rng.choice(WORDS)[:5], 'field': 'title'})),
+            ('search_for_book', 'author', False, lambda: self.post_json('search_for_book', {'q': rng.choice(SURNAMES), 'field': 'author'})),
+            ('search_for_book', 'isbn', False, lambda: self.post_json('search_for_book', {'q': isbn_prefix(), 'field': 'isbn'})),
+            ('edit_book', '', False, lambda: get('edit_book', self.pick(Book))),
+            ('delete_book', '', True, lambda: ('post', reverse('delete_book', args=[self.pick(Book)]), {})),
+            ('newmember', 'form', False, lambda: get('newmember')),
+            ('newmember', 'post', True, lambda: ('post', reverse('newmember'), {'data': {
+                'name': 'Benchmark Member', 'email': 'benchmark@example.com', 'member_id': f'B{rng.randrange(10 ** 8):08d}'}})),
+            ('searchmember', '', False, lambda: get('searchmember')),
+            ('search_for_member', 'name', False, lambda: self.post_json('search_for_member', {'q': rng.choice(SURNAMES)[:4], 'field': 'name'})),
+            ('search_for_member', 'member_id', False, lambda: self.post_json('search_for_member', {'q': member_id_prefix(), 'field': 'member_id'})),
+            ('edit_member', '', False, lambda: get('edit_member', self.pick(Member))),
+            ('delete_member', '', True, lambda: ('post', reverse('delete_member', args=[self.pick(Member)]), {})),
+            ('newtransaction', 'form', False, lambda: get('newtransaction')),
+            ('newtransaction', 'post', True, new_transaction),
+            ('batch_checkout', '', True, lambda: self.post_json('batch_checkout', {'member': self.pick(Member), 'items': [
+                {'book': self.pick(Book), 'action': 'return'} for _ in range(10)]})),
+            ('searchtransaction', '', False, lambda: get('searchtransaction')),
+            ('search_for_transaction', 'book', False, lambda: self.post_json('search_for_transaction', {'q': isbn_prefix(), 'field': 'book'})),
+            ('search_for_transaction', 'member', False, lambda: self.post_json('search_for_transaction', {'q': member_id_prefix(), 'field': 'member'})),
+            ('search_for_transaction', 'type', False, lambda: self.post_json('search_for_transaction', {'q': 'return', 'field': 'transaction_type'})),
+            ('delete_transaction', '', True, lambda: ('post', reverse('delete_transaction', args=[self.pick(Transaction)]), {})),
+            ('edit_transaction', '', False, lambda: get('edit_transaction', self.pick(Transaction))),
+            ('member_loans', '', False, lambda: get('member_loans', self.pick(Member))),
+            ('book_loans', '', False, lambda: get('book_loans', self.pick(Book))),
+            ('autocomplete', '', False, lambda: get('autocomplete', kind=rng.choice(('book_title', 'member_name')), q=rng.choice(WORDS)[:3])),
+            ('lookup', 'book', False, lambda: get('lookup', kind='book', q=rng.choice(WORDS)[:4])),
+            ('lookup', 'member', False, lambda: get('lookup', kind='member', q=rng.choice(SURNAMES)[:4])),
+            ('metrics', '', False, lambda: get('metrics')),
+        ]
@@ -0,0 +1,111 @@
+import random
+import statistics
+import time
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import connection
+from LibApp.models import Member
+from LibApp.phonetic import asearch_names, backfill_name_keys
+from LibApp.stats import adjust
+from .benchmark_autocomplete import Command as AutocompleteBenchmark
+from .benchmark_book_search import SURNAMES
+from .generate_data import FIRST_NAMES
+
+MEMBER_PREFIX = 'BM'
+
+class Command(BaseCommand):
+    help = 'Compare the phonetic member name search with the icontains scan on generated members'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=200000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keep', action='store_true', help='Keep the generated members afterwards')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # The made-up word generator of the autocomplete benchmark
+        words = AutocompleteBenchmark()
+        surnames = sorted(set(SURNAMES) | {words.pseudo_word(rng).title() for _ in range(5000)})
+        names = self.generate(rng, options['members'], surnames)
+
+        # Full names as said at the desk: spelled right, spelled the way they
+        # sound, and names of nobody
+        query_sets = {'exact': [], 'variant': [], 'miss': []}
+        for _ in range(options['queries']):
+            name = rng.choice(names)
+            query_sets['exact'].append((name, name))
+            query_sets['variant'].append((name, ' '.join(self.respell(rng, word) for word in name.split())))
+            query_sets['miss'].append((None, f'{rng.choice(FIRST_NAMES)} Zq{words.pseudo_word(rng)}'))
+        page_size = options['page_size']
+
+        def icontains(query):
+            return list(Member.objects.filter(name__icontains=query).order_by('pk')[:page_size])
+
+        def phonetic(query):
+            # By sound only, off the index
+            return async_to_sync(asearch_names)(query, None, page_size, substring=False)[0]
+
+        try:
+            for name, search in (('icontains', icontains), ('phonetic', phonetic)):
+                for kind, queries in query_sets.items():
+                    timings, found = self.run(search, queries)
+                    self.stdout.write(
+                        f'{name:>10} {kind:>7}: mean {statistics.mean(timings):8.2f} ms  '
+                        f'p50 {self.percentile(timings, 50):8.2f} ms  p95 {self.percentile(timings, 95):8.2f} ms  '
+                        f'p99 {self.percentile(timings, 99):8.2f} ms  found {found * 100 / len(queries):5.1f}%'
+                    )
+        finally:
+            if not options['keep']:
+                Member.objects.filter(member_id__startswith=MEMBER_PREFIX).delete()
+
+    def generate(self, rng, count, surnames):
+        # Members are written in bulk batches, each name shared by a handful
+        existing = Member.objects.filter(member_id__startswith=MEMBER_PREFIX).count()
+        batch = []
+        for n in range(existing, count):
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(surnames)}'
+            batch.append(Member(name=name, email=f'bench{n}@example.com',
+                                member_id=f'{MEMBER_PREFIX}{n:08d}'))
+            if len(batch) == 10000:
+                Member.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Member.objects.bulk_create(batch)
+        # bulk_create skips the counters and the cache versions; deleting the
+        # members afterwards goes through the delete signals
+        if count > existing:
+            adjust({'active_members': count - existing})
+            # Nor the name keys and words
+            backfill_name_keys(10000)
+        self.stdout.write(f'{count} generated members on {connection.vendor}')
+        return list(Member.objects.filter(member_id__startswith=MEMBER_PREFIX).values_list('name', flat=True)[:5000])
+
+    def respell(self, rng, word):
+        # Another spelling of the same sound: a different vowel, a doubled
+        # consonant, past the first letter
+        word = word.lower()
+        vowels = [n for n in range(1, len(word)) if word[n] in 'aeiouy']
+        consonants = [n for n in range(1, len(word)) if word[n] not in 'aeiouyhw']
+        edit = rng.choice([edit for edit, positions in (('vowel', vowels), ('double', consonants)) if positions] or [None])
+        if edit == 'vowel':
+            n = rng.choice(vowels)
+            return word[:n] + rng.choice([vowel for vowel in 'aeiouy' if vowel != word[n]]) + word[n + 1:]
+        if edit == 'double':
+            n = rng.choice(consonants)
+            return word[:n] + word[n] + word[n:]
+        return word
+
+    def run(self, search, queries):
+        timings, found = [], 0
+        for name, query in queries:
+            start = time.perf_counter()
+            results = search(query)
+            timings.append((time.perf_counter() - start) * 1000)
+            found += name is not None and any(member.name == name for member in results)
+        return timings, found
+
+    def percentile(self, timings, pct):
+        ordered = sorted(timings)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,210 @@
+import heapq
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from LibApp.isbn import isbn13_check_digit
+from LibApp.loans import backfill_loans
+from LibApp.models import Book, Member, Transaction
+from LibApp.phonetic import backfill_name_keys
+from LibApp.search_cache import invalidate
+from LibApp.stats import reconcile
+from .benchmark_book_search import WORDS, SURNAMES
+
+FIRST_NAMES = ('Amina', 'Brian', 'Chloe', 'David', 'Esther', 'Felix', 'Grace', 'Hassan', 'Irene', 'James',
+               'Kevin', 'Lucy', 'Mary', 'Nadia', 'Oscar', 'Peter', 'Rose', 'Samuel', 'Tara', 'Victor', 'Wanjiru', 'Yusuf')
+MEMBER_PREFIX = 'GEN'
+FEES = (Decimal('5'), Decimal('10'), Decimal('20'), Decimal('50'))
+
+def isbn13(number):
+    # A valid ISBN-13 in the 979 range from a running number
+    digits = f'979{number:09d}'
+    return digits + isbn13_check_digit(digits)
+
+def zipf_weights(count, exponent):
+    # Cumulative weights of a Zipf distribution over count items
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a seeded, realistic dataset: books, members and a history of loans '
+            'with skewed popularity, written with bulk inserts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000000)
+        parser.add_argument('--members', type=int, default=200000)
+        parser.add_argument('--transactions', type=int, default=10000000)
+        parser.add_argument('--days', type=int, default=730, help='Length of the loan history')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of book popularity')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if Member.objects.filter(member_id__startswith=MEMBER_PREFIX).exists():
+            raise CommandError('Generated data is already present, start from an empty database')
+        rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        book_ids, copies = self.timed(self.generate_books, rng, options['books'])
+        member_ids = self.timed(self.generate_members, rng, options['members'])
+        open_loans, debts = self.timed(self.generate_transactions, rng, options, book_ids, copies, member_ids)
+        self.apply_balances(open_loans, debts)
+        # The history is bulk inserted, pair it into loans afterwards
+        self.timed(backfill_loans)
+        reconcile()
+        invalidate(Book, Member, Transaction)
+
+        self.stdout.write(f'Done in {time.perf_counter() - started:.0f} s')
+
+    def timed(self, step, *args):
+        started = time.perf_counter()
+        result = step(*args)
+        self.stdout.write(f' in {time.perf_counter() - started:.0f} s')
+        return result
+
+    def insert(self, model, objects, label, total):
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self.stdout.write(f'\r{label}: {total}', ending='')
+        self.stdout.flush()
+
+    def generate_books(self, rng, count):
+        vocabulary = list(WORDS) + [''.join(rng.choice('bdfgklmnprstvz') + rng.choice('aeiou')
+                                            for _ in range(rng.randint(2, 4))) for _ in range(20000)]
+        # Authors write several books each
+        authors = [f'{rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}' for _ in range(max(1, count // 8))]
+        first_isbn = rng.randrange(10 ** 9 - count)
+        batch, written = [], 0
+        for n in range(count):
+            total = rng.choice((1, 1, 2, 2, 3, 5, 10))
+            isbn = isbn13(first_isbn + n)
+            batch.append(Book(title=' '.join(rng.sample(vocabulary, rng.randint(1, 5))).title(),
+                              author=rng.choice(authors), isbn=isbn, isbn13=isbn,
+                              quantity_available=total, quantity_total=total))
+            if len(batch) == self.batch_size:
+                written += len(batch)
+                self.insert(Book, batch, 'books', written)
+                batch = []
+        if batch:
+            self.insert(Book, batch, 'books', count)
+        rows = list(Book.objects.filter(isbn__gte=isbn13(first_isbn), isbn__lte=isbn13(first_isbn + count - 1))
+                    .order_by('pk').values_list('pk', 'quantity_total'))
+        return [pk for pk, _ in rows], dict(rows)
+
+    def generate_members(self, rng, count):
+        batch = []
+        for n in range(count):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(SURNAMES)
+            name = f'{first} {last}'
+            batch.append(Member(name=name, email=f'{first}.{last}.{n}@example.com'.lower(),
+                                member_id=f'{MEMBER_PREFIX}{n:07d}'))
+            if len(batch) == self.batch_size:
+                self.insert(Member, batch, 'members', n + 1)
+                batch = []
+        if batch:
+            self.insert(Member, batch, 'members', count)
+        # bulk_create skips Member.save, the name keys and words are filled in after
+        backfill_name_keys(self.batch_size)
+        return list(Member.objects.filter(member_id__startswith=MEMBER_PREFIX).order_by('pk').values_list('pk', flat=True))
+
+    def generate_transactions(self, rng, options, book_ids, copies, member_ids):
+        # Loans are generated day by day in time order: a few popular books and
+        # heavy readers account for most of them. Every loan is an issue and,
+        # once its loan period has passed, a return; loans still running at
+        # the end stay open
+        books_by_rank = rng.sample(book_ids, len(book_ids))
+        members_by_rank = rng.sample(member_ids, len(member_ids))
+        book_weights = zipf_weights(len(books_by_rank), options['skew'])
+        member_weights = zipf_weights(len(members_by_rank), 0.8)
+
+        days = options['days']
+        loans_per_day = max(1, options['transactions'] // 2 // days)
+        now = timezone.now()
+        first_day = now - timedelta(days=days)
+        open_loans, debts = defaultdict(int), defaultdict(Decimal)
+        pending = []  # (return time, book id, member id) heap
+        batch, written = [], 0
+
+        # The history is by far the largest table: rows go in as plain tuples
+        # through executemany, already adapted to the database, rather than
+        # as model instances
+        table = Transaction._meta.db_table
+        columns = ('book_id', 'member_id', 'transaction_type', 'transaction_date', 'fee_charged', 'amount_paid')
+        sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            connection.ops.quote_name(table), ', '.join(connection.ops.quote_name(c) for c in columns),
+            ', '.join(['%s'] * len(columns)))
+        amount = {value: connection.ops.adapt_decimalfield_value(value, 10, 2) for value in FEES + (Decimal('0'),)}
+        adapt_date = connection.ops.adapt_datetimefield_value
+
+        def add(when, book_id, member_id, action, fee=Decimal('0'), paid=Decimal('0')):
+            nonlocal batch, written
+            batch.append((book_id, member_id, action, adapt_date(when), amount[fee], amount[paid]))
+            if len(batch) == self.batch_size:
+                written += len(batch)
+                flush()
+
+        def flush():
+            nonlocal batch
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            self.stdout.write(f'\rtransactions: {written}', ending='')
+            self.stdout.flush()
+            batch = []
+
+        for day in range(days):
+            day_start = first_day + timedelta(days=day)
+            books = rng.choices(books_by_rank, cum_weights=book_weights, k=loans_per_day)
+            members = rng.choices(members_by_rank, cum_weights=member_weights, k=loans_per_day)
+            for seconds, book_id, member_id in sorted(zip((rng.random() * 86400 for _ in books), books, members)):
+                when = day_start + timedelta(seconds=seconds)
+                while pending and pending[0][0] <= when:
+                    returned, returned_book, returned_member = heapq.heappop(pending)
+                    open_loans[returned_book] -= 1
+                    add(returned, returned_book, returned_member, 'return')
+                if open_loans[book_id] >= copies[book_id]:
+                    # Every copy is out, the reader takes some other book
+                    book_id = rng.choice(book_ids)
+                    if open_loans[book_id] >= copies[book_id]:
+                        continue
+                fee = paid = Decimal('0')
+                if rng.random() < 0.1:
+                    fee = rng.choice(FEES)
+                    paid = fee if rng.random() < 0.7 else Decimal('0')
+                    if debts[member_id] + fee - paid > 500:
+                        fee = paid = Decimal('0')
+                debts[member_id] += fee - paid
+                open_loans[book_id] += 1
+                add(when, book_id, member_id, 'issue', fee, paid)
+                heapq.heappush(pending, (when + timedelta(days=rng.randint(1, 30), seconds=rng.random() * 86400),
+                                         book_id, member_id))
+        while pending and pending[0][0] <= now:
+            returned, returned_book, returned_member = heapq.heappop(pending)
+            open_loans[returned_book] -= 1
+            add(returned, returned_book, returned_member, 'return')
+        if batch:
+            written += len(batch)
+            flush()
+        return open_loans, debts
+
+    def apply_balances(self, open_loans, debts):
+        # Bring the stock and debt columns in line with the generated history,
+        # one UPDATE per distinct value and chunk of rows
+        with transaction.atomic():
+            self.update_grouped(Book, {pk: n for pk, n in open_loans.items() if n},
+                                lambda n: {'quantity_available': F('quantity_total') - n})
+            self.update_grouped(Member, {pk: debt for pk, debt in debts.items() if debt},
+                                lambda debt: {'outstanding_debt': debt})
+
+    def update_grouped(self, model, values, make_update):
+        ids_by_value = defaultdict(list)
+        for pk, value in values.items():
+            ids_by_value[value].append(pk)
+        for value, ids in ids_by_value.items():
+            for start in range(0, len(ids), 900):
+                model.objects.filter(pk__in=ids[start:start + 900]).update(**make_update(value))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from LibApp.importer import READERS, import_manifest
+
+class Command(BaseCommand):
+    help = 'Import a CSV or NDJSON purchase manifest in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('ndjson' if path.lower().endswith(('.ndjson', '.jsonl')) else 'csv')
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                report = import_manifest(stream, file_format, options['chunk_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for reject in report.rejected:
+            self.stderr.write(f"line {reject['line']}: {reject['error']}")
+        if report.rejected_count > len(report.rejected):
+            self.stderr.write(f'... {report.rejected_count - len(report.rejected)} more rejected lines')
+        self.stdout.write(
+            f'{report.imported} of {report.rows} rows imported ({report.books_created} new books, '
+            f'{report.books_updated} restocked), {report.rejected_count} rejected, '
+            f'{report.elapsed:.1f} s, {report.rows_per_second:.0f} rows/s'
+        )
@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from LibApp.purge import DEFAULT_BATCH_SIZE, purge_deleted
+
+class Command(BaseCommand):
+    help = ('Delete the history of soft-deleted books and members in short batches, then the rows themselves. '
+            'Run it from cron, or with --loop as a long-running worker')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='History rows per batch')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new deletes')
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        def progress(job):
+            self.stdout.write(f'\r{job.kind} {job.object_id}: {job.purged}/{job.total} purged', ending='')
+            if job.finished_at:
+                self.stdout.write('')
+            self.stdout.flush()
+
+        while True:
+            started = time.perf_counter()
+            finished = purge_deleted(options['batch_size'], options['sleep'], progress)
+            if finished or not options['loop']:
+                self.stdout.write(f'{finished} deletes finished in {time.perf_counter() - started:.1f} s')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
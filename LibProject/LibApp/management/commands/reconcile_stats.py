@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from LibApp.stats import reconcile
+
+class Command(BaseCommand):
+    help = 'Recount the dashboard statistics and correct any drift, run it periodically (e.g. nightly from cron)'
+
+    def handle(self, *args, **options):
+        drift = reconcile()
+        if not drift:
+            self.stdout.write('Dashboard statistics are in step')
+        for name, (recorded, actual) in drift.items():
+            self.stdout.write(f'{name}: {recorded} corrected to {actual}')
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from LibApp.tasks import prune, run_due, visibility_timeout
+
+class Command(BaseCommand):
+    help = ('Run the queued background tasks (mail, purges) on a pool of threads. Run it with --loop as a '
+            'long-running worker; start it more than once, on any host, for more processes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Threads running tasks')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new tasks')
+        parser.add_argument('--interval', type=float, default=2, help='Seconds between polls with --loop')
+        parser.add_argument('--visibility-timeout', type=float, default=None,
+                            help='Seconds a claimed task is left to this worker, TASK_VISIBILITY_TIMEOUT by default')
+        parser.add_argument('--keep-days', type=float, default=7, help='Days completed tasks are kept')
+
+    def handle(self, *args, **options):
+        timeout = options['visibility_timeout'] or visibility_timeout()
+        while True:
+            started = time.perf_counter()
+            completed, failed = run_due(options['workers'], timeout)
+            pruned = prune(options['keep_days'])
+            if completed or failed or not options['loop']:
+                self.stdout.write(f'{completed} tasks completed, {failed} attempts failed, {pruned} old tasks pruned '
+                                  f'in {time.perf_counter() - started:.1f} s')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,89 @@
+import threading
+import time
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from LibApp.models import Book, Member, Transaction
+
+ISBN = 'STRESS0000001'
+
+def legacy_issue(book_id, member_id, fee):
+    # The previous Transaction.save: read both rows, change them in Python and
+    # write every column back
+    book = Book.objects.get(pk=book_id)
+    member = Member.objects.get(pk=member_id)
+    if member.outstanding_debt + fee > 500:
+        raise ValidationError('Outstanding debt cannot exceed 500.')
+    Transaction.objects.bulk_create([Transaction(book=book, member=member, transaction_type='issue', fee_charged=fee)])
+    member.outstanding_debt += fee
+    member.save()
+    book.quantity_available -= 1
+    book.save()
+
+def atomic_issue(book_id, member_id, fee):
+    Transaction.objects.create(book_id=book_id, member_id=member_id, transaction_type='issue', fee_charged=fee)
+
+class Command(BaseCommand):
+    help = ('Issue one book from several desks at once and compare the legacy and atomic save paths. It creates '
+            'and deletes rows, run it on a test or benchmark database only')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desks', type=int, default=8)
+        parser.add_argument('--issues', type=int, default=200, help='Issues attempted per desk')
+        parser.add_argument('--database', required=True,
+                            help='Name of the configured database, to confirm it is a scratch one that may be written')
+
+    def handle(self, *args, **options):
+        # Refuse any database but the one named, so it never runs on production by accident
+        if str(options['database']) != str(connection.settings_dict['NAME']):
+            raise CommandError(f"--database {options['database']} is not the configured database "
+                               f"{connection.settings_dict['NAME']}; run this on a test or benchmark database only")
+        for name, issue in (('legacy', legacy_issue), ('atomic', atomic_issue)):
+            self.run(name, issue, options['desks'], options['issues'])
+
+    def run(self, name, issue, desks, issues):
+        fee = Decimal('1.00')
+        Transaction.objects.filter(book__isbn=ISBN).delete()
+        Book.objects.filter(isbn=ISBN).delete()
+        Member.objects.filter(member_id__startswith='STRESS').delete()
+        copies = desks * issues
+        book = Book.objects.create(title='Stress Test', author='Stress Test', isbn=ISBN,
+                                   quantity_available=copies, quantity_total=copies)
+        members = [Member.objects.create(name=f'Stress {n}', email=f'stress{n}@example.com', member_id=f'STRESS{n}')
+                   for n in range(desks)]
+
+        failures = []
+
+        def desk(member):
+            try:
+                for _ in range(issues):
+                    try:
+                        with transaction.atomic():
+                            issue(book.pk, member.pk, fee)
+                    except Exception as e:
+                        failures.append(type(e).__name__)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=desk, args=(member,)) for member in members]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        # Drift: copies and debt that don't match the issues actually recorded
+        issued = Transaction.objects.filter(book=book).count()
+        book.refresh_from_db()
+        debt = Member.objects.filter(pk__in=[m.pk for m in members]).aggregate(total=Sum('outstanding_debt'))['total']
+        self.stdout.write(
+            f'{name:>6}: {issued} issues in {elapsed:.2f} s ({issued / elapsed:.0f}/s), {len(failures)} failed, '
+            f'stock drift {copies - issued - book.quantity_available}, debt drift {debt - fee * issued}'
+        )
+
+        Transaction.objects.filter(book=book).delete()
+        book.delete()
+        Member.objects.filter(pk__in=[m.pk for m in members]).delete()
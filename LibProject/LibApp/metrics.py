@@ -0,0 +1,159 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+# In-process request metrics, recorded by MetricsMiddleware per resolved URL
+# name and rendered in the Prometheus text exposition format by the /metrics/
+# view. Each worker process keeps its own numbers, the scraper sums them.
+# Recording a request is a few list increments under one lock.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+UNRESOLVED = '<unresolved>'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per upper bound plus the +Inf slot, counts are per slot and
+        # made cumulative when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        # (le, cumulative count) pairs ending with +Inf
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.responses = defaultdict(int)
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = Histogram(LATENCY_BUCKETS)
+        self.response_bytes = Histogram(SIZE_BUCKETS)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(ViewMetrics)
+        # Plain counters other modules register, by name then label values
+        self._counter_help = {}
+        self._counters = defaultdict(lambda: defaultdict(int))
+
+    def register_counter(self, name, help_text):
+        self._counter_help[name] = help_text
+
+    def increment(self, name, **labels):
+        with self._lock:
+            self._counters[name][tuple(sorted(labels.items()))] += 1
+
+    def counter_value(self, name, **labels):
+        with self._lock:
+            return self._counters[name].get(tuple(sorted(labels.items())), 0)
+
+    def record(self, view, status, seconds, queries, db_seconds):
+        with self._lock:
+            metrics = self._views[view]
+            metrics.responses[status] += 1
+            metrics.latency.observe(seconds)
+            metrics.queries.observe(queries)
+            metrics.db_seconds.observe(db_seconds)
+
+    def record_size(self, view, size):
+        # Separate from record() as streamed bodies are only measured once sent
+        with self._lock:
+            self._views[view].response_bytes.observe(size)
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._counters.clear()
+
+    def render(self):
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = [
+                '# HELP libapp_http_responses_total Responses by view and status code.',
+                '# TYPE libapp_http_responses_total counter',
+            ]
+            for view, metrics in views:
+                for status, count in sorted(metrics.responses.items()):
+                    lines.append(f'libapp_http_responses_total{{view="{escape(view)}",status="{status}"}} {count}')
+            for name, help_text in sorted(self._counter_help.items()):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for labels, count in sorted(self._counters[name].items()):
+                    label_text = ','.join(f'{key}="{escape(value)}"' for key, value in labels)
+                    lines.append(f'{name}{{{label_text}}} {count}')
+            for name, attribute, help_text in (
+                ('libapp_http_request_duration_seconds', 'latency', 'Request latency by view.'),
+                ('libapp_db_queries_per_request', 'queries', 'Database queries run per request by view.'),
+                ('libapp_db_duration_seconds', 'db_seconds', 'Time spent in the database per request by view.'),
+                ('libapp_http_response_size_bytes', 'response_bytes', 'Response body size by view.'),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for view, metrics in views:
+                    lines += histogram_lines(name, {'view': view}, getattr(metrics, attribute))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def histogram_lines(name, labels, histogram):
+    label_text = ','.join(f'{key}="{escape(value)}"' for key, value in labels.items())
+    lines = [f'{name}_bucket{{{label_text},le="{bound}"}} {count}' for bound, count in histogram.samples()]
+    lines.append(f'{name}_sum{{{label_text}}} {histogram.sum:g}')
+    lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+    return lines
+
+
+class QueryTimer:
+    # Counts the queries of one request and the time spent running them
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += perf_counter() - start
+            self.queries += 1
+
+
+# The QueryTimer of the request being served. The async ORM copies context
+# variables into its worker threads, so a query finds the timer of its own
+# request whichever thread runs it and whatever else that thread runs
+current_timer = ContextVar('query_timer', default=None)
+
+def time_query(execute, sql, params, many, context):
+    # Execute wrapper on every connection, timing the query for its request
+    timer = current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+def watch_queries(sender, connection, **kwargs):
+    # connection_created receiver putting time_query on each connection once,
+    # it stays there when the connection reconnects
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+REGISTRY = MetricsRegistry()
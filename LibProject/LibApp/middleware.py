@@ -0,0 +1,129 @@
+from time import perf_counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.urls import Resolver404, resolve
+from .metrics import REGISTRY, UNRESOLVED, QueryTimer, current_timer
+from .ratelimit import Limiter, client_key, endpoint_class, refuse
+
+class MetricsMiddleware:
+    # Times every request and counts its queries through the execute wrapper on
+    # each database connection (metrics.time_query), then records them under
+    # the resolved URL name.
+    # Put it first in MIDDLEWARE so the latency covers the other middleware too
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.record(request, response, timer, perf_counter() - start)
+
+    async def __acall__(self, request):
+        # Requests in flight together share the worker thread of the async ORM
+        # and its connections; each query is counted for its own request
+        timer = QueryTimer()
+        token = current_timer.set(timer)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timer.reset(token)
+        return self.record(request, response, timer, perf_counter() - start)
+
+    def record(self, request, response, timer, seconds):
+        match = request.resolver_match
+        view = match.url_name or match.view_name if match else UNRESOLVED
+        REGISTRY.record(view, response.status_code, seconds, timer.queries, timer.seconds)
+        if response.streaming:
+            measure = self.ameasure if response.is_async else self.measure
+            response.streaming_content = measure(view, response.streaming_content)
+        else:
+            REGISTRY.record_size(view, len(response.content))
+        return response
+
+    def measure(self, view, content):
+        # Count a streamed body as it is sent, recorded once it is complete
+        size = 0
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+        REGISTRY.record_size(view, size)
+
+    async def ameasure(self, view, content):
+        size = 0
+        async for chunk in content:
+            size += len(chunk)
+            yield chunk
+        REGISTRY.record_size(view, size)
+
+
+class RateLimitMiddleware:
+    # Token buckets and concurrency caps of RATE_LIMITS, see ratelimit. The
+    # check reads no database and, on the async path, stays on the event loop,
+    # so a refused request is answered at once however busy the workers are.
+    # Put it right after MetricsMiddleware, refusals then skip the rest
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limiter = Limiter()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        refused, slot = self.admit(request)
+        if refused:
+            return refused
+        try:
+            return self.get_response(request)
+        finally:
+            self.release(slot)
+
+    async def __acall__(self, request):
+        refused, slot = self.admit(request)
+        if refused:
+            return refused
+        try:
+            return await self.get_response(request)
+        finally:
+            self.release(slot)
+
+    def admit(self, request):
+        # (refusal response or None, the running slot taken or None). A slot
+        # is taken first, a request shed for load costs the client no token
+        try:
+            limited = endpoint_class(resolve(request.path_info).url_name)
+        except Resolver404:
+            limited = None
+        if limited is None:
+            return None, None
+        name, limits = limited
+        slot = None
+        if 'concurrency' in limits:
+            if not self.limiter.acquire(name, limits['concurrency']):
+                return refuse(name, 'concurrency', 503, 1), None
+            slot = name
+        wait = self.limiter.take((name, client_key(request)), limits['rate'], limits['burst'])
+        if wait:
+            self.release(slot)
+            return refuse(name, 'rate', 429, wait), None
+        return None, slot
+
+    def release(self, slot):
+        # A streamed response keeps reading after this, the slot covers the view
+        if slot is not None:
+            self.limiter.release(slot)
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Book',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('author', models.CharField(max_length=100)),
+                ('isbn', models.CharField(max_length=17, unique=True)),
+                ('quantity_available', models.PositiveIntegerField(default=0)),
+                ('quantity_total', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Member',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('email', models.EmailField(max_length=254)),
+                ('member_id', models.CharField(max_length=10, unique=True)),
+                ('outstanding_debt', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Purchases',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('author', models.CharField(max_length=100)),
+                ('isbn', models.CharField(max_length=17, unique=True)),
+                ('quantity_purchased', models.PositiveIntegerField(default=0)),
+                ('date', models.DateField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(choices=[('issue', 'Issue'), ('return', 'Return')], max_length=10)),
+                ('transaction_date', models.DateTimeField(auto_now_add=True)),
+                ('fee_charged', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='LibApp.book')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='LibApp.member')),
+            ],
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:35
+
+from django.db import migrations, models
+
+# SQLite only uses an index for a case-insensitive LIKE 'prefix%' when the
+# column is indexed with the NOCASE collation. MySQL's default collation is
+# already case-insensitive, so the plain indexes serve it there
+NOCASE_INDEXES = [
+    ('LibApp_book', 'isbn'),
+    ('LibApp_member', 'name'),
+    ('LibApp_member', 'email'),
+    ('LibApp_member', 'member_id'),
+    ('LibApp_transaction', 'transaction_type'),
+]
+
+def create_nocase_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, column in NOCASE_INDEXES:
+        schema_editor.execute(f'CREATE INDEX "{table}_{column}_nocase" ON "{table}" ("{column}" COLLATE NOCASE)')
+
+def drop_nocase_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, column in NOCASE_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{table}_{column}_nocase"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author'], name='book_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['name'], name='member_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['email'], name='member_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type'], name='transaction_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_date'], name='transaction_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['member', 'transaction_date'], name='transaction_member_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['book', 'transaction_type'], name='transaction_book_type_idx'),
+        ),
+        migrations.RunPython(create_nocase_indexes, drop_nocase_indexes),
+    ]
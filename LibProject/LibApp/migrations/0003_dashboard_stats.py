@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:38
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def seed_counters(apps, schema_editor):
+    # Start the running totals from the rows already in the database
+    Book = apps.get_model('LibApp', 'Book')
+    Member = apps.get_model('LibApp', 'Member')
+    StatCounter = apps.get_model('LibApp', 'StatCounter')
+    # The database being migrated, not the one the router would pick
+    db = schema_editor.connection.alias
+    books = Book.objects.using(db).aggregate(available=Sum('quantity_available'), total=Sum('quantity_total'))
+    members = Member.objects.using(db).aggregate(count=Count('pk'), debt=Sum('outstanding_debt'))
+    StatCounter.objects.using(db).bulk_create([
+        StatCounter(name='books_on_loan', value=(books['total'] or 0) - (books['available'] or 0)),
+        StatCounter(name='copies_available', value=books['available'] or 0),
+        StatCounter(name='active_members', value=members['count']),
+        StatCounter(name='outstanding_debt', value=members['debt'] or 0),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0002_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('name', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0003_dashboard_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Loan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issued_at', models.DateTimeField()),
+                ('returned_at', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='LibApp.book')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='LibApp.member')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['member', 'returned_at'], name='loan_member_open_idx'), models.Index(fields=['book', 'returned_at'], name='loan_book_open_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_due_dates(apps, schema_editor):
+    Loan = apps.get_model('LibApp', 'Loan')
+    period = timedelta(days=getattr(settings, 'LOAN_PERIOD_DAYS', 14))
+    Loan.objects.using(schema_editor.connection.alias).update(due_at=F('issued_at') + period)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0004_loans'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='due_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(set_due_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='loan',
+            name='due_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='fee_accrued',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['returned_at', 'member'], name='loan_open_member_idx'),
+        ),
+    ]
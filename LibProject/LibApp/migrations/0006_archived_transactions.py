@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def partition_archive(apps, schema_editor):
+    # On MySQL the archive is partitioned by transaction date, starting with a
+    # single catch-all partition; archive_transactions splits off a partition
+    # per year before moving rows into it. The partitioning column has to be
+    # part of the primary key
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    table = schema_editor.quote_name(apps.get_model('LibApp', 'ArchivedTransaction')._meta.db_table)
+    schema_editor.execute(f'ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (`id`, `transaction_date`)')
+    schema_editor.execute(f'ALTER TABLE {table} PARTITION BY RANGE COLUMNS(`transaction_date`) '
+                          f'(PARTITION pmax VALUES LESS THAN (MAXVALUE))')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0005_loan_fees'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('transaction_type', models.CharField(choices=[('issue', 'Issue'), ('return', 'Return')], max_length=10)),
+                ('transaction_date', models.DateTimeField()),
+                ('fee_charged', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('book', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='LibApp.book')),
+                ('member', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_transactions', to='LibApp.member')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['transaction_type'], name='archived_type_idx'), models.Index(fields=['transaction_date'], name='archived_date_idx'), models.Index(fields=['member', 'transaction_date'], name='archived_member_date_idx'), models.Index(fields=['book', 'transaction_type'], name='archived_book_type_idx')],
+            },
+        ),
+        migrations.RunPython(partition_archive, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0008_book_isbn13'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='name_key',
+            field=models.CharField(blank=True, editable=False, max_length=250, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['name_key'], name='member_name_key_idx'),
+        ),
+    ]
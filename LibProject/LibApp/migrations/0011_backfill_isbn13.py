@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:12
+
+import re
+
+from django.db import migrations, transaction
+
+# A copy of LibApp.isbn.normalize_isbn as it was when this migration was
+# written: a later change to the app's normalization must not change what the
+# migration writes
+SEPARATORS = re.compile(r'[\s-]')
+ADDON_LENGTHS = (15, 18)
+CHUNK_SIZE = 5000
+
+
+def isbn13_check_digit(digits):
+    return str((10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits)) % 10) % 10)
+
+
+def isbn10_check_digit(digits):
+    check = (11 - sum(int(d) * (10 - i) for i, d in enumerate(digits)) % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def normalize_isbn(value):
+    code = SEPARATORS.sub('', value or '').upper()
+    if len(code) == 10 and code[:9].isdigit() and code[9] == isbn10_check_digit(code[:9]):
+        digits = '978' + code[:9]
+        return digits + isbn13_check_digit(digits)
+    if not code.isdigit() or not code.startswith(('978', '979')):
+        return None
+    if len(code) in ADDON_LENGTHS:
+        code = code[:13]
+    if len(code) == 13 and code[12] == isbn13_check_digit(code[:12]):
+        return code
+    return None
+
+
+def fill_isbn13(apps, schema_editor):
+    # Books saved before 0008 have no ISBN-13 yet and no ISBN search finds
+    # them until they do. Duplicates stay empty, backfill_isbn13 reports them
+    Book = apps.get_model('LibApp', 'Book')
+    connection = schema_editor.connection
+    books = Book._base_manager.using(connection.alias)
+    sql = 'UPDATE {} SET isbn13 = %s WHERE id = %s'.format(connection.ops.quote_name(Book._meta.db_table))
+    last_id = 0
+    while True:
+        chunk = list(books.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'isbn', 'isbn13')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        normalized = {pk: normalize_isbn(isbn) for pk, isbn, isbn13 in chunk if isbn13 is None}
+        with transaction.atomic(using=connection.alias):
+            taken = set(books.filter(isbn13__in=[value for value in normalized.values() if value])
+                        .values_list('isbn13', flat=True))
+            changed = []
+            for pk, value in normalized.items():
+                if value and value not in taken:
+                    taken.add(value)
+                    changed.append((value, pk))
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, changed)
+        last_id = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0010_task'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_isbn13, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:40
+
+from django.db import migrations
+
+# Adding the unique isbn13 column in 0008 rebuilt the book table on SQLite,
+# which dropped the NOCASE index 0002 created on its isbn. Stored ISBNs that
+# are no valid ISBN are matched through it again
+
+def create_isbn_nocase_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS "LibApp_book_isbn_nocase" ON "LibApp_book" ("isbn" COLLATE NOCASE)')
+
+def drop_isbn_nocase_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS "LibApp_book_isbn_nocase"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0011_backfill_isbn13'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_isbn_nocase_index, drop_isbn_nocase_index),
+    ]
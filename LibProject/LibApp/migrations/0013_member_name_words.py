@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The keys written so far have no MemberNameWord rows. Clearing them has
+# 0014 write the words of every member
+
+def clear_name_keys(apps, schema_editor):
+    Member = apps.get_model('LibApp', 'Member')
+    Member._base_manager.using(schema_editor.connection.alias).update(name_key=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0012_book_isbn_nocase'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberNameWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=4)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='member',
+            name='member_name_key_idx',
+        ),
+        migrations.AddField(
+            model_name='membernameword',
+            name='member',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_words', to='LibApp.member'),
+        ),
+        migrations.AddIndex(
+            model_name='membernameword',
+            index=models.Index(fields=['code', 'member'], name='member_name_word_idx'),
+        ),
+        migrations.RunPython(clear_name_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+import re
+import unicodedata
+
+from django.db import migrations, transaction
+
+# A copy of the Soundex keys of LibApp.phonetic as they were when this
+# migration was written: a later change to the app's keys must not change
+# what the migration writes
+CODES = {letter: digit for letters, digit in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6'))
+         for letter in letters}
+CHUNK_SIZE = 5000
+
+
+def name_words(name):
+    folded = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode('ascii').lower()
+    return [word for word in (re.sub('[^a-z]', '', part) for part in re.split(r'[\s-]+', folded)) if word]
+
+
+def soundex(word):
+    digits, previous = [], CODES.get(word[0])
+    for letter in word[1:]:
+        digit = CODES.get(letter)
+        if digit and digit != previous:
+            digits.append(digit)
+        if letter not in 'hw':
+            previous = digit
+    return (word[0].upper() + ''.join(digits) + '000')[:4]
+
+
+def phonetic_key(name):
+    return ' '.join(soundex(word) for word in name_words(name))
+
+
+def fill_name_keys(apps, schema_editor):
+    # Members saved before 0009, and every member since 0013 cleared the keys,
+    # have no name words and no name search finds them by sound until they do
+    Member = apps.get_model('LibApp', 'Member')
+    MemberNameWord = apps.get_model('LibApp', 'MemberNameWord')
+    connection = schema_editor.connection
+    members = Member._base_manager.using(connection.alias)
+    words = MemberNameWord._base_manager.using(connection.alias)
+    sql = 'UPDATE {} SET name_key = %s WHERE id = %s'.format(connection.ops.quote_name(Member._meta.db_table))
+    last_id = 0
+    while True:
+        chunk = list(members.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'name', 'name_key')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        changed = [(key, pk) for key, pk, name_key in ((phonetic_key(name), pk, name_key) for pk, name, name_key in chunk)
+                   if key != name_key]
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, changed)
+            words.filter(member_id__in=[pk for _, pk in changed]).delete()
+            words.bulk_create([MemberNameWord(member_id=pk, code=code) for key, pk in changed for code in sorted(set(key.split()))],
+                              batch_size=CHUNK_SIZE)
+        last_id = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0013_member_name_words'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_name_keys, migrations.RunPython.noop),
+    ]
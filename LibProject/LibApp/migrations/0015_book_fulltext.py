@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:10
+
+from django.db import migrations
+
+# The FULLTEXT indexes of the book search on MySQL, see search.py. SQLite's
+# FTS5 table and triggers are kept by the search backend itself. Databases
+# that got the indexes from the former post_migrate hook keep them
+FULLTEXT_INDEXES = [
+    ('book_title_fulltext', 'title'),
+    ('book_author_fulltext', 'author'),
+]
+
+def existing_fulltext_indexes(cursor):
+    cursor.execute(
+        'SELECT index_name FROM information_schema.statistics '
+        'WHERE table_schema = DATABASE() AND table_name = %s AND index_type = %s',
+        ['LibApp_book', 'FULLTEXT'],
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+def create_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        existing = existing_fulltext_indexes(cursor)
+    for name, column in FULLTEXT_INDEXES:
+        if name not in existing:
+            schema_editor.execute(f'ALTER TABLE `LibApp_book` ADD FULLTEXT INDEX `{name}` (`{column}`)')
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        existing = existing_fulltext_indexes(cursor)
+    for name, column in FULLTEXT_INDEXES:
+        if name in existing:
+            schema_editor.execute(f'ALTER TABLE `LibApp_book` DROP INDEX `{name}`')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LibApp', '0014_backfill_name_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
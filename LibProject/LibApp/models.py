@@ -1,20 +1,65 @@
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 
 # Create your models here.
+MAX_OUTSTANDING_DEBT = 500
+
+def loan_period():
+    return timedelta(days=getattr(settings, 'LOAN_PERIOD_DAYS', 14))
+
+class ActiveManager(models.Manager):
+    # Rows that are not soft-deleted. The default manager of books and members,
+    # so searches, lookups, forms and get_object_or_404 stop seeing a deleted
+    # row at once while purge.py removes its history in the background
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 # The library stock is taken, purchase of books to be handled by accountant not librarian
 class Book(models.Model):
     title = models.CharField(max_length=100)
     author = models.CharField(max_length=100)    
     isbn = models.CharField(max_length=17, unique=True)  # Assuming ISBN-13 format      
+    # The ISBN as a bare ISBN-13 whatever form it was entered in, empty when it
+    # is not a valid ISBN. Every ISBN match goes through it, see isbn.py
+    isbn13 = models.CharField(max_length=13, unique=True, null=True, blank=True, editable=False)
     quantity_available = models.PositiveIntegerField(default=0)
     quantity_total = models.PositiveIntegerField(default=0)
+    # Set by purge.soft_delete, the row goes once its history is purged
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author'], name='book_author_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author}"
 
+    def save(self, *args, **kwargs):
+        # Move the dashboard counters by the difference to the saved copies
+        from .isbn import normalize_isbn
+        from .stats import adjust
+        self.isbn13 = normalize_isbn(self.isbn)
+        with transaction.atomic():
+            old = None
+            if not self._state.adding:
+                old = Book.objects.select_for_update().filter(pk=self.pk).values('quantity_available', 'quantity_total').first()
+            available, total = (old['quantity_available'], old['quantity_total']) if old else (0, 0)
+            super().save(*args, **kwargs)
+            adjust({
+                'copies_available': self.quantity_available - available,
+                'books_on_loan': (self.quantity_total - self.quantity_available) - (total - available),
+            })
+
 class Purchases(models.Model):
     title = models.CharField(max_length=100)
     author = models.CharField(max_length=100)    
@@ -26,35 +71,91 @@ class Purchases(models.Model):
         return f"Purchase of {self.quantity_purchased} {self.title} by {self.author} on {self.date}"
 
     def save(self, *args, **kwargs):
-        # Check if a book with the provided ISBN exists
-        existing_book = Book.objects.filter(isbn=self.isbn).first()
-
-        if existing_book:
-            # If the book exists, update its quantity_available and quantity_total
-            existing_book.quantity_available += self.quantity_purchased
-            existing_book.quantity_total += self.quantity_purchased
-            existing_book.save()
-        else:
-            # If the book doesn't exist, create a new Book instance
-            new_book = Book.objects.create(
-                title=self.title,
-                author=self.author,
-                isbn=self.isbn,
-                quantity_available=self.quantity_purchased,
-                quantity_total=self.quantity_purchased
-            )
-            new_book.save()
-
-        super().save(*args, **kwargs)
+        from .isbn import book_key
+        from .search_cache import invalidate
+        from .stats import adjust
+        # The book is matched by its ISBN-13, whichever form either was entered in
+        book = Book.objects.filter(**book_key(self.isbn))
+        # Add the copies to an existing book with one column-limited UPDATE so
+        # concurrent purchases of the same ISBN can't overwrite each other
+        add_copies = {
+            'quantity_available': F('quantity_available') + self.quantity_purchased,
+            'quantity_total': F('quantity_total') + self.quantity_purchased,
+        }
+        with transaction.atomic():
+            if book.update(**add_copies):
+                adjust({'copies_available': self.quantity_purchased})
+                # update() sends no signals, cached searches show the old stock
+                invalidate(Book)
+            else:
+                try:
+                    # If the book doesn't exist, create a new Book instance
+                    with transaction.atomic():
+                        Book.objects.create(
+                            title=self.title,
+                            author=self.author,
+                            isbn=self.isbn,
+                            quantity_available=self.quantity_purchased,
+                            quantity_total=self.quantity_purchased
+                        )
+                except IntegrityError:
+                    # Another purchase created it in the meantime, add to that
+                    # one. Or the ISBN is a deleted book still being purged
+                    if not book.update(**add_copies):
+                        raise ValidationError("This ISBN belongs to a deleted book that is still being purged.")
+                    adjust({'copies_available': self.quantity_purchased})
+                    invalidate(Book)
+
+            super().save(*args, **kwargs)
     
 class Member(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
     member_id = models.CharField(max_length=10, unique=True)
     outstanding_debt = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    # The Soundex codes of the name's words, empty until backfilled. Name
+    # searches go through their MemberNameWord rows, see phonetic.py
+    name_key = models.CharField(max_length=250, null=True, blank=True, editable=False)
+    # Set by purge.soft_delete, the row goes once its history is purged
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        # Member search matches these columns by prefix
+        indexes = [
+            models.Index(fields=['name'], name='member_name_idx'),
+            models.Index(fields=['email'], name='member_email_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} - {self.member_id}"
+
+    def save(self, *args, **kwargs):
+        from .phonetic import phonetic_key, set_name_words
+        from .stats import adjust
+        name_key = phonetic_key(self.name)
+        renamed = self._state.adding or name_key != self.name_key
+        self.name_key = name_key
+        with transaction.atomic():
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if renamed:
+                set_name_words(self)
+            if adding:
+                adjust({'active_members': 1, 'outstanding_debt': self.outstanding_debt})
+
+class MemberNameWord(models.Model):
+    # The Soundex code of one word of a member's name, one row per distinct
+    # code. Names are searched by any of their words through the code index
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='name_words')
+    code = models.CharField(max_length=4)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['code', 'member'], name='member_name_word_idx'),
+        ]
     
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
@@ -68,22 +169,257 @@ class Transaction(models.Model):
     fee_charged = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    class Meta:
+        # Type and date filters, a member's history in date order and a book's
+        # issues or returns. The composites also serve the foreign key lookups
+        indexes = [
+            models.Index(fields=['transaction_type'], name='transaction_type_idx'),
+            models.Index(fields=['transaction_date'], name='transaction_date_idx'),
+            models.Index(fields=['member', 'transaction_date'], name='transaction_member_date_idx'),
+            models.Index(fields=['book', 'transaction_type'], name='transaction_book_type_idx'),
+        ]
+
+    # Copies of the book an issue takes out and a return brings back
+    STOCK_CHANGES = {'issue': -1, 'return': 1}
+
     def save(self, *args, **kwargs):
-        if self.transaction_type == 'issue':
-            if self.member.outstanding_debt + self.fee_charged - self.amount_paid > 500:
-                raise ValidationError("Transaction cannot be saved. Outstanding debt cannot exceed 500.")
-        
-        super().save(*args, **kwargs)
-        
-        # Update outstanding_debt after saving the transaction if transaction type is 'issue'
-        if self.transaction_type == 'issue':
-            self.member.outstanding_debt += self.fee_charged - self.amount_paid
-            self.member.save()
-
-        # Adjust quantity_available based on transaction type
-        if self.transaction_type == 'issue':
-            self.book.quantity_available -= 1
-        elif self.transaction_type == 'return':
-            self.book.quantity_available += 1
-        
-        self.book.save()
\ No newline at end of file
+        # Stock and debt are changed by UPDATE statements that carry their limit
+        # in the WHERE clause, so concurrent desks can neither lose an update nor
+        # issue past zero copies or over the debt cap. Book is updated before
+        # Member on every path to keep the row lock order consistent, the
+        # dashboard counters are moved last in the same transaction. A new
+        # transaction moves the stock and, for an issue, the debt; an edit moves
+        # only what its change of type, book or fee changes
+        from .stats import adjust, issues_key
+        adding = self._state.adding
+        with transaction.atomic():
+            stock_changes, debt_change = {}, 0
+            if adding:
+                stock_changes[self.book_id] = self.STOCK_CHANGES.get(self.transaction_type, 0)
+                if self.transaction_type == 'issue':
+                    debt_change = self.fee_charged - self.amount_paid
+            else:
+                old_type, old_book_id, old_fee = (Transaction.objects.select_for_update().filter(pk=self.pk)
+                                                  .values_list('transaction_type', 'book_id', 'fee_charged').get())
+                if (old_type, old_book_id) != (self.transaction_type, self.book_id):
+                    stock_changes[old_book_id] = -self.STOCK_CHANGES.get(old_type, 0)
+                    stock_changes[self.book_id] = (stock_changes.get(self.book_id, 0)
+                                                   + self.STOCK_CHANGES.get(self.transaction_type, 0))
+                if self.transaction_type == 'issue':
+                    debt_change = self.fee_charged - old_fee
+
+            for book_id, change in sorted(stock_changes.items()):
+                if change < 0 and not Book.objects.filter(pk=book_id, quantity_available__gte=-change).update(
+                        quantity_available=F('quantity_available') + change):
+                    raise ValidationError("Transaction cannot be saved. No copies of this book are available.")
+                if change > 0:
+                    Book.objects.filter(pk=book_id).update(quantity_available=F('quantity_available') + change)
+            if debt_change and not Member.objects.filter(
+                    pk=self.member_id, outstanding_debt__lte=MAX_OUTSTANDING_DEBT - debt_change).update(
+                    outstanding_debt=F('outstanding_debt') + debt_change):
+                raise ValidationError(f"Transaction cannot be saved. Outstanding debt cannot exceed {MAX_OUTSTANDING_DEBT}.")
+
+            super().save(*args, **kwargs)
+
+            # A new issue opens a loan, a new return closes the member's
+            # oldest open loan of the book
+            if adding and self.transaction_type == 'issue':
+                Loan.objects.create(book_id=self.book_id, member_id=self.member_id, issued_at=self.transaction_date,
+                                    due_at=self.transaction_date + loan_period())
+            elif adding and self.transaction_type == 'return':
+                loan_id = (Loan.objects.select_for_update().open().filter(book_id=self.book_id, member_id=self.member_id)
+                           .order_by('issued_at', 'pk').values_list('pk', flat=True).first())
+                if loan_id:
+                    Loan.objects.filter(pk=loan_id).update(returned_at=self.transaction_date)
+
+            copies_change = sum(stock_changes.values())
+            adjust({'books_on_loan': -copies_change, 'copies_available': copies_change, 'outstanding_debt': debt_change,
+                    issues_key(): 1 if adding and self.transaction_type == 'issue' else 0})
+
+        # Mirror the change on the related instances already loaded
+        if Transaction.member.is_cached(self):
+            self.member.outstanding_debt += debt_change
+        if Transaction.book.is_cached(self):
+            self.book.quantity_available += stock_changes.get(self.book_id, 0)
+
+    def delete(self, *args, **kwargs):
+        from .search_cache import invalidate
+        result = super().delete(*args, **kwargs)
+        invalidate(Transaction)
+        return result
+
+class ArchivedTransaction(models.Model):
+    # Transactions older than the archive horizon, moved here by
+    # archive_transactions with their ids. Searches and exports read them only
+    # when asked to. No foreign key constraints: on MySQL the table is
+    # partitioned by date, and partitioned tables cannot have any
+    id = models.BigIntegerField(primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_constraint=False, related_name='archived_transactions')
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, db_constraint=False, related_name='archived_transactions')
+    transaction_type = models.CharField(max_length=10, choices=Transaction.TRANSACTION_TYPES)
+    transaction_date = models.DateTimeField()
+    fee_charged = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        # The searches and history filters of Transaction
+        indexes = [
+            models.Index(fields=['transaction_type'], name='archived_type_idx'),
+            models.Index(fields=['transaction_date'], name='archived_date_idx'),
+            models.Index(fields=['member', 'transaction_date'], name='archived_member_date_idx'),
+            models.Index(fields=['book', 'transaction_type'], name='archived_book_type_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.transaction_type} of {self.book_id} by {self.member_id} on {self.transaction_date:%Y-%m-%d}"
+
+class LoanQuerySet(models.QuerySet):
+    def open(self):
+        return self.filter(returned_at__isnull=True)
+
+class Loan(models.Model):
+    # A copy of a book out with a member: opened by an issue transaction and
+    # closed by the member's return of the book. It answers "what does this
+    # member hold" and "who has this book" from an index instead of pairing
+    # the issues and returns of the whole history. Loans do not point at the
+    # transactions, so archiving history leaves them alone
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE)
+    issued_at = models.DateTimeField()
+    due_at = models.DateTimeField()
+    returned_at = models.DateTimeField(null=True, blank=True)
+    # Late fee added to the member's debt so far, see fees.accrue_fees
+    fee_accrued = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    objects = LoanQuerySet.as_manager()
+
+    class Meta:
+        # Open loans are the (member or book, NULL) prefix of these, the last
+        # one walks the open loans in member order for the nightly fee accrual
+        indexes = [
+            models.Index(fields=['member', 'returned_at'], name='loan_member_open_idx'),
+            models.Index(fields=['book', 'returned_at'], name='loan_book_open_idx'),
+            models.Index(fields=['returned_at', 'member'], name='loan_open_member_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} with {self.member_id} since {self.issued_at:%Y-%m-%d}"
+
+class PurgeJob(models.Model):
+    # Removal of a soft-deleted book's or member's history, worked through in
+    # batches by its purge_job task. purged out of total is its progress
+    KINDS = (
+        ('book', 'Book'),
+        ('member', 'Member'),
+    )
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.BigIntegerField()
+    requested_at = models.DateTimeField(auto_now_add=True)
+    # History rows when the delete was requested, and removed so far
+    total = models.PositiveIntegerField(default=0)
+    purged = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # The worker picks up the unfinished jobs
+        indexes = [
+            models.Index(fields=['finished_at'], name='purge_job_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Purge of {self.kind} {self.object_id}: {self.purged}/{self.total}"
+
+
+class Task(models.Model):
+    # A call queued for the run_tasks worker, see tasks
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+    name = models.CharField(max_length=50)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    # When a queued task may run; while running, when its claim lapses and
+    # another worker may take it over
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # The workers claim the due tasks, oldest first
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+class StatCounter(models.Model):
+    # One running total shown on the dashboard, maintained by stats.adjust
+    name = models.CharField(max_length=30, primary_key=True)
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Member)
+def update_autocomplete_index(sender, instance, **kwargs):
+    # Keep this process's search-as-you-type indexes current once the write commits
+    from .autocomplete import update_entry
+    transaction.on_commit(lambda: update_entry(sender, instance))
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Member)
+def remove_from_autocomplete_index(sender, instance, **kwargs):
+    from .autocomplete import remove_entry
+    # The primary key is cleared once the delete completes, capture it now
+    entry_id = instance.pk
+    transaction.on_commit(lambda: remove_entry(sender, entry_id))
+
+@receiver(pre_delete, sender=Book)
+def remove_book_from_stats(sender, instance, **kwargs):
+    # Deletes run in one transaction with their cascade, the counters join it.
+    # The instance may be stale, take the copies from the row being deleted.
+    # A soft-deleted book left the counters already, the manager skips it
+    from .stats import adjust
+    book = Book.objects.select_for_update().filter(pk=instance.pk).values('quantity_available', 'quantity_total').first()
+    if book:
+        adjust({
+            'copies_available': -book['quantity_available'],
+            'books_on_loan': -(book['quantity_total'] - book['quantity_available']),
+        })
+
+@receiver(pre_delete, sender=Member)
+def remove_member_from_stats(sender, instance, **kwargs):
+    from .stats import adjust
+    debt = Member.objects.select_for_update().filter(pk=instance.pk).values_list('outstanding_debt', flat=True).first()
+    if debt is not None:
+        adjust({'active_members': -1, 'outstanding_debt': -debt})
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def invalidate_search_cache(sender, instance, **kwargs):
+    from .search_cache import invalidate
+    invalidate(sender)
+
+@receiver(post_save, sender=Transaction)
+def invalidate_transaction_search_cache(sender, instance, **kwargs):
+    # Saving a transaction also moves the book's stock and the member's debt.
+    # Deletes invalidate in Transaction.delete: a delete receiver would stop the
+    # cascade from a book or member deleting their transactions in one query
+    from .search_cache import invalidate
+    invalidate(Transaction, Book, Member)
@@ -0,0 +1,85 @@
+import base64
+import json
+from django.conf import settings
+
+# Keyset pagination for the search endpoints. Pages are ordered by primary key,
+# or another unique column, and the cursor carries the last key returned, so
+# fetching page N costs the same index range scan as fetching page 1 and
+# nothing beyond one page is serialized.
+
+def get_page_size(data):
+    # Clamp the client supplied limit to the configured maximum
+    default_size = getattr(settings, 'SEARCH_PAGE_SIZE', 50)
+    max_size = getattr(settings, 'SEARCH_MAX_PAGE_SIZE', 200)
+    try:
+        page_size = int(data.get('limit', default_size))
+    except (TypeError, ValueError):
+        page_size = default_size
+    return max(1, min(page_size, max_size))
+
+def encode_cursor(values):
+    # The cursor is opaque to the client: a url-safe base64 encoded JSON list
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(token):
+    # No cursor means the first page; a malformed one raises ValueError
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or not values:
+        raise ValueError('Invalid cursor')
+    return values
+
+def keyset_page(queryset, cursor, page_size, key='pk'):
+    # Resume after the last key of the previous page and read one extra row to
+    # find out whether there is a further page. key is the primary key or a
+    # unique text column
+    rows = list(page_queryset(queryset, cursor, page_size, key))
+    return split_page(rows, page_size, key)
+
+async def akeyset_page(queryset, cursor, page_size, key='pk'):
+    # keyset_page for async views, through the async ORM
+    rows = [row async for row in page_queryset(queryset, cursor, page_size, key)]
+    return split_page(rows, page_size, key)
+
+async def akeyset_merge(querysets, cursor, page_size):
+    # akeyset_page over querysets of tables sharing one key sequence, such as
+    # transactions and archived transactions: a page is read from each and the
+    # rows merged in key order
+    rows = []
+    for queryset in querysets:
+        rows += [row async for row in page_queryset(queryset, cursor, page_size)]
+    rows.sort(key=row_id)
+    return split_page(rows, page_size)
+
+def page_queryset(queryset, cursor, page_size, key='pk'):
+    if cursor is not None:
+        if key == 'pk':
+            try:
+                last = int(cursor[0])
+            except (TypeError, ValueError):
+                raise ValueError('Invalid cursor')
+        elif isinstance(cursor[0], str):
+            last = cursor[0]
+        else:
+            raise ValueError('Invalid cursor')
+        queryset = queryset.filter(**{f'{key}__gt': last})
+    return queryset.order_by(key)[:page_size + 1]
+
+def split_page(rows, page_size, key='pk'):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([row_id(rows[-1]) if key == 'pk' else row_key(rows[-1], key)])
+    return rows, next_cursor
+
+def row_id(row):
+    # Rows are model instances or, for projected querysets, dicts
+    return row['id'] if isinstance(row, dict) else row.pk
+
+def row_key(row, key):
+    return row[key] if isinstance(row, dict) else getattr(row, key)
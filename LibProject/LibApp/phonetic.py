@@ -0,0 +1,145 @@
+import re
+import unicodedata
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+from .autocomplete import edit_distance, max_edits
+from .models import Member, MemberNameWord
+from .pagination import akeyset_page, split_page
+
+# Member names are searched by how they sound. Member.name_key holds the
+# Soundex code of every word of the name in order, 'Jon Smyth' and 'John Smith'
+# both being 'J500 S530', and each distinct code has a MemberNameWord row; both
+# are written by Member.save and for older rows by backfill_name_keys. A name
+# search reads the members having a word for each word typed from the code
+# index, the last word's code unpadded since it may be typed in part: the code
+# of the start of a word is the start of the word's.
+# Soundex is coarse, Jane and John share a code, so the candidates are refined:
+# the words typed must follow each other in the name, each a few typos from the
+# name's, as the fuzzy search allows, or for the last word the start of it.
+# Unless asked for sounds only, names containing the query match as well.
+
+CODES = {letter: digit for letters, digit in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6'))
+         for letter in letters}
+# Candidates read per query while filling a page
+READ_BATCH = 200
+
+UPDATE_SQL = 'UPDATE {member} SET name_key = %s WHERE id = %s'
+
+def name_words(name):
+    # Lowercase ASCII words, accents dropped; hyphens part words, apostrophes
+    # and other marks are left out of them
+    folded = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode('ascii').lower()
+    return [word for word in (re.sub('[^a-z]', '', part) for part in re.split(r'[\s-]+', folded)) if word]
+
+def soundex(word):
+    # American Soundex: the first letter and the codes of the next consonants,
+    # repeats of a code counting once unless a vowel separates them
+    return (sound_prefix(word) + '000')[:4]
+
+def sound_prefix(word):
+    # The Soundex code before it is padded with zeros
+    digits, previous = [], CODES.get(word[0])
+    for letter in word[1:]:
+        digit = CODES.get(letter)
+        if digit and digit != previous:
+            digits.append(digit)
+        if letter not in 'hw':
+            previous = digit
+    return (word[0].upper() + ''.join(digits))[:4]
+
+def phonetic_key(name):
+    return ' '.join(soundex(word) for word in name_words(name))
+
+def name_codes(name_key):
+    # The distinct codes of a name key, one MemberNameWord row each
+    return sorted(set((name_key or '').split()))
+
+def set_name_words(member):
+    # Write the MemberNameWord rows of a saved member's name_key
+    words = MemberNameWord.objects.using(member._state.db)
+    words.filter(member=member).delete()
+    words.bulk_create(MemberNameWord(member=member, code=code) for code in name_codes(member.name_key))
+
+def name_refinement(query, substring=True):
+    # The lookup of the candidates of a name query and a check of the names it
+    # finds, or None when the query has no words to sound out. substring has
+    # names containing the query match too, which no index can serve
+    words = name_words(query)
+    if not words:
+        return None
+    # Members with a word sounding like each word typed, the last one's code
+    # unpadded
+    lookup = Q()
+    for code in [soundex(word) for word in words[:-1]] + [sound_prefix(words[-1])]:
+        lookup &= Q(pk__in=MemberNameWord.objects.filter(code__gte=code, code__lt=code + '\uffff').values('member_id'))
+    text = query.strip().lower()
+    if substring:
+        lookup |= Q(name__icontains=query.strip())
+
+    def close(word, found):
+        return edit_distance(word, found, max_edits(word)) <= max_edits(word)
+
+    def sounds_like(found):
+        if not all(close(word, other) for word, other in zip(words[:-1], found)):
+            return False
+        last, other = words[-1], found[-1]
+        return other.startswith(last) or (soundex(other) == soundex(last) and close(last, other))
+
+    def matches(name):
+        if substring and text in name.lower():
+            return True
+        found = name_words(name)
+        return any(sounds_like(found[start:start + len(words)]) for start in range(len(found) - len(words) + 1))
+
+    return lookup, matches
+
+async def asearch_names(query, cursor, page_size, substring=True):
+    # One page of active members, in id order, whose name sounds like the
+    # query, or contains it, and the cursor of the next. Candidates are read a
+    # batch at a time until the page is full
+    lookup, matches = name_refinement(query, substring)
+    queryset = Member.objects.filter(lookup)
+    found = []
+    while len(found) <= page_size:
+        batch, next_cursor = await akeyset_page(queryset, cursor, READ_BATCH)
+        found += [member for member in batch if matches(member.name)]
+        if not next_cursor:
+            break
+        cursor = [batch[-1].pk]
+    return split_page(found[:page_size + 1], page_size)
+
+def backfill_name_keys(chunk_size=5000, progress=None):
+    # Fill in name_key and the name's words for every member whose key is
+    # missing or stale, a range of ids per database transaction. Returns the
+    # members updated; progress, if given, is called with the last id done
+    from .search_cache import invalidate
+    updated = fill_name_keys(Member.all_objects.all(), MemberNameWord.objects.all(), DEFAULT_DB_ALIAS, chunk_size, progress)
+    if updated:
+        invalidate(Member)
+    return updated
+
+def fill_name_keys(members, words, using, chunk_size=5000, progress=None):
+    # backfill_name_keys over querysets of every member and every name word, in
+    # the database using. Migration 0014 has a frozen copy of this and of the
+    # Soundex keys
+    members, words = members.using(using), words.using(using)
+    connection = connections[using]
+    updated, last_id = 0, 0
+    while True:
+        chunk = list(members.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'name', 'name_key')[:chunk_size])
+        if not chunk:
+            break
+        changed = [(key, pk) for key, pk, name_key in ((phonetic_key(name), pk, name_key) for pk, name, name_key in chunk)
+                   if key != name_key]
+        with transaction.atomic(using=connection.alias):
+            # One prepared UPDATE by primary key per member, as backfill_isbn13
+            with connection.cursor() as cursor:
+                cursor.executemany(UPDATE_SQL.format(member=connection.ops.quote_name(members.model._meta.db_table)), changed)
+            words.filter(member_id__in=[pk for _, pk in changed]).delete()
+            words.bulk_create([words.model(member_id=pk, code=code) for key, pk in changed for code in name_codes(key)],
+                              batch_size=chunk_size)
+        updated += len(changed)
+        last_id = chunk[-1][0]
+        if progress:
+            progress(last_id)
+    return updated
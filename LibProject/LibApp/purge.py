@@ -0,0 +1,94 @@
+import time
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import ArchivedTransaction, Book, Loan, Member, PurgeJob, Transaction, remove_book_from_stats, remove_member_from_stats
+from .tasks import enqueue
+
+# Deleting books and members. Deleting the row outright makes Django collect and
+# cascade every transaction, archived transaction and loan of it in the request
+# and in one database transaction, which for a popular book locks the history
+# tables for as long as it takes. Instead soft_delete marks the row deleted,
+# which hides it from every search through the default manager, and queues a
+# PurgeJob with a purge_job task. The task worker, or the purge_deleted command,
+# then deletes the history in short batches, recording its progress on the job,
+# and finally the row itself.
+
+DEFAULT_BATCH_SIZE = 1000
+# Seconds a purge task works before queueing the rest of the job as another
+# task, well within the claim's visibility timeout
+TASK_SECONDS = 30
+
+MODELS = {'book': Book, 'member': Member}
+
+def history(kind, object_id):
+    # What a delete of the row cascades to, each a fast single-statement delete
+    field = f'{kind}_id'
+    return [model.objects.filter(**{field: object_id}) for model in (Transaction, ArchivedTransaction, Loan)]
+
+def soft_delete(instance):
+    # Hide the book or member and queue the purge of its history. Returns the
+    # PurgeJob, or None when the row is already deleted
+    from .autocomplete import remove_entry
+    from .search_cache import invalidate
+    model = type(instance)
+    kind = model._meta.model_name
+    with transaction.atomic():
+        # The stats receivers of a real delete, taking the same row lock. The
+        # row is excluded from the counters from now on, as it is from count_stats
+        (remove_book_from_stats if model is Book else remove_member_from_stats)(model, instance)
+        if not model.objects.filter(pk=instance.pk).update(deleted_at=timezone.now()):
+            return None
+        job = PurgeJob.objects.create(kind=kind, object_id=instance.pk,
+                                      total=sum(queryset.count() for queryset in history(kind, instance.pk)))
+        enqueue('purge_job', job.pk)
+        # Transaction searches leave out the rows of deleted books and members
+        invalidate(model)
+        entry_id = instance.pk
+        transaction.on_commit(lambda: remove_entry(model, entry_id))
+    return job
+
+def purge_batch(job, batch_size=DEFAULT_BATCH_SIZE):
+    # Delete up to batch_size history rows of the job. Once there are none left
+    # delete the row itself and finish the job. Returns the rows deleted.
+    # Searches left the rows out since the soft delete, no cache goes stale
+    for queryset in history(job.kind, job.object_id):
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if ids:
+            with transaction.atomic():
+                deleted, _ = queryset.filter(pk__in=ids).delete()
+                PurgeJob.objects.filter(pk=job.pk).update(purged=F('purged') + deleted)
+            job.purged += deleted
+            return deleted
+
+    with transaction.atomic():
+        # Nothing refers to the row any more, the cascade finds nothing to collect
+        MODELS[job.kind].all_objects.filter(pk=job.object_id).delete()
+        job.finished_at = timezone.now()
+        PurgeJob.objects.filter(pk=job.pk).update(finished_at=job.finished_at)
+    return 0
+
+def purge_deleted(batch_size=DEFAULT_BATCH_SIZE, pause=0, progress=None):
+    # Work through every unfinished job, oldest first, sleeping `pause` seconds
+    # between batches. Returns the number of jobs finished. progress, if given,
+    # is called with the job after each batch
+    finished = 0
+    for job in PurgeJob.objects.filter(finished_at__isnull=True).order_by('pk'):
+        while not job.finished_at:
+            purge_batch(job, batch_size)
+            if progress:
+                progress(job)
+            if pause:
+                time.sleep(pause)
+        finished += 1
+    return finished
+
+def purge_task(job_id, batch_size=DEFAULT_BATCH_SIZE):
+    # The purge_job task: purge for up to TASK_SECONDS and queue the rest
+    job = PurgeJob.objects.filter(pk=job_id, finished_at__isnull=True).first()
+    deadline = time.monotonic() + TASK_SECONDS
+    while job and not job.finished_at:
+        purge_batch(job, batch_size)
+        if not job.finished_at and time.monotonic() > deadline:
+            enqueue('purge_job', job_id)
+            return
@@ -0,0 +1,81 @@
+import math
+import threading
+import time
+from django.conf import settings
+from django.http import JsonResponse
+from .metrics import REGISTRY
+
+# Rate limiting and load shedding for the expensive endpoints, configured by
+# RATE_LIMITS. Each endpoint class lists its URL names and has:
+# - a token bucket per client, refilled at 'rate' requests per second up to
+#   'burst'; a client with an empty bucket gets 429
+# - a cap of 'concurrency' requests of the class running at once in this
+#   process; past it requests get 503 at once rather than queueing for a
+#   database connection.
+# Both answers carry Retry-After. A client is its session, from the cookie so
+# no database is read, else its remote address: a script making up session
+# cookies gets a bucket per request, the concurrency cap still holds it. The
+# state lives in the middleware, one per process, like the request metrics.
+
+SHED_METRIC = 'libapp_requests_shed_total'
+REGISTRY.register_counter(SHED_METRIC, 'Requests refused by the rate limiter, by endpoint class and reason.')
+
+# Buckets kept before the ones refilled to full are dropped
+MAX_BUCKETS = 10000
+
+
+class Limiter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (endpoint class, client): (tokens, monotonic time of the count, time it is full again)
+        self._buckets = {}
+        self._running = {}
+
+    def take(self, key, rate, burst):
+        # Take a token from the client's bucket. Returns 0 when there was one,
+        # else the seconds until there is
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            if key not in self._buckets and len(self._buckets) >= MAX_BUCKETS:
+                self._buckets = {other: bucket for other, bucket in self._buckets.items() if bucket[2] > now}
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            return wait
+
+    def acquire(self, name, cap):
+        # Claim one of the cap running slots of an endpoint class, False when all are taken
+        with self._lock:
+            if self._running.get(name, 0) >= cap:
+                return False
+            self._running[name] = self._running.get(name, 0) + 1
+            return True
+
+    def release(self, name):
+        with self._lock:
+            self._running[name] -= 1
+
+
+def endpoint_class(url_name):
+    # The RATE_LIMITS entry limiting a view, as (name, limits), or None
+    for name, limits in getattr(settings, 'RATE_LIMITS', {}).items():
+        if url_name in limits['views']:
+            return name, limits
+    return None
+
+def client_key(request):
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session:
+        return f'session:{session}'
+    # Behind a proxy every client shares its address, put the proxy's own
+    # limits in front in that case
+    return f"addr:{request.META.get('REMOTE_ADDR')}"
+
+def refuse(name, reason, status, retry_after):
+    REGISTRY.increment(SHED_METRIC, endpoint=name, reason=reason)
+    response = JsonResponse({'error': 'Too many requests' if status == 429 else 'Server busy'}, status=status)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
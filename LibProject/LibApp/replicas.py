@@ -0,0 +1,134 @@
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+
+# Read replicas for the search, export and report traffic. Views decorated
+# with replica_reads read from one of the DATABASE_REPLICAS aliases, every
+# other read and every write goes to the primary ('default'). ReplicaRouter,
+# in DATABASE_ROUTERS, decides per query from the state of the request:
+# - one replica serves the whole request, so cursor pages stay consistent
+# - once the request writes, or inside a transaction, its reads go to the
+#   primary, so it sees its own changes whatever the replica lag
+# - a replica that can't be connected to is skipped for REPLICA_RETRY_SECONDS
+#   and its reads go to another replica or the primary.
+# Raw SQL picks its connection itself, through router.db_for_read.
+
+PRIMARY = 'default'
+
+# The read state of the request being served, None outside replica_reads.
+# Context variables are copied into the worker threads of the async ORM, so
+# the state is a mutable object every copy shares
+_reads = ContextVar('replica_reads', default=None)
+# Monotonic time until which a replica is left alone after a failed connection
+_down_until = {}
+
+
+class ReadState:
+    def __init__(self):
+        self.replica = None
+        self.pinned = False
+
+    def alias(self):
+        # The replica serving the request, picked on its first read
+        if self.pinned or transaction.get_connection(PRIMARY).in_atomic_block:
+            return PRIMARY
+        if self.replica is None or not available(self.replica):
+            replicas = [alias for alias in settings.DATABASE_REPLICAS if alias != self.replica]
+            random.shuffle(replicas)
+            self.replica = next((alias for alias in replicas if available(alias)), None)
+        return self.replica or PRIMARY
+
+
+def available(alias):
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        _down_until[alias] = time.monotonic() + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+        return False
+    return True
+
+
+def read_replica():
+    # Whether a replica served reads of the request being served
+    state = _reads.get()
+    return state is not None and state.replica is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _reads.get()
+        return state.alias() if state is not None else PRIMARY
+
+    def db_for_write(self, model, **hints):
+        # A write pins the rest of the request to the primary
+        state = _reads.get()
+        if state is not None:
+            state.pinned = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+def replica_reads(view):
+    # Serve the reads of a view, and of the response it streams, from a replica
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            state = ReadState()
+            token = _reads.set(state)
+            try:
+                response = await view(request, *args, **kwargs)
+            finally:
+                _reads.reset(token)
+            return stream_with(state, response)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = ReadState()
+            token = _reads.set(state)
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                _reads.reset(token)
+            return stream_with(state, response)
+    return wrapper
+
+def stream_with(state, response):
+    # A streamed body is read from the database as it is sent, after the view
+    # returned; each chunk is produced under the request's read state again
+    if response.streaming:
+        stream = astream_with if response.is_async else sync_stream_with
+        response.streaming_content = stream(state, response.streaming_content)
+    return response
+
+def sync_stream_with(state, content):
+    content = iter(content)
+    while True:
+        token = _reads.set(state)
+        try:
+            chunk = next(content)
+        except StopIteration:
+            return
+        finally:
+            _reads.reset(token)
+        yield chunk
+
+async def astream_with(state, content):
+    content = aiter(content)
+    while True:
+        token = _reads.set(state)
+        try:
+            chunk = await anext(content)
+        except StopAsyncIteration:
+            return
+        finally:
+            _reads.reset(token)
+        yield chunk
@@ -0,0 +1,169 @@
+import re
+from asgiref.sync import sync_to_async
+from django.db import connections, router
+from .models import Book
+from .pagination import encode_cursor
+
+# Full-text search over the book catalog. Title and author lookups go through a
+# text index instead of LIKE '%q%' scans: a FULLTEXT index on MySQL, created by
+# migration 0015, and an FTS5 table kept in sync by triggers on SQLite. Results
+# are ranked by relevance and paged with a (score, id) keyset cursor.
+
+BOOK_TABLE = Book._meta.db_table
+FTS_TABLE = f'{BOOK_TABLE}_fts'
+SEARCH_FIELDS = ('title', 'author')
+
+def tokenize(query):
+    # Keep letters and digits only so user input can never inject search operators
+    return re.findall(r'[^\W_]+', query.lower())
+
+
+class BookSearchBackend:
+    vendor = None
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def install(self):
+        # Create whatever index the backend needs that migrations can't keep,
+        # called after migrate
+        pass
+
+    def search(self, field, terms, cursor, page_size):
+        # Return one page of matching book ids in relevance order and the cursor
+        # of the following page, or None when this is the last one
+        raise NotImplementedError
+
+    def _page(self, rows, page_size):
+        # rows are (id, score) tuples, one more than the page size was requested
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor([rows[-1][1], rows[-1][0]])
+        return [row[0] for row in rows], next_cursor
+
+    def _decode(self, cursor):
+        try:
+            return float(cursor[0]), int(cursor[1])
+        except (IndexError, TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+
+
+class SQLiteFTS5Backend(BookSearchBackend):
+    vendor = 'sqlite'
+
+    def install(self):
+        triggers = [f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au']
+        with connections[self.using].cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name IN (%s, %s, %s, %s)", [FTS_TABLE, *triggers])
+            if len(cursor.fetchall()) == 4:
+                return
+
+            # A migration that rebuilds the book table drops its triggers with
+            # it, and the index misses every write since: start over
+            for trigger in triggers:
+                cursor.execute(f'DROP TRIGGER IF EXISTS "{trigger}"')
+            cursor.execute(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+
+            # External content table over the book rows, the triggers keep it current
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE "{FTS_TABLE}" USING fts5(title, author, '
+                f"content='{BOOK_TABLE}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER "{FTS_TABLE}_ai" AFTER INSERT ON "{BOOK_TABLE}" BEGIN '
+                f'INSERT INTO "{FTS_TABLE}" (rowid, title, author) VALUES (new.id, new.title, new.author); END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER "{FTS_TABLE}_ad" AFTER DELETE ON "{BOOK_TABLE}" BEGIN '
+                f'INSERT INTO "{FTS_TABLE}" ("{FTS_TABLE}", rowid, title, author) '
+                f"VALUES ('delete', old.id, old.title, old.author); END"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER "{FTS_TABLE}_au" AFTER UPDATE OF title, author ON "{BOOK_TABLE}" BEGIN '
+                f'INSERT INTO "{FTS_TABLE}" ("{FTS_TABLE}", rowid, title, author) '
+                f"VALUES ('delete', old.id, old.title, old.author); "
+                f'INSERT INTO "{FTS_TABLE}" (rowid, title, author) VALUES (new.id, new.title, new.author); END'
+            )
+            # Index the books that existed before the table was created
+            cursor.execute(f'INSERT INTO "{FTS_TABLE}" ("{FTS_TABLE}") VALUES (\'rebuild\')')
+
+    def search(self, field, terms, cursor, page_size):
+        # Every term is a prefix match restricted to the searched column, bm25
+        # rank is negative and lower is more relevant
+        match = '{%s} : (%s)' % (field, ' '.join('"%s"*' % term for term in terms))
+        sql = f'SELECT rowid, rank FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s'
+        params = [match]
+        if cursor is not None:
+            last_score, last_id = self._decode(cursor)
+            sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+            params += [last_score, last_score, last_id]
+        sql += ' ORDER BY rank, rowid LIMIT %s'
+        params.append(page_size + 1)
+
+        with connections[self.using].cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            return self._page(db_cursor.fetchall(), page_size)
+
+
+class MySQLFullTextBackend(BookSearchBackend):
+    # The FULLTEXT indexes on title and author come from migration 0015
+    vendor = 'mysql'
+
+    def search(self, field, terms, cursor, page_size):
+        # Boolean mode with every term required and prefix matched, the score
+        # is higher for more relevant rows
+        against = ' '.join('+%s*' % term for term in terms)
+        sql = (f'SELECT id, MATCH(`{field}`) AGAINST (%s IN BOOLEAN MODE) AS score FROM `{BOOK_TABLE}` '
+               f'WHERE MATCH(`{field}`) AGAINST (%s IN BOOLEAN MODE)')
+        params = [against, against]
+        if cursor is not None:
+            last_score, last_id = self._decode(cursor)
+            sql += ' HAVING score < %s OR (score = %s AND id > %s)'
+            params += [last_score, last_score, last_id]
+        sql += ' ORDER BY score DESC, id LIMIT %s'
+        params.append(page_size + 1)
+
+        with connections[self.using].cursor() as db_cursor:
+            db_cursor.execute(sql, params)
+            return self._page(db_cursor.fetchall(), page_size)
+
+
+class IcontainsBackend(BookSearchBackend):
+    # Fallback for databases without a text index implementation: substring
+    # matching of every term, paged by id
+
+    def search(self, field, terms, cursor, page_size):
+        queryset = Book.objects.all()
+        for term in terms:
+            queryset = queryset.filter(**{f'{field}__icontains': term})
+        if cursor is not None:
+            _, last_id = self._decode(cursor)
+            queryset = queryset.filter(pk__gt=last_id)
+        rows = [(book_id, 0) for book_id in queryset.order_by('pk').values_list('pk', flat=True)[:page_size + 1]]
+        return self._page(rows, page_size)
+
+
+BACKENDS = {backend.vendor: backend for backend in (SQLiteFTS5Backend, MySQLFullTextBackend)}
+
+def get_book_search_backend(using='default'):
+    backend_class = BACKENDS.get(connections[using].vendor, IcontainsBackend)
+    return backend_class(using)
+
+def search_books(field, query, cursor, page_size, using=None):
+    # Ranked page of Book instances matching every word of the query in the
+    # field, from the database the router reads books from unless given one
+    using = using or router.db_for_read(Book)
+    book_ids, next_cursor = get_book_search_backend(using).search(field, tokenize(query), cursor, page_size)
+    books = Book.objects.using(using).in_bulk(book_ids)
+    return [books[book_id] for book_id in book_ids if book_id in books], next_cursor
+
+async def asearch_books(field, query, cursor, page_size, using=None):
+    # search_books for async views. The text index is queried with raw SQL,
+    # which has no async API, so the search runs in a worker thread
+    return await sync_to_async(search_books)(field, query, cursor, page_size, using)
+
+def install_search_indexes(sender, using='default', **kwargs):
+    # post_migrate receiver creating the text index on the migrated database
+    if BOOK_TABLE in connections[using].introspection.table_names():
+        get_book_search_backend(using).install()
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .metrics import REGISTRY
+from .models import ArchivedTransaction, Book, Member, Transaction
+from .replicas import read_replica
+from .search import SEARCH_FIELDS, tokenize
+
+# Result cache in front of the search endpoints. Every model has a version
+# number in the cache and an entry's key includes the versions of the models
+# its results are read from, so a write to a model bumps its version and every
+# cached page built from the old data stops being found; nothing is deleted,
+# stale entries just expire. Works with any Django cache backend, the alias and
+# timeout come from SEARCH_CACHE_ALIAS and SEARCH_CACHE_TIMEOUT.
+# A replica can lag behind a write and still serve the rows from before it,
+# which would be cached under the version the write bumped. A bump therefore
+# also marks the model written for REPLICA_LAG_SECONDS, and a page read from a
+# replica while one of its models is marked is returned but not cached.
+
+# Transactions are listed with their book title and member name, and with the
+# archived ones when asked for
+ENDPOINT_MODELS = {
+    'book': (Book,),
+    'member': (Member,),
+    'transaction': (Transaction, Book, Member),
+    'transaction_archive': (Transaction, ArchivedTransaction, Book, Member),
+}
+
+REQUESTS_METRIC = 'libapp_search_cache_requests_total'
+REGISTRY.register_counter(REQUESTS_METRIC, 'Search result cache lookups by endpoint and result.')
+
+def get_cache():
+    return caches[getattr(settings, 'SEARCH_CACHE_ALIAS', 'default')]
+
+def version_key(model):
+    return f'search:version:{model._meta.label_lower}'
+
+def written_key(model):
+    return f'search:written:{model._meta.label_lower}'
+
+def initial_version():
+    # A version key can be evicted; starting again from the clock rather than
+    # from 1 keeps a new version from matching entries stored under an old one
+    return time.time_ns()
+
+def get_versions(cache, models):
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, initial_version())
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+def recently_written(cache, models):
+    # Whether a replica may not have caught up with a write to the models yet
+    return bool(cache.get_many([written_key(model) for model in models]))
+
+def bump_versions(models):
+    cache = get_cache()
+    # Marked before the bump, so no search sees the new version unmarked
+    cache.set_many({written_key(model): True for model in models}, getattr(settings, 'REPLICA_LAG_SECONDS', 5))
+    for model in models:
+        key = version_key(model)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, initial_version())
+
+def invalidate(*models):
+    # Bump now, and again once the write commits: a search running meanwhile
+    # still sees the old rows and could store them under the first bump
+    bump_versions(models)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump_versions(models))
+
+def normalize_query(field, query):
+    query = str(query)
+    if field in SEARCH_FIELDS:
+        # Full-text fields only ever match on the words
+        return ' '.join(tokenize(query))
+    # Prefix searches are case-insensitive
+    return query.lower()
+
+def cache_key(endpoint, versions, field, query, cursor, page_size):
+    request = json.dumps([field, normalize_query(field, query), cursor or None, page_size])
+    digest = hashlib.sha1(request.encode('utf-8')).hexdigest()
+    return f"search:{endpoint}:{'.'.join(map(str, versions))}:{digest}"
+
+def get_cached(endpoint, field, query, cursor, page_size):
+    # (key, cached response data or None, whether the models were written
+    # within the replica lag)
+    cache = get_cache()
+    models = ENDPOINT_MODELS[endpoint]
+    versions = get_versions(cache, models)
+    key = cache_key(endpoint, versions, field, query, cursor, page_size)
+    result = cache.get(key)
+    return key, result, result is None and recently_written(cache, models)
+
+async def cached_search(endpoint, field, query, cursor, page_size, compute):
+    # Return the response data of one search page, awaiting compute() on a
+    # miss. Errors raised by compute(), and pages a replica may have read
+    # from before a write, are not cached. Cache backends are synchronous
+    # underneath, the version and entry reads share one thread hop
+    key, result, written = await sync_to_async(get_cached)(endpoint, field, query, cursor, page_size)
+    if result is not None:
+        REGISTRY.increment(REQUESTS_METRIC, endpoint=endpoint, result='hit')
+        return result
+    REGISTRY.increment(REQUESTS_METRIC, endpoint=endpoint, result='miss')
+    result = await compute()
+    if written and read_replica():
+        return result
+    await get_cache().aset(key, result, getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300))
+    return result
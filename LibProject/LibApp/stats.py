@@ -0,0 +1,73 @@
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from .models import Book, Member, Transaction, StatCounter
+
+# Dashboard statistics kept as running totals. Every write that changes stock,
+# debt or membership moves the counters in its own database transaction, so
+# reading the dashboard is a primary key lookup of a handful of rows instead of
+# aggregates over the catalog and the transaction history. reconcile() recounts
+# everything and corrects any drift, run it periodically with reconcile_stats.
+
+COUNTERS = ('books_on_loan', 'copies_available', 'active_members', 'outstanding_debt')
+
+def issues_key(day=None):
+    # Issues are counted per day, one counter row each. Editing or deleting an
+    # issue recorded today is rare and left to reconcile
+    return f'issues:{(day or timezone.localdate()).isoformat()}'
+
+def adjust(changes):
+    # Add each change to its counter. Names are visited in order so concurrent
+    # writers always lock the counter rows in the same order
+    for name in sorted(changes):
+        change = changes[name]
+        if not change:
+            continue
+        if not StatCounter.objects.filter(name=name).update(value=F('value') + change):
+            try:
+                with transaction.atomic():
+                    StatCounter.objects.create(name=name, value=change)
+            except IntegrityError:
+                # Created by a concurrent writer, add to that row
+                StatCounter.objects.filter(name=name).update(value=F('value') + change)
+
+def get_stats():
+    today = issues_key()
+    values = dict(StatCounter.objects.filter(name__in=COUNTERS + (today,)).values_list('name', 'value'))
+    return {
+        'books_on_loan': int(values.get('books_on_loan', 0)),
+        'copies_available': int(values.get('copies_available', 0)),
+        'active_members': int(values.get('active_members', 0)),
+        'outstanding_debt': str(values.get('outstanding_debt', 0)),
+        'issues_today': int(values.get(today, 0)),
+    }
+
+def count_stats():
+    # The true values, aggregated from the tables
+    books = Book.objects.aggregate(available=Sum('quantity_available'), total=Sum('quantity_total'))
+    members = Member.objects.aggregate(count=Count('pk'), debt=Sum('outstanding_debt'))
+    midnight = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'books_on_loan': (books['total'] or 0) - (books['available'] or 0),
+        'copies_available': books['available'] or 0,
+        'active_members': members['count'],
+        'outstanding_debt': members['debt'] or 0,
+        issues_key(): Transaction.objects.filter(transaction_date__gte=midnight, transaction_type='issue').count(),
+    }
+
+def reconcile():
+    # Recount and overwrite the counters, returns {name: (recorded, actual)}
+    # for the ones that had drifted
+    with transaction.atomic():
+        names = COUNTERS + (issues_key(),)
+        for name in names:
+            StatCounter.objects.get_or_create(name=name)
+        # Lock the counters before counting: writers still running add their
+        # change to the recounted value once this commits
+        recorded = dict(StatCounter.objects.select_for_update().filter(name__in=names).values_list('name', 'value'))
+        drift = {}
+        for name, actual in count_stats().items():
+            if recorded[name] != actual:
+                drift[name] = (recorded[name], actual)
+                StatCounter.objects.filter(name=name).update(value=actual)
+    return drift
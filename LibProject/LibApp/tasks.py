@@ -0,0 +1,118 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Task
+
+# Background tasks kept in the database, so no broker is needed. enqueue()
+# adds a Task row in the caller's database transaction: the task exists only
+# if the work that asked for it committed. The run_tasks worker claims due
+# tasks and calls them. A claim is a conditional UPDATE that only one worker
+# wins, on any backend. It sets the task's available_at a visibility timeout
+# ahead; a worker that dies or overruns the timeout loses its claim and
+# another worker runs the task again. A task that raises is retried with
+# doubling delays until it has had max_attempts, then left failed with its
+# traceback. Tasks must be safe to run again, a lapsed claim runs one twice.
+
+# The tasks by name, each the dotted path of a function taking the task's
+# arguments. Only JSON serializable arguments survive the queue
+TASKS = {
+    'send_email': 'LibApp.tasks.send_email',
+    'purge_job': 'LibApp.purge.purge_task',
+}
+
+# Seconds before the first retry of a failed task, doubled for each further one
+RETRY_DELAY = 30
+# Due tasks a worker reads per claim attempt, the others may be claimed meanwhile
+CLAIM_BATCH = 20
+
+def enqueue(name, *args, delay=0, max_attempts=3, **kwargs):
+    # Queue a call of the task, to run once delay seconds have passed
+    if name not in TASKS:
+        raise ValueError(f'Unknown task {name!r}')
+    return Task.objects.create(name=name, args=list(args), kwargs=kwargs, max_attempts=max_attempts,
+                               available_at=timezone.now() + timedelta(seconds=delay))
+
+def visibility_timeout():
+    return getattr(settings, 'TASK_VISIBILITY_TIMEOUT', 300)
+
+def claim(timeout):
+    # The next due task, now running under this worker's claim, or None.
+    # Running tasks whose claim lapsed are due again
+    now = timezone.now()
+    due = Task.objects.filter(status__in=(Task.QUEUED, Task.RUNNING), available_at__lte=now)
+    while True:
+        tasks = list(due.order_by('available_at', 'pk')[:CLAIM_BATCH])
+        if not tasks:
+            return None
+        for task in tasks:
+            # Another worker claiming the task first moves its attempts on
+            if due.filter(pk=task.pk, attempts=task.attempts).update(
+                    status=Task.RUNNING, attempts=F('attempts') + 1, available_at=now + timedelta(seconds=timeout)):
+                task.status = Task.RUNNING
+                task.attempts += 1
+                return task
+
+def run_task(task):
+    # Call a claimed task and record the outcome, unless the claim lapsed and
+    # another worker holds it by now. Returns True when the task completed
+    mine = Task.objects.filter(pk=task.pk, status=Task.RUNNING, attempts=task.attempts)
+    if task.attempts > task.max_attempts:
+        # Its last attempt never came back
+        mine.update(status=Task.FAILED, finished_at=timezone.now(),
+                    last_error=task.last_error or 'The claim lapsed before the task finished')
+        return False
+    try:
+        import_string(TASKS[task.name])(*task.args, **task.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if task.attempts >= task.max_attempts:
+            mine.update(status=Task.FAILED, finished_at=timezone.now(), last_error=error)
+        else:
+            retry_at = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (task.attempts - 1))
+            mine.update(status=Task.QUEUED, available_at=retry_at, last_error=error)
+        return False
+    mine.update(status=Task.DONE, finished_at=timezone.now())
+    return True
+
+def run_due(workers=1, timeout=None):
+    # Run tasks until none is due, on `workers` threads each claiming its own.
+    # Returns (tasks completed, attempts failed)
+    timeout = timeout or visibility_timeout()
+
+    def drain():
+        completed = failed = 0
+        try:
+            while (task := claim(timeout)) is not None:
+                if run_task(task):
+                    completed += 1
+                else:
+                    failed += 1
+        finally:
+            if workers > 1:
+                # The pool's threads each opened connections of their own
+                connections.close_all()
+        return completed, failed
+
+    if workers == 1:
+        return drain()
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(lambda _: drain(), range(workers)))
+    return sum(completed for completed, _ in results), sum(failed for _, failed in results)
+
+def prune(days):
+    # Delete the tasks that completed more than days ago, failed ones are kept
+    cutoff = timezone.now() - timedelta(days=days)
+    return Task.objects.filter(status=Task.DONE, finished_at__lt=cutoff).delete()[0]
+
+def send_email(subject, body, from_email, to, html=None):
+    # from_email None sends from DEFAULT_FROM_EMAIL
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html:
+        message.attach_alternative(html, 'text/html')
+    message.send()
@@ -1,13 +1,33 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.views import LoginView, PasswordResetView
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse_lazy
 from django.contrib.auth.models import User
 from django.contrib.messages import error
-from .forms import SignupForm, PurchasesForm, BooksForm, MembersForm, TransactionsForm
+from .forms import SignupForm, PurchasesForm, BooksForm, MembersForm, TransactionsForm, QueuedPasswordResetForm
 from django.contrib.auth import login, authenticate
-from django.http import JsonResponse
-from . models import Purchases, Book, Member, Transaction
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.core.handlers.asgi import ASGIRequest
+from django.utils import timezone
+from django.db import transaction as db_transaction
+from django.db.models import F, Value
+from . models import Purchases, Book, Member, Transaction, ArchivedTransaction, Loan, PurgeJob
+from .pagination import get_page_size, decode_cursor, akeyset_page, akeyset_merge
+from .search import SEARCH_FIELDS, tokenize, asearch_books
+from .autocomplete import INDEXES as AUTOCOMPLETE_INDEXES, aget_index
+from .importer import READERS, import_manifest
+from .circulation import MAX_BATCH_SIZE, apply_batch
+from .exporter import EXPORTS, FORMATS, export_queryset, stream_export, astream_export
+from .stats import adjust as adjust_stats, get_stats
+from .metrics import REGISTRY as METRICS
+from .search_cache import cached_search
+from .lookups import LOOKUPS, MAX_LOOKUP_RESULTS, lookup as lookup_entries
+from .purge import soft_delete
+from .isbn import isbn_lookup, ahistory_isbn_lookup, stored_isbn_lookup
+from .phonetic import name_refinement, asearch_names
+from .replicas import replica_reads
+import io
 import json
 from django.core.exceptions import ValidationError
 
@@ -22,9 +42,21 @@ class CustomLoginView(LoginView):
     
 @login_required
 def lib_dashboard_view(request):    
-    return render(request, 'lib_dashboard.html')
+    return render(request, 'lib_dashboard.html', {'stats': get_stats()})
+
+def metrics(request):
+    # Request metrics of this process in the Prometheus text format
+    return HttpResponse(METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@login_required
+@replica_reads
+def dashboard_stats(request):
+    # Running totals kept by the writes, reading them never aggregates
+    return JsonResponse(get_stats())
 
 class CustomPasswordResetView(PasswordResetView):
+    # The mail is sent by the run_tasks worker
+    form_class = QueuedPasswordResetForm
     email_template_name = 'registration/password_reset_email.html'    
     template_name = 'registration/password_reset_form.html'
     success_url = reverse_lazy('password_reset_done')
@@ -57,7 +89,11 @@ def newbook(request):
     if request.method == 'POST':
         form = PurchasesForm(request.POST)
         if form.is_valid():
-            form.save() 
+            try:
+                form.save()
+            except ValidationError:
+                # The ISBN's book was deleted since the form was checked
+                return JsonResponse({'success': False})
             return JsonResponse({'success': True})
         else:
             # Form is not valid, return 'false'
@@ -67,36 +103,164 @@ def newbook(request):
 
     return render(request, 'newbook.html', {'form': form})
 
+def import_purchases(request):
+    if request.method == 'POST':
+        manifest = request.FILES.get('manifest')
+        if manifest is None:
+            return JsonResponse({'success': False, 'error_message': 'No manifest was uploaded.'}, status=400)
+
+        # The format follows the file extension unless it is given explicitly
+        file_format = request.POST.get('format') or (
+            'ndjson' if manifest.name.lower().endswith(('.ndjson', '.jsonl')) else 'csv')
+        if file_format not in READERS:
+            return JsonResponse({'success': False, 'error_message': 'Unknown manifest format.'}, status=400)
+
+        # Stream the upload through the importer rather than reading it into memory
+        try:
+            report = import_manifest(io.TextIOWrapper(manifest.file, encoding='utf-8-sig', newline=''), file_format)
+        except UnicodeDecodeError:
+            return JsonResponse({'success': False, 'error_message': 'The manifest is not UTF-8 text.'}, status=400)
+        return JsonResponse({'success': True, **report.as_dict()})
+
+    return render(request, 'importpurchases.html')
+
+@login_required
+@replica_reads
+def export(request, kind):
+    # Streamed dump of transactions, archived transactions, members or books,
+    # see exporter
+    if kind not in EXPORTS:
+        raise Http404('Unknown export')
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in FORMATS:
+        return JsonResponse({'error': 'Unknown format'}, status=400)
+    try:
+        rows = export_queryset(kind, **{name: request.GET.get(name) for name in ('since', 'until', 'member', 'book')},
+                               archived=request.GET.get('archived') in ('1', 'true'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Each handler needs an iterator of its own kind, given the other one
+    # Django reads the whole export into memory before sending it
+    stream = astream_export if isinstance(request, ASGIRequest) else stream_export
+    response = StreamingHttpResponse(stream(rows, kind, file_format), content_type=FORMATS[file_format])
+    filename = f"{kind}-{timezone.now():%Y%m%d}.{file_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 def search_book(request):
     return render(request, 'searchbook.html')
 
-def search_for_book(request):
+# Fields with a typo-tolerant search mode, the autocomplete index answering it
+FUZZY_BOOK_FIELDS = {'title': 'book_title', 'author': 'book_author'}
+FUZZY_MEMBER_FIELDS = {'name': 'member_name'}
+
+async def find_fuzzy(model, kind, search_query, data):
+    # The rows matching the query within a few typos, closest first, and their
+    # edit distances. One ranked page read from the in-memory index, there is
+    # no further page
+    if kind is None:
+        return [], {}
+    index = await aget_index(kind)
+    hits = index.fuzzy(search_query, limit=get_page_size(data))
+    rows = await model.objects.ain_bulk([hit['id'] for hit in hits])
+    return [rows[hit['id']] for hit in hits if hit['id'] in rows], {hit['id']: hit['distance'] for hit in hits}
+
+async def find_books(search_field, search_query, data):
+    # One page of the book search as response data, raises ValueError for a bad cursor
+    # Determine the field to search based on the selected option
+    page_key = 'pk'
+    if search_field in SEARCH_FIELDS and not tokenize(search_query):
+        # Nothing to match on, list the whole catalog
+        search_results = Book.objects.all()
+    elif search_field == 'isbn':
+        # ISBN-10, ISBN-13 and scanned barcodes alike, exact or by prefix and
+        # paged in ISBN order, straight off the index
+        match = isbn_lookup('isbn13', search_query)
+        if match is None:
+            # No valid ISBN, such as one stored with a wrong check digit.
+            # These are rare and paged by id, off the case-insensitive index
+            search_results = Book.objects.filter(**stored_isbn_lookup('isbn', search_query))
+        else:
+            search_results = Book.objects.filter(**match)
+            if match:
+                page_key = 'isbn13'
+    elif search_field not in SEARCH_FIELDS:
+        # If the selected field is not recognized, return an empty queryset
+        search_results = Book.objects.none()
+    else:
+        # Title and author words go through the ranked full-text index
+        search_results = None
+
+    # Only one page of matches is read, resuming after the cursor
+    distances = {}
+    if data.get('fuzzy'):
+        # Typo-tolerant title and author search, ranked by edit distance
+        page, distances = await find_fuzzy(Book, FUZZY_BOOK_FIELDS.get(search_field), search_query, data)
+        next_cursor = None
+    elif search_results is None:
+        page, next_cursor = await asearch_books(search_field, search_query, decode_cursor(data.get('cursor')), get_page_size(data))
+    else:
+        page, next_cursor = await akeyset_page(search_results, decode_cursor(data.get('cursor')), get_page_size(data), page_key)
+
+    # Serialize the search results
+    serialized_results = [{'id': book.id, 'title': book.title, 'author': book.author,
+                            'isbn': book.isbn, 'quantity_available': book.quantity_available,
+                            **({'distance': distances[book.id]} if distances else {}),
+                            } for book in page]
+
+    return {'results': serialized_results, 'next_cursor': next_cursor}
+
+@replica_reads
+async def search_for_book(request):
     if request.method == 'POST':
         # Get the data from the request body
         data = json.loads(request.body.decode("utf-8"))
         search_query = data.get('q', '')
         search_field = data.get('field', 'title')
 
-        # Determine the field to search based on the selected option
-        if search_field == 'title':
-            search_results = Book.objects.filter(title__icontains=search_query)
-        elif search_field == 'author':
-            search_results = Book.objects.filter(author__icontains=search_query)
-        elif search_field == 'isbn':
-            search_results = Book.objects.filter(isbn__icontains=search_query)
-        else:
-            # If the selected field is not recognized, return an empty queryset
-            search_results = Book.objects.none()
+        if data.get('fuzzy'):
+            # The in-memory index is kept current by the writes, nothing to cache
+            return JsonResponse(await find_books(search_field, search_query, data))
 
-        # Serialize the search results
-        serialized_results = [{'id': book.id, 'title': book.title, 'author': book.author,
-                                'isbn': book.isbn, 'quantity_available': book.quantity_available,
-                                } for book in search_results]
+        # Repeated searches are answered from the result cache until a write
+        # changes the rows they were read from
+        try:
+            response_data = await cached_search('book', search_field, search_query, data.get('cursor'), get_page_size(data),
+                                          lambda: find_books(search_field, search_query, data))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
 
-        return JsonResponse({'results': serialized_results})
+        return JsonResponse(response_data)
     else:
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
+async def autocomplete(request):
+    # Search-as-you-type suggestions, answered from this process's in-memory index
+    kind = request.GET.get('kind', '')
+    if kind not in AUTOCOMPLETE_INDEXES:
+        return JsonResponse({'error': 'Unknown kind'}, status=400)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 20))
+    except ValueError:
+        limit = 10
+
+    index = await aget_index(kind)
+    suggestions = index.query(request.GET.get('q', ''), limit=limit)
+    return JsonResponse({'suggestions': suggestions})
+
+async def lookup(request):
+    # Book and member pickers of the transaction forms, matched by key or name
+    kind = request.GET.get('kind', '')
+    if kind not in LOOKUPS:
+        return JsonResponse({'error': 'Unknown kind'}, status=400)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), MAX_LOOKUP_RESULTS))
+    except ValueError:
+        limit = 10
+
+    return JsonResponse({'results': await lookup_entries(kind, request.GET.get('q', ''), limit=limit)})
+    
 def edit_book(request, book_id):
     book = get_object_or_404(Book, pk=book_id)
     
@@ -110,15 +274,17 @@ def edit_book(request, book_id):
     
     return render(request, 'editbook.html', {'form': form})
 
-def delete_book(request, book_id):
+async def delete_book(request, book_id):
     # Get the book object
-    book = get_object_or_404(Book, pk=book_id)
+    book = await aget_object_or_404(Book, pk=book_id)
     
-    # Delete the book
-    book.delete()
+    # Hide the book now, its history is purged in the background
+    job = await sync_to_async(soft_delete)(book)
+    if job is None:
+        raise Http404
     
     # Return a success response
-    return JsonResponse({'success': True})
+    return JsonResponse({'success': True, 'purge_job': job.pk})
 
 def newmember(request):
     if request.method == 'POST':
@@ -137,28 +303,95 @@ def newmember(request):
 def search_member(request):
     return render(request, 'searchmember.html')
 
-def search_for_member(request):
+# Members a member_id substring is resolved to before searching their history
+MAX_RESOLVED_MEMBERS = 500
+
+def match_lookup(field, data):
+    # Keys match anywhere in the value. With 'match': 'prefix' they match from
+    # the start instead, which the column's index answers without a scan
+    return f"{field}__{'istartswith' if data.get('match') == 'prefix' else 'icontains'}"
+
+async def amember_key_lookup(search_query, data):
+    # Filter arguments matching transactions by their member's member_id. A
+    # substring is looked for in the member table first, and while it matches
+    # few members their transactions are read off the member index. One that
+    # matches many is left to the join, walking the transactions in id order
+    # fills a page soonest then
+    if data.get('match') == 'prefix':
+        return {'member__member_id__istartswith': search_query}
+    member_ids = [pk async for pk in Member.all_objects.filter(member_id__icontains=search_query)
+                  .values_list('pk', flat=True)[:MAX_RESOLVED_MEMBERS + 1]]
+    if len(member_ids) <= MAX_RESOLVED_MEMBERS:
+        return {'member_id__in': member_ids}
+    return {'member__member_id__icontains': search_query}
+
+def matching_types(search_query, data):
+    # The transaction types match_lookup would match
+    query = search_query.lower()
+    return [value for value, _ in Transaction.TRANSACTION_TYPES
+            if (value.startswith(query) if data.get('match') == 'prefix' else query in value)]
+
+def cache_field(search_field, data):
+    # Prefix and substring searches are cached apart
+    return f'{search_field}:prefix' if data.get('match') == 'prefix' else search_field
+
+async def find_members(search_field, search_query, data):
+    # One page of the member search as response data, raises ValueError for a bad cursor
+    # Determine the field to search based on the selected option
+    search_results = None
+    if search_field == 'name':
+        # Names are matched by the sound of any of their words and, unless
+        # only prefixes are asked for, by substring; a query without letters
+        # by its characters
+        if name_refinement(search_query) is None:
+            search_results = Member.objects.filter(**{match_lookup('name', data): search_query})
+    elif search_field == 'email':
+        search_results = Member.objects.filter(**{match_lookup('email', data): search_query})
+    elif search_field == 'member_id':
+        search_results = Member.objects.filter(**{match_lookup('member_id', data): search_query})
+    else:
+        # If the selected field is not recognized, return an empty queryset
+        search_results = Member.objects.none()
+
+    # Only one page of matches is read, resuming after the cursor
+    distances = {}
+    if data.get('fuzzy'):
+        # Typo-tolerant name search, ranked by edit distance
+        page, distances = await find_fuzzy(Member, FUZZY_MEMBER_FIELDS.get(search_field), search_query, data)
+        next_cursor = None
+    elif search_results is None:
+        page, next_cursor = await asearch_names(search_query, decode_cursor(data.get('cursor')), get_page_size(data),
+                                                substring=data.get('match') != 'prefix')
+    else:
+        page, next_cursor = await akeyset_page(search_results, decode_cursor(data.get('cursor')), get_page_size(data))
+
+    # Serialize the search results
+    serialized_results = [{'id': member.id, 'name': member.name, 'email': member.email, 'member_id': member.member_id, 'debt': member.outstanding_debt,
+                           **({'distance': distances[member.id]} if distances else {})} for member in page]
+
+    return {'results': serialized_results, 'next_cursor': next_cursor}
+
+@replica_reads
+async def search_for_member(request):
     if request.method == 'POST':
         # Get the data from the request body
         data = json.loads(request.body.decode("utf-8"))
         search_query = data.get('q', '')
         search_field = data.get('field', 'name')
 
-        # Determine the field to search based on the selected option
-        if search_field == 'name':
-            search_results = Member.objects.filter(name__icontains=search_query)
-        elif search_field == 'email':
-            search_results = Member.objects.filter(email__icontains=search_query)
-        elif search_field == 'member_id':
-            search_results = Member.objects.filter(member_id__icontains=search_query)
-        else:
-            # If the selected field is not recognized, return an empty queryset
-            search_results = Member.objects.none()
+        if data.get('fuzzy'):
+            # The in-memory index is kept current by the writes, nothing to cache
+            return JsonResponse(await find_members(search_field, search_query, data))
 
-        # Serialize the search results
-        serialized_results = [{'id': member.id, 'name': member.name, 'email': member.email, 'member_id': member.member_id, 'debt': member.outstanding_debt} for member in search_results]
+        # Repeated searches are answered from the result cache until a write
+        # changes the rows they were read from
+        try:
+            response_data = await cached_search('member', cache_field(search_field, data), search_query, data.get('cursor'), get_page_size(data),
+                                          lambda: find_members(search_field, search_query, data))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
 
-        return JsonResponse({'results': serialized_results})
+        return JsonResponse(response_data)
     else:
         return JsonResponse({'error': 'Method not allowed'}, status=405)
 
@@ -176,15 +409,23 @@ def edit_member(request, member_id):
     
     return render(request, 'editmember.html', {'form': form})
 
-def delete_member(request, member_id):
-    # Get the book object
-    member = get_object_or_404(Member, pk=member_id)
+async def delete_member(request, member_id):
+    # Get the member object
+    member = await aget_object_or_404(Member, pk=member_id)
     
-    # Delete the book
-    member.delete()
+    # Hide the member now, their history is purged in the background
+    job = await sync_to_async(soft_delete)(member)
+    if job is None:
+        raise Http404
     
     # Return a success response
-    return JsonResponse({'success': True})
+    return JsonResponse({'success': True, 'purge_job': job.pk})
+
+async def purge_status(request, job_id):
+    # Progress of the background purge started by a delete
+    job = await aget_object_or_404(PurgeJob, pk=job_id)
+    return JsonResponse({'kind': job.kind, 'object_id': job.object_id, 'total': job.total, 'purged': job.purged,
+                         'finished': job.finished_at is not None})
 
 def newtransaction(request):
     if request.method == 'POST':
@@ -203,59 +444,136 @@ def newtransaction(request):
 
     return render(request, 'newtransaction.html', {'form': form})
 
+def batch_checkout(request):
+    if request.method == 'POST':
+        # Get the data from the request body
+        data = json.loads(request.body.decode("utf-8"))
+        items = data.get('items')
+        if not isinstance(items, list) or not 0 < len(items) <= MAX_BATCH_SIZE:
+            return JsonResponse({'success': False, 'error_message': f'Send between 1 and {MAX_BATCH_SIZE} items.'}, status=400)
+        try:
+            member_id = int(data.get('member'))
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'error_message': 'Member must be a member id.'}, status=400)
+
+        # Every item is applied in one database transaction, with a result per item
+        try:
+            results = apply_batch(member_id, items)
+        except Member.DoesNotExist:
+            return JsonResponse({'success': False, 'error_message': 'Member does not exist.'}, status=404)
+        return JsonResponse({'success': all(result['success'] for result in results), 'results': results})
+    else:
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
 def search_transaction(request):
     return render(request, 'searchtransaction.html')
 
-def search_for_transaction(request):
+async def find_transactions(search_field, search_query, data):
+    # One page of the transaction search as response data, raises ValueError for a bad cursor
+    # Determine the field to search based on the selected option
+    lookups = {
+        # The few types are matched here, the index is searched for them
+        'transaction_type': {'transaction_type__in': matching_types(search_query, data)},
+    }
+    if search_field == 'member':
+        lookups['member'] = await amember_key_lookup(search_query, data)
+    elif search_field == 'book':
+        # The book's ISBN in any form, exact or by prefix
+        lookups['book'] = await ahistory_isbn_lookup(search_query)
+    # Archived history is searched too only when asked for
+    models = (Transaction, ArchivedTransaction) if data.get('archived') else (Transaction,)
+    querysets = []
+    for model in models:
+        if search_field in lookups:
+            # Leaving out the history of deleted books and members until it is purged
+            search_results = model.objects.filter(**lookups[search_field],
+                                                  book__deleted_at__isnull=True, member__deleted_at__isnull=True)
+        else:
+            # If the selected field is not recognized, return an empty queryset
+            search_results = model.objects.none()
+
+        # Select only the serialized columns, with book title and member name
+        # joined in the same query instead of loaded per row
+        querysets.append(search_results.annotate(archived=Value(model is ArchivedTransaction)).values(
+            'id', 'book__title', 'member__name', 'transaction_type', 'transaction_date', 'fee_charged',
+            'amount_paid', 'archived'))
+
+    # Only one page of matches is read, resuming after the cursor
+    cursor = decode_cursor(data.get('cursor'))
+    page, next_cursor = await akeyset_merge(querysets, cursor, get_page_size(data))
+
+    # Serialize the search results
+    serialized_results = []
+    for result in page:
+        serialized_results.append({
+            'id': result['id'],
+            'book_title': result['book__title'],
+            'member_name': result['member__name'],
+            'transaction_type': result['transaction_type'],
+            'transaction_date': result['transaction_date'].strftime("%Y-%m-%d %H:%M:%S"),
+            'fee_charged': str(result['fee_charged']),
+            'amount_paid': str(result['amount_paid']),
+            'archived': bool(result['archived'])
+        })
+
+    return {'results': serialized_results, 'next_cursor': next_cursor}
+
+@replica_reads
+async def search_for_transaction(request):
     if request.method == 'POST':
         # Get the data from the request body
         data = json.loads(request.body.decode("utf-8"))
         search_query = data.get('q', '')
         search_field = data.get('field', 'book')
 
-        # Initialize search results variable
-        search_results = []
+        # Repeated searches are answered from the result cache until a write
+        # changes the rows they were read from
+        endpoint = 'transaction_archive' if data.get('archived') else 'transaction'
+        try:
+            response_data = await cached_search(endpoint, cache_field(search_field, data), search_query, data.get('cursor'), get_page_size(data),
+                                          lambda: find_transactions(search_field, search_query, data))
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
 
-        # Determine the field to search based on the selected option
-        if search_field == 'book':
-            search_results = Transaction.objects.filter(book__isbn__icontains=search_query)
-        elif search_field == 'member':
-            search_results = Transaction.objects.filter(member__member_id__icontains=search_query)
-        elif search_field == 'transaction_type':
-            search_results = Transaction.objects.filter(transaction_type__icontains=search_query)
-        else:
-            # If the selected field is not recognized, return an empty list
-            pass
-
-        # Serialize the search results
-        serialized_results = []
-        for result in search_results:
-            serialized_results.append({
-                'id': result.id,
-                'book_title': result.book.title,
-                'member_name': result.member.name,
-                'transaction_type': result.transaction_type,
-                'transaction_date': result.transaction_date.strftime("%Y-%m-%d %H:%M:%S"),
-                'fee_charged': str(result.fee_charged),
-                'amount_paid': str(result.amount_paid)
-            })
-
-        return JsonResponse({'results': serialized_results})
+        return JsonResponse(response_data)
     else:
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
-def delete_transaction(request, pk):
+async def delete_transaction(request, pk):
     # Get the transaction object
-    transaction = get_object_or_404(Transaction, pk=pk)
+    transaction = await aget_object_or_404(Transaction, pk=pk)
     
     # Delete the transaction
-    transaction.delete()
+    await transaction.adelete()
     
     # Return a success response
     return JsonResponse({'success': True})
 
+async def member_loans(request, member_id):
+    # Books the member holds now, read from the open loans index
+    loans = [{'loan_id': loan['pk'], 'book_id': loan['book_id'], 'isbn': loan['book__isbn'],
+              'title': loan['book__title'], 'issued_at': loan['issued_at'].strftime("%Y-%m-%d %H:%M:%S"),
+              'due_at': loan['due_at'].strftime("%Y-%m-%d %H:%M:%S"), 'fee_accrued': str(loan['fee_accrued'])}
+             async for loan in Loan.objects.open().filter(member_id=member_id).order_by('issued_at', 'pk')
+             .values('pk', 'book_id', 'book__isbn', 'book__title', 'issued_at', 'due_at', 'fee_accrued')]
+    # Only an empty answer needs telling apart from an unknown member
+    if not loans and not await Member.objects.filter(pk=member_id).aexists():
+        raise Http404
+    return JsonResponse({'loans': loans})
+
+async def book_loans(request, book_id):
+    # Members holding a copy of the book now, read from the open loans index
+    loans = [{'loan_id': loan['pk'], 'member_id': loan['member__member_id'], 'member_name': loan['member__name'],
+              'issued_at': loan['issued_at'].strftime("%Y-%m-%d %H:%M:%S"), 'due_at': loan['due_at'].strftime("%Y-%m-%d %H:%M:%S")}
+             async for loan in Loan.objects.open().filter(book_id=book_id).order_by('issued_at', 'pk')
+             .values('pk', 'member__member_id', 'member__name', 'issued_at', 'due_at')]
+    if not loans and not await Book.objects.filter(pk=book_id).aexists():
+        raise Http404
+    return JsonResponse({'loans': loans})
+
 def edit_transaction(request, pk):
     transaction = get_object_or_404(Transaction, pk=pk)
+    status = 200
     
     if request.method == 'POST':
         form = TransactionsForm(request.POST, instance=transaction)
@@ -263,17 +581,23 @@ def edit_transaction(request, pk):
             # Save the form to get the updated transaction data
             updated_transaction = form.save(commit=False)
             
-            # Calculate the change in outstanding debt
-            original_outstanding_debt = updated_transaction.member.outstanding_debt         
-            
-            # Update the outstanding debt
-            updated_transaction.member.outstanding_debt = original_outstanding_debt - updated_transaction.amount_paid            
-            updated_transaction.member.save()
+            # Apply the payment to the outstanding debt in the database rather
+            # than to a copy read earlier, and write only that column
+            try:
+                with db_transaction.atomic():
+                    Member.objects.filter(pk=updated_transaction.member_id).update(
+                        outstanding_debt=F('outstanding_debt') - updated_transaction.amount_paid)
+                    adjust_stats({'outstanding_debt': -updated_transaction.amount_paid})
 
-            # Save the updated transaction
-            updated_transaction.save()    
+                    # Save the updated transaction
+                    updated_transaction.save()
+            except ValidationError as error:
+                # No copies left for a changed book, or the debt cap; the
+                # payment is rolled back with it
+                form.add_error(None, error)
+                status = 400
         
     else:
         form = TransactionsForm(instance=transaction)
     
-    return render(request, 'edittransaction.html', {'form': form})
\ No newline at end of file
+    return render(request, 'edittransaction.html', {'form': form}, status=status)
\ No newline at end of file
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LibProject.settings')
 
 application = get_asgi_application()
+
+# Build the in-memory autocomplete indexes before serving requests
+from LibApp.autocomplete import warm_up
+
+warm_up()
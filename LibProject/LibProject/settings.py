@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'LibApp.middleware.MetricsMiddleware',
+    'LibApp.middleware.RateLimitMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,6 +72,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'LibProject.wsgi.application'
 
+# The search, lookup and delete views are async, served without a thread per
+# request when deployed on an ASGI server (uvicorn LibProject.asgi:application)
+ASGI_APPLICATION = 'LibProject.asgi.application'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
@@ -88,6 +94,17 @@ DATABASES = {
     }
 }
 
+# Searches, exports and reports read from the replicas named here, entries of
+# DATABASES such as 'replica1': {**DATABASES['default'], 'HOST': '10.0.0.12'};
+# with none everything is served by 'default'. See LibApp/replicas.py
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['LibApp.replicas.ReplicaRouter']
+# A replica that refused a connection is left alone this long
+REPLICA_RETRY_SECONDS = 30
+# How far the replicas may lag behind the primary; searches read from a replica
+# this soon after a write to their models are not cached
+REPLICA_LAG_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -133,3 +150,51 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = '/library/'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Mail and other slow work is queued as tasks in the database and run by the
+# run_tasks worker, see LibApp/tasks.py. A task still running this many
+# seconds after it was claimed is presumed lost and run again
+TASK_VISIBILITY_TIMEOUT = 300
+
+# Search endpoints return keyset paginated pages, clients may ask for a
+# different 'limit' up to the maximum
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 200
+
+# Search results are cached per page until a write to the models they were read
+# from, in any cache backend; point SEARCH_CACHE_ALIAS at a shared one (memcached,
+# redis) to share entries between worker processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+SEARCH_CACHE_ALIAS = 'default'
+SEARCH_CACHE_TIMEOUT = 300
+
+# Loans fall due LOAN_PERIOD_DAYS after issue, after that the nightly
+# accrue_fees job charges LATE_FEE_PER_DAY up to LATE_FEE_MAX per loan
+LOAN_PERIOD_DAYS = 14
+LATE_FEE_PER_DAY = '0.50'
+LATE_FEE_MAX = '20.00'
+
+# archive_transactions moves transactions older than this to the archive table
+ARCHIVE_AFTER_DAYS = 730
+
+# Per client token buckets (requests per second, burst) and per process caps
+# on the requests running at once, by endpoint class. A client past its rate
+# gets 429, a class at its cap 503, both with Retry-After. See LibApp/ratelimit.py
+RATE_LIMITS = {
+    'search': {
+        'views': ('search_for_book', 'search_for_member', 'search_for_transaction'),
+        'rate': 10,
+        'burst': 60,
+        'concurrency': 8,
+    },
+    'lookup': {
+        'views': ('autocomplete', 'lookup'),
+        'rate': 20,
+        'burst': 100,
+        'concurrency': 16,
+    },
+}
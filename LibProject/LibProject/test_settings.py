@@ -0,0 +1,23 @@
+import tempfile
+from pathlib import Path
+from .settings import *
+
+# The test suite on two SQLite databases standing in for the MySQL primary and
+# a read replica, no server needed:
+#     python manage.py test --settings=LibProject.test_settings
+# The replica is a database of its own. Tests of the replica routing name it in
+# DATABASE_REPLICAS, every other test reads and writes the primary only. The
+# files live in the temp directory, out of the tree, for the commands run with
+# these settings; the test runner itself uses in-memory databases
+TEST_DATA_DIR = Path(tempfile.gettempdir())
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': TEST_DATA_DIR / 'libproject-primary.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': TEST_DATA_DIR / 'libproject-replica.sqlite3',
+    },
+}
+DATABASE_REPLICAS = []
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LibProject.settings')
 
 application = get_wsgi_application()
+
+# Build the in-memory autocomplete indexes before serving requests
+from LibApp.autocomplete import warm_up
+
+warm_up()
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone as dt_timezone
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.archive import archive_transactions
+from LibApp.models import ArchivedTransaction, Book, Member, Transaction
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        quantity_available=5, quantity_total=5)
+        self.emma = Book.objects.create(title='Emma', author='Jane Austen', isbn='9780141439587',
+                                        quantity_available=5, quantity_total=5)
+        self.john = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+        self.jane = Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M1002')
+        # Transactions in 2021, 2022 and 2024, alternating between the books
+        self.ids = []
+        for n, year in enumerate((2021, 2024, 2022, 2021, 2024)):
+            transaction = Transaction.objects.create(book=(self.dune, self.emma)[n % 2], member=self.john,
+                                                     transaction_type='issue')
+            # transaction_date is auto_now_add, set it afterwards
+            Transaction.objects.filter(pk=transaction.pk).update(transaction_date=datetime(year, 6, 1, tzinfo=dt_timezone.utc))
+            self.ids.append(transaction.pk)
+        self.before = datetime(2023, 1, 1, tzinfo=dt_timezone.utc)
+
+    def search(self, **data):
+        response = self.client.post(reverse('search_for_transaction'), json.dumps(data), content_type='application/json')
+        return response.json()
+
+    def test_old_transactions_move_in_batches(self):
+        self.assertEqual(archive_transactions(self.before, batch_size=2), 3)
+        self.assertEqual(sorted(ArchivedTransaction.objects.values_list('pk', flat=True)), [self.ids[0], self.ids[2], self.ids[3]])
+        self.assertEqual(sorted(Transaction.objects.values_list('pk', flat=True)), [self.ids[1], self.ids[4]])
+        archived = ArchivedTransaction.objects.get(pk=self.ids[0])
+        self.assertEqual((archived.book, archived.member, archived.transaction_date.year), (self.dune, self.john, 2021))
+        # Nothing left to move
+        self.assertEqual(archive_transactions(self.before), 0)
+
+    def test_search_includes_the_archive_when_asked(self):
+        self.assertEqual(len(self.search(q='M1001', field='member')['results']), 5)
+        archive_transactions(self.before)
+
+        self.assertEqual([result['id'] for result in self.search(q='M1001', field='member')['results']], [self.ids[1], self.ids[4]])
+        # Merged in id order and paged across both tables
+        first = self.search(q='M1001', field='member', archived=True, limit=3)
+        self.assertEqual([(result['id'], result['archived']) for result in first['results']],
+                         [(self.ids[0], True), (self.ids[1], False), (self.ids[2], True)])
+        rest = self.search(q='M1001', field='member', archived=True, limit=3, cursor=first['next_cursor'])
+        self.assertEqual([result['id'] for result in rest['results']], [self.ids[3], self.ids[4]])
+        self.assertIsNone(rest['next_cursor'])
+
+        results = self.search(q='9780441', field='book', archived=True)['results']
+        self.assertEqual([result['book_title'] for result in results], ['Dune'] * 3)
+
+    def test_exports(self):
+        self.client.force_login(User.objects.create_user(username='auditor', password='password'))
+        Transaction.objects.filter(pk=self.ids[0]).update(member=self.jane)
+        archive_transactions(self.before)
+
+        response = self.client.get(reverse('export', args=['archived_transactions']), {'since': '2021-01-01', 'until': '2021-12-31'})
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([(row['id'], row['member_id']) for row in rows], [(str(self.ids[0]), 'M1002'), (str(self.ids[3]), 'M1001')])
+
+        # Members are selected through archived history only when asked
+        def members(**params):
+            response = self.client.get(reverse('export', args=['members']), {'format': 'ndjson', 'until': '2021-12-31', **params})
+            return [json.loads(line)['member_id'] for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(members(), [])
+        self.assertEqual(members(archived='1'), ['M1001', 'M1002'])
+
+    def test_deleting_a_book_deletes_its_archived_history(self):
+        archive_transactions(self.before)
+        self.dune.delete()
+        self.assertEqual(list(ArchivedTransaction.objects.values_list('pk', flat=True)), [self.ids[3]])
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('archive_transactions', before='2023-01-01', batch_size=1, stdout=output)
+        self.assertIn('3 transactions dated before 2023-01-01 archived', output.getvalue())
@@ -0,0 +1,70 @@
+import asyncio
+from asgiref.sync import iscoroutinefunction
+from django.core.handlers.asgi import ASGIHandler
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from LibApp import views
+from LibApp.metrics import REGISTRY
+from LibApp.models import Book, Member, Transaction
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        REGISTRY.reset()
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        quantity_available=2, quantity_total=2)
+        self.member = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+
+    def test_read_views_run_on_the_event_loop(self):
+        for view in (views.search_for_book, views.search_for_member, views.search_for_transaction,
+                     views.lookup, views.autocomplete, views.delete_book, views.delete_member, views.delete_transaction):
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+        # No middleware makes the ASGI handler run the chain in a thread
+        self.assertTrue(iscoroutinefunction(ASGIHandler()._middleware_chain))
+
+    async def test_search_through_the_async_orm(self):
+        response = await self.async_client.post(reverse('search_for_member'), {'q': 'john', 'field': 'name'},
+                                                content_type='application/json')
+        self.assertEqual([member['member_id'] for member in response.json()['results']], ['M1001'])
+
+        response = await self.async_client.post(reverse('search_for_book'), {'q': '978044', 'field': 'isbn'},
+                                                content_type='application/json')
+        self.assertEqual([book['isbn'] for book in response.json()['results']], ['9780441013593'])
+
+        # The metrics middleware counts queries run by the async ORM too
+        metrics = (await self.async_client.get(reverse('metrics'))).content.decode().splitlines()
+        self.assertIn('libapp_db_queries_per_request_sum{view="search_for_member"} 1', metrics)
+
+    @override_settings(RATE_LIMITS={})
+    async def test_requests_in_flight_count_their_own_queries(self):
+        # Run one after another, then together on the one ORM worker thread.
+        # None of the queries matches, so each search runs as many queries
+        async def search(view, q, field):
+            await self.async_client.post(reverse(view), {'q': q, 'field': field}, content_type='application/json')
+        searches = [('search_for_member', f'john{n}', 'member_id') for n in range(5)] + \
+                   [('search_for_transaction', f'z100{n}', 'member') for n in range(5)]
+        for view, q, field in searches:
+            await search(view, q, field)
+        metrics = (await self.async_client.get(reverse('metrics'))).content.decode().splitlines()
+        alone = [line for line in metrics if line.startswith('libapp_db_queries_per_request_sum')]
+
+        REGISTRY.reset()
+        await asyncio.gather(*(search(view, q + 'x', field) for view, q, field in searches))
+        metrics = (await self.async_client.get(reverse('metrics'))).content.decode().splitlines()
+        self.assertEqual([line for line in metrics if line.startswith('libapp_db_queries_per_request_sum')], alone)
+
+    async def test_lookups(self):
+        for kind, query, label in (('book', '978044', 'Dune by Frank Herbert'), ('member', 'joh', 'John Doe - M1001')):
+            response = await self.async_client.get(reverse('lookup'), {'kind': kind, 'q': query})
+            self.assertEqual([entry['label'] for entry in response.json()['results']], [label])
+
+    async def test_deletes(self):
+        transaction = await Transaction.objects.acreate(book=self.book, member=self.member, transaction_type='issue')
+        response = await self.async_client.post(reverse('delete_transaction', args=[transaction.pk]))
+        self.assertEqual(response.json(), {'success': True})
+        self.assertFalse(await Transaction.objects.filter(pk=transaction.pk).aexists())
+
+        response = await self.async_client.post(reverse('delete_book', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await Book.objects.filter(pk=self.book.pk).aexists())
+        response = await self.async_client.post(reverse('delete_book', args=[self.book.pk]))
+        self.assertEqual(response.status_code, 404)
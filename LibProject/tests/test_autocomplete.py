@@ -0,0 +1,115 @@
+import json
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.autocomplete import AutocompleteIndex, build_indexes, edit_distance, get_index
+from LibApp.models import Book, Member
+
+class AutocompleteIndexTests(TestCase):
+    def setUp(self):
+        self.index = AutocompleteIndex('test')
+        self.index.load([
+            (1, 'Sapiens: A Brief History of Humankind'),
+            (2, 'A Brief History of Time'),
+            (3, 'Homo Deus'),
+            (4, 'A Brief History of Time'),
+        ])
+
+    def labels(self, query):
+        return [suggestion['label'] for suggestion in self.index.query(query)]
+
+    def test_prefix_match_ranks_leading_matches_first(self):
+        self.assertEqual(self.labels('a brief'), ['A Brief History of Time', 'Sapiens: A Brief History of Humankind'])
+
+    def test_rows_sharing_a_label(self):
+        self.assertEqual([suggestion['id'] for suggestion in self.index.query('time')], [2])
+        self.assertEqual(sorted(suggestion['id'] for suggestion in self.index.query('time', distinct=False)), [2, 4])
+
+    def test_infix_match_uses_trigrams(self):
+        self.assertEqual(self.labels('piens'), ['Sapiens: A Brief History of Humankind'])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.labels('hist sap'), ['Sapiens: A Brief History of Humankind'])
+        self.assertEqual(self.labels('homo time'), [])
+
+    def test_add_and_remove_entries(self):
+        self.index.add(3, 'Homo Deus: A Brief History of Tomorrow')
+        self.assertIn('Homo Deus: A Brief History of Tomorrow', self.labels('tomorrow'))
+
+        self.index.remove(3)
+        self.assertEqual(self.labels('homo'), [])
+        self.assertEqual(self.index.stats()['entries'], 3)
+
+    def test_removing_a_duplicate_label_keeps_the_other(self):
+        self.index.remove(2)
+        self.assertEqual(self.labels('time'), ['A Brief History of Time'])
+
+    def test_fuzzy_match_ranks_by_edit_distance(self):
+        self.assertEqual([(hit['id'], hit['distance']) for hit in self.index.fuzzy('sapeins')], [(1, 1)])
+        self.assertEqual([hit['id'] for hit in self.index.fuzzy('brif histroy')], [2, 4, 1])
+        self.assertEqual([hit['distance'] for hit in self.index.fuzzy('homo dues')], [1])
+        # Short terms must be typed right, long ones can be two edits off
+        self.assertEqual(self.index.fuzzy('hm'), [])
+        self.assertEqual([hit['id'] for hit in self.index.fuzzy('humnakidn')], [1])
+        self.assertEqual(self.index.fuzzy('xyzzy'), [])
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('harari', 'harrari', 2), 1)
+        self.assertEqual(edit_distance('sapiens', 'sapeins', 2), 1)
+        self.assertEqual(edit_distance('kitten', 'sitting', 2), 3)
+
+class AutocompleteViewTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Sapiens', author='Yuval Noah Harari', isbn='9780062316097')
+        self.member = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+        build_indexes()
+
+    def test_suggestions_by_kind(self):
+        response = self.client.get(reverse('autocomplete'), {'kind': 'book_author', 'q': 'har'})
+        self.assertEqual(response.json()['suggestions'], [{'id': self.book.id, 'label': 'Yuval Noah Harari'}])
+
+        response = self.client.get(reverse('autocomplete'), {'kind': 'member_id', 'q': 'm10'})
+        self.assertEqual(response.json()['suggestions'], [{'id': self.member.id, 'label': 'M1001'}])
+
+    def test_unknown_kind(self):
+        response = self.client.get(reverse('autocomplete'), {'kind': 'email', 'q': 'john'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_signals_keep_the_index_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M1002')
+        self.assertEqual(get_index('member_name').query('jan')[0]['label'], 'Jane Smith')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.member.delete()
+        self.assertEqual(get_index('member_name').query('john'), [])
+
+class FuzzySearchViewTests(TestCase):
+    def setUp(self):
+        self.sapiens = Book.objects.create(title='Sapiens', author='Yuval Noah Harari', isbn='9780062316097')
+        Book.objects.create(title='Homo Deus', author='Yuval Noah Harari', isbn='9780062464316')
+        self.member = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+        build_indexes()
+
+    def search(self, endpoint, **data):
+        response = self.client.post(reverse(endpoint), json.dumps({**data, 'fuzzy': True}), content_type='application/json')
+        return response.json()
+
+    def test_books_by_title_and_author(self):
+        response = self.search('search_for_book', q='Sapeins', field='title')
+        self.assertEqual([(result['id'], result['distance']) for result in response['results']], [(self.sapiens.id, 1)])
+        self.assertIsNone(response['next_cursor'])
+        response = self.search('search_for_book', q='yuval harrari', field='author')
+        self.assertEqual(sorted(result['title'] for result in response['results']), ['Homo Deus', 'Sapiens'])
+        # ISBNs have no typo-tolerant mode
+        self.assertEqual(self.search('search_for_book', q='978', field='isbn')['results'], [])
+
+    def test_members_and_index_refresh(self):
+        self.assertEqual([result['id'] for result in self.search('search_for_member', q='jonh', field='name')['results']],
+                         [self.member.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.member.name = 'Johnny Doe'
+            self.member.save()
+        self.assertEqual(self.search('search_for_member', q='jonhny', field='name')['results'][0]['name'], 'Johnny Doe')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_member', args=[self.member.pk]))
+        self.assertEqual(self.search('search_for_member', q='jonhny', field='name')['results'], [])
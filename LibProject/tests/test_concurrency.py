@@ -0,0 +1,115 @@
+import threading
+from decimal import Decimal
+from unittest import skipIf
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase
+from LibApp.models import Book, Member, Transaction
+
+class InterleavedDeskTests(TestCase):
+    # Two desks that loaded the same book and member before either saved, the
+    # interleaving that lost updates when save wrote back what it had read.
+    # Runs on any database, the threaded tests below need a server one
+    def setUp(self):
+        self.book = Book.objects.create(title='Popular Book', author='Author', isbn='1234567890123',
+                                        quantity_available=1, quantity_total=1)
+        self.member = Member.objects.create(name='Member', email='member@example.com', member_id='M1',
+                                            outstanding_debt=Decimal('496'))
+
+    def desks(self, transaction_type, fee):
+        return [Transaction(book=Book.objects.get(pk=self.book.pk), member=Member.objects.get(pk=self.member.pk),
+                            transaction_type=transaction_type, fee_charged=fee) for _ in range(2)]
+
+    def test_the_last_copy_is_issued_once(self):
+        first, second = self.desks('issue', Decimal('1'))
+        first.save()
+        with self.assertRaisesMessage(ValidationError, 'No copies of this book are available'):
+            second.save()
+        self.book.refresh_from_db()
+        self.member.refresh_from_db()
+        self.assertEqual((self.book.quantity_available, self.member.outstanding_debt), (0, Decimal('497')))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_the_debt_cap_holds_across_desks(self):
+        Book.objects.filter(pk=self.book.pk).update(quantity_available=2)
+        first, second = self.desks('issue', Decimal('3'))
+        first.save()
+        with self.assertRaisesMessage(ValidationError, 'Outstanding debt cannot exceed'):
+            second.save()
+        self.book.refresh_from_db()
+        self.member.refresh_from_db()
+        self.assertEqual((self.book.quantity_available, self.member.outstanding_debt), (1, Decimal('499')))
+
+    def test_returns_add_up(self):
+        first, second = self.desks('return', 0)
+        first.save()
+        second.save()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity_available, 3)
+
+    def test_stress_command_needs_the_database_named(self):
+        with self.assertRaises(CommandError):
+            call_command('stress_circulation', database='production')
+
+
+# Desks run in their own threads with their own connections. SQLite test
+# databases live in a shared-cache memory database where concurrent writers fail
+# with table locks instead of waiting, so this only runs on a server database.
+@skipIf(connection.vendor == 'sqlite', 'Concurrent writers need a server database')
+class ConcurrentCirculationTests(TransactionTestCase):
+    desks = 8
+    issues_per_desk = 10
+
+    def setUp(self):
+        self.book = Book.objects.create(title='Popular Book', author='Author', isbn='1234567890123',
+                                        quantity_available=40, quantity_total=40)
+        self.members = [Member.objects.create(name=f'Member {i}', email=f'member{i}@example.com', member_id=f'M{i}')
+                        for i in range(self.desks)]
+
+    def run_desks(self, work):
+        errors = []
+
+        def desk(member):
+            try:
+                work(member)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=desk, args=(member,)) for member in self.members]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_issues_stop_at_zero_copies_without_drift(self):
+        def issue_books(member):
+            for _ in range(self.issues_per_desk):
+                try:
+                    Transaction.objects.create(book_id=self.book.pk, member_id=member.pk, transaction_type='issue', fee_charged=2)
+                except ValidationError:
+                    pass
+
+        self.run_desks(issue_books)
+
+        # 80 attempts on 40 copies: exactly 40 succeed and every one is charged once
+        self.book.refresh_from_db()
+        issued = Transaction.objects.filter(transaction_type='issue').count()
+        self.assertEqual(issued, 40)
+        self.assertEqual(self.book.quantity_available, 0)
+        self.assertEqual(Member.objects.aggregate(total=Sum('outstanding_debt'))['total'], 2 * issued)
+
+    def test_concurrent_issues_and_returns_balance(self):
+        def issue_and_return(member):
+            for _ in range(self.issues_per_desk):
+                Transaction.objects.create(book_id=self.book.pk, member_id=member.pk, transaction_type='issue')
+                Transaction.objects.create(book_id=self.book.pk, member_id=member.pk, transaction_type='return')
+
+        self.run_desks(issue_and_return)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity_available, 40)
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone as dt_timezone
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.exporter import export_queryset, stream_export
+from LibApp.models import Book, Member, Transaction
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='auditor', password='password'))
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        quantity_available=5, quantity_total=5)
+        self.emma = Book.objects.create(title='Emma', author='Jane Austen', isbn='9780141439587',
+                                        quantity_available=5, quantity_total=5)
+        self.john = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+        self.jane = Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M1002')
+        for day, book, member in ((1, self.dune, self.john), (10, self.emma, self.john), (20, self.dune, self.jane)):
+            transaction = Transaction.objects.create(book=book, member=member, transaction_type='issue', fee_charged=5)
+            # transaction_date is auto_now_add, set it afterwards
+            Transaction.objects.filter(pk=transaction.pk).update(
+                transaction_date=datetime(2024, 3, day, 12, tzinfo=dt_timezone.utc))
+
+    def export(self, kind, **params):
+        response = self.client.get(reverse('export', args=[kind]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_transactions_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('transactions'))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0], {
+            'id': str(Transaction.objects.order_by('pk').first().pk), 'transaction_date': '2024-03-01T12:00:00+00:00',
+            'transaction_type': 'issue', 'isbn': '9780441013593', 'title': 'Dune', 'member_id': 'M1001',
+            'member_name': 'John Doe', 'fee_charged': '5.00', 'amount_paid': '0.00',
+        })
+
+    def test_filters(self):
+        def isbns(**params):
+            return [row['isbn'] for row in csv.DictReader(io.StringIO(self.export('transactions', **params)))]
+        self.assertEqual(isbns(since='2024-03-10'), ['9780141439587', '9780441013593'])
+        # The last day is included
+        self.assertEqual(isbns(until='2024-03-10'), ['9780441013593', '9780141439587'])
+        self.assertEqual(isbns(member='M1001', book='9780441013593'), ['9780441013593'])
+
+        # Members and books are selected through their transactions
+        members = [json.loads(line)['member_id'] for line in self.export('members', format='ndjson', book='9780441013593').splitlines()]
+        self.assertEqual(members, ['M1001', 'M1002'])
+        books = [json.loads(line)['isbn'] for line in self.export('books', format='ndjson', member='M1001', since='2024-03-05').splitlines()]
+        self.assertEqual(books, ['9780141439587'])
+
+    def test_rows_are_read_in_keyset_chunks(self):
+        rows = export_queryset('transactions')
+        # Three chunks of one row each and the empty read that ends the export
+        with self.assertNumQueries(4):
+            lines = list(stream_export(rows, 'transactions', 'csv', chunk_size=1))
+        self.assertEqual(len(lines), 4)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get(reverse('export', args=['purchases'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', args=['books']), {'format': 'xml'}).status_code, 400)
+        response = self.client.get(reverse('export', args=['transactions']), {'since': '03/01/2024'})
+        self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('export', args=['books'])).status_code, 302)
+
+    async def test_asgi_responses_stream_asynchronously(self):
+        await self.async_client.aforce_login(await User.objects.aget(username='auditor'))
+        response = await self.async_client.get(reverse('export', args=['members']), {'format': 'ndjson'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual([json.loads(line)['member_id'] for line in content.splitlines()], ['M1001', 'M1002'])
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('export_data', 'books', stdout=output)
+        self.assertEqual(output.getvalue().splitlines()[0], 'id,isbn,title,author,quantity_available,quantity_total')
+        self.assertEqual(len(output.getvalue().splitlines()), 3)
@@ -0,0 +1,67 @@
+import io
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from LibApp.fees import accrue_fees
+from LibApp.loans import backfill_loans
+from LibApp.models import Book, Loan, Member, Transaction
+from LibApp.stats import get_stats, reconcile
+
+@override_settings(LOAN_PERIOD_DAYS=14, LATE_FEE_PER_DAY='0.50', LATE_FEE_MAX='5.00')
+class FeeAccrualTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        quantity_available=5, quantity_total=5)
+        self.john = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+        self.jane = Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M1002')
+        # Issued on March 1st and 3rd at noon, due on the 15th and 17th
+        for day, member in ((1, self.john), (3, self.john), (1, self.jane)):
+            Transaction.objects.create(book=self.book, member=member, transaction_type='issue')
+            issued_at = datetime(2024, 3, day, 12, tzinfo=dt_timezone.utc)
+            Loan.objects.filter(pk=Loan.objects.latest('pk').pk).update(issued_at=issued_at, due_at=issued_at + timedelta(days=14))
+        reconcile()
+
+    def debts(self):
+        return dict(Member.objects.values_list('member_id', 'outstanding_debt'))
+
+    def test_fees_follow_the_days_overdue(self):
+        # Not yet a whole day overdue at the start of the 16th
+        self.assertEqual(accrue_fees(date(2024, 3, 16)), (0, 0))
+
+        # 3 and 1 days overdue
+        self.assertEqual(accrue_fees(date(2024, 3, 19), chunk_size=1), (3, Decimal('3.50')))
+        self.assertEqual(self.debts(), {'M1001': Decimal('2.00'), 'M1002': Decimal('1.50')})
+        self.assertEqual(sorted(Loan.objects.values_list('fee_accrued', flat=True)), [Decimal('0.50'), Decimal('1.50'), Decimal('1.50')])
+
+        # Running again on the same day charges nothing
+        self.assertEqual(accrue_fees(date(2024, 3, 19)), (0, 0))
+        self.assertEqual(self.debts(), {'M1001': Decimal('2.00'), 'M1002': Decimal('1.50')})
+
+        # Missed nights are caught up, up to the cap, and returned loans stop
+        Transaction.objects.create(book=self.book, member=self.jane, transaction_type='return')
+        self.assertEqual(accrue_fees(date(2024, 5, 1)), (2, Decimal('8.00')))
+        self.assertEqual(self.debts(), {'M1001': Decimal('10.00'), 'M1002': Decimal('1.50')})
+
+        # The dashboard debt moved with the members'
+        self.assertEqual(get_stats()['outstanding_debt'], '11.50')
+        self.assertEqual(reconcile(), {})
+
+    def test_rebuilt_loans_keep_their_fees(self):
+        # The history the loans are rebuilt from has the same issue dates
+        for loan, pk in zip(Loan.objects.order_by('pk'), Transaction.objects.order_by('pk').values_list('pk', flat=True)):
+            Transaction.objects.filter(pk=pk).update(transaction_date=loan.issued_at)
+        self.assertEqual(accrue_fees(date(2024, 3, 19)), (3, Decimal('3.50')))
+
+        for _ in range(2):
+            self.assertEqual(backfill_loans(), 3)
+        self.assertEqual(sorted(Loan.objects.values_list('fee_accrued', flat=True)), [Decimal('0.50'), Decimal('1.50'), Decimal('1.50')])
+        # Nothing is charged twice
+        self.assertEqual(accrue_fees(date(2024, 3, 19)), (0, 0))
+        self.assertEqual(accrue_fees(date(2024, 3, 20)), (3, Decimal('1.50')))
+        self.assertEqual(self.debts(), {'M1001': Decimal('3.00'), 'M1002': Decimal('2.00')})
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('accrue_fees', date='2024-03-20', stdout=output)
+        self.assertIn('3 loans charged 5.00', output.getvalue())
@@ -0,0 +1,24 @@
+from io import StringIO
+from django.core.management import call_command
+from django.db.models import Count, Q, Sum
+from django.test import TestCase
+from LibApp.models import Book, Member, Transaction
+from LibApp.stats import reconcile
+
+class GenerateDataTests(TestCase):
+    def test_generated_history_matches_stock_and_counters(self):
+        call_command('generate_data', books=50, members=20, transactions=400, days=30, batch_size=64,
+                     stdout=StringIO())
+        self.assertEqual((Book.objects.count(), Member.objects.count()), (50, 20))
+        self.assertGreater(Transaction.objects.filter(transaction_type='issue').count(), 100)
+
+        # Copies out on loan are the issues that have not been returned yet
+        for book in Book.objects.annotate(
+                issues=Count('transaction', filter=Q(transaction__transaction_type='issue')),
+                returns=Count('transaction', filter=Q(transaction__transaction_type='return'))):
+            self.assertEqual(book.quantity_total - book.quantity_available, book.issues - book.returns)
+            self.assertGreaterEqual(book.quantity_available, 0)
+        for member in Member.objects.annotate(fees=Sum('transaction__fee_charged'), paid=Sum('transaction__amount_paid')):
+            self.assertEqual(member.outstanding_debt, (member.fees or 0) - (member.paid or 0))
+
+        self.assertTrue(all(recorded == actual for recorded, actual in reconcile().values()))
@@ -0,0 +1,72 @@
+import io
+import json
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.importer import import_manifest
+from LibApp.models import Book, Purchases
+
+class ImportManifestTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(title='Sapiens', author='Yuval Noah Harari', isbn='9780062316097',
+                                        quantity_available=2, quantity_total=3)
+
+    def test_csv_creates_new_books_and_restocks_existing_ones(self):
+        manifest = io.StringIO(
+            'title,author,isbn,quantity_purchased\n'
+            'Sapiens,Yuval Noah Harari,9780062316097,4\n'
+            'Homo Deus,Yuval Noah Harari,9780062464316,5\n'
+            'Homo Deus,Yuval Noah Harari,9780062464316,1\n'
+        )
+        report = import_manifest(manifest, 'csv')
+
+        self.assertEqual((report.rows, report.imported, report.books_created, report.books_updated), (3, 3, 1, 1))
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.quantity_available, self.book.quantity_total), (6, 7))
+        homo_deus = Book.objects.get(isbn='9780062464316')
+        self.assertEqual((homo_deus.quantity_available, homo_deus.quantity_total), (6, 6))
+        self.assertEqual(Purchases.objects.get(isbn='9780062464316').quantity_purchased, 6)
+
+    def test_invalid_lines_are_rejected_and_reported(self):
+        manifest = io.StringIO(
+            'title,author,isbn,quantity_purchased\n'
+            ',Nobody,9780000000001,1\n'
+            'Homo Deus,Yuval Noah Harari,9780062464316,many\n'
+            'On the Origin of Species,Charles Darwin,9780451529060,2\n'
+        )
+        report = import_manifest(manifest, 'csv')
+
+        self.assertEqual(report.imported, 1)
+        self.assertEqual(report.rejected, [
+            {'line': 2, 'error': 'Missing title'},
+            {'line': 3, 'error': 'quantity_purchased must be a whole number'},
+        ])
+
+    def test_ndjson_is_applied_in_chunks_with_a_bounded_query_count(self):
+        lines = [json.dumps({'title': f'Book {n}', 'author': 'Author', 'isbn': f'97800000000{n:02d}', 'quantity_purchased': 1})
+                 for n in range(20)]
+        lines.insert(3, '{not json')
+
+        # Per chunk: ISBN lookup, book insert, purchases lookup and insert, the
+        # dashboard counter and the reload of the created books, plus the
+        # savepoint and its release
+        with self.assertNumQueries(4 * 8):
+            report = import_manifest(io.StringIO('\n'.join(lines)), 'ndjson', chunk_size=6)
+
+        self.assertEqual(report.imported, 20)
+        self.assertEqual(report.rejected, [{'line': 4, 'error': 'Malformed line'}])
+        self.assertEqual(Book.objects.count(), 21)
+
+class ImportPurchasesViewTests(TestCase):
+    def test_upload_returns_the_report(self):
+        manifest = SimpleUploadedFile('manifest.csv', b'title,author,isbn,quantity_purchased\nSapiens,Harari,9780062316097,3\n')
+        response = self.client.post(reverse('import_purchases'), {'manifest': manifest})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(response.json()['imported'], 1)
+        self.assertEqual(Book.objects.get(isbn='9780062316097').quantity_available, 3)
+
+    def test_missing_upload(self):
+        response = self.client.post(reverse('import_purchases'))
+        self.assertEqual(response.status_code, 400)
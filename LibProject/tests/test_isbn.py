@@ -0,0 +1,107 @@
+import io
+import json
+from importlib import import_module
+from types import SimpleNamespace
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.importer import import_manifest
+from LibApp.isbn import backfill_isbn13, normalize_isbn
+from LibApp.models import Book, Member, Purchases, Transaction
+
+class NormalizeIsbnTests(TestCase):
+    def test_forms_of_the_same_isbn(self):
+        for value in ('9780441013593', '978-0-441-01359-3', ' 978 0441 013593 ', '0441013597', '0-441-01359-7',
+                      '978044101359352199'):
+            self.assertEqual(normalize_isbn(value), '9780441013593', value)
+        self.assertEqual(normalize_isbn('080442957X'), '9780804429573')
+        # Wrong check digits, too short, not a book
+        for value in ('9780441013590', '0441013590', '978044101', '5012345678900', 'ISBN', ''):
+            self.assertIsNone(normalize_isbn(value), value)
+
+class IsbnLookupTests(TestCase):
+    def setUp(self):
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='978-0-441-01359-3',
+                                        quantity_available=2, quantity_total=2)
+        Book.objects.create(title='Emma', author='Jane Austen', isbn='9780141439587', quantity_available=1, quantity_total=1)
+
+    def search(self, q, **data):
+        response = self.client.post(reverse('search_for_book'), json.dumps({'q': q, 'field': 'isbn', **data}),
+                                    content_type='application/json')
+        return [result['title'] for result in response.json()['results']]
+
+    def test_search_accepts_any_form(self):
+        self.assertEqual(self.dune.isbn13, '9780441013593')
+        for q in ('9780441013593', '0441013597', '0-441', '978-04410', '044'):
+            self.assertEqual(self.search(q), ['Dune'], q)
+        # In ISBN order, a page at a time
+        self.assertEqual(self.search('978'), ['Emma', 'Dune'])
+        response = self.client.post(reverse('search_for_book'), json.dumps({'q': '978', 'field': 'isbn', 'limit': 1}),
+                                    content_type='application/json')
+        self.assertEqual(self.search('978', limit=1, cursor=response.json()['next_cursor']), ['Dune'])
+        self.assertEqual(self.search('dune'), [])
+
+        response = self.client.get(reverse('lookup'), {'kind': 'book', 'q': '0 441 01359 7'})
+        self.assertEqual([result['id'] for result in response.json()['results']], [self.dune.pk])
+
+    def test_purchases_and_imports_match_existing_books(self):
+        Purchases.objects.create(title='Dune', author='Frank Herbert', isbn='0441013597', quantity_purchased=3)
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.quantity_total, 5)
+
+        report = import_manifest(io.StringIO('title,author,isbn,quantity_purchased\n'
+                                             'Dune,Frank Herbert,0-441-01359-7,1\n'
+                                             'Dune,Frank Herbert,9780441013593,1\n'
+                                             'Sapiens,Yuval Noah Harari,978-0-06-231609-7,1\n'
+                                             'Sapiens,Yuval Noah Harari,0062316095,1\n'), 'csv')
+        self.assertEqual((report.imported, report.books_created, report.books_updated), (4, 1, 1))
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.quantity_total, 7)
+        self.assertEqual(Book.objects.get(isbn13='9780062316097').quantity_total, 2)
+
+    def test_backfill(self):
+        Book.objects.update(isbn13=None)
+        Book.objects.bulk_create([Book(title='Dune', author='Frank Herbert', isbn='0441013597'),
+                                  Book(title='Old', author='Unknown', isbn='not an isbn')])
+        self.assertEqual(backfill_isbn13(chunk_size=1), (2, [(Book.objects.get(isbn='0441013597').pk, '0441013597')]))
+        # The ISBN-10 copy of Dune is a conflict, left empty like the invalid one
+        self.assertEqual(sorted(Book.objects.values_list('isbn13', flat=True), key=str),
+                         ['9780141439587', '9780441013593', None, None])
+
+        output = io.StringIO()
+        call_command('backfill_isbn13', stdout=output, stderr=io.StringIO())
+        self.assertIn('0 books updated', output.getvalue())
+
+    def test_migration_fills_in_the_isbn13(self):
+        Book.objects.update(isbn13=None)
+        migration = import_module('LibApp.migrations.0011_backfill_isbn13')
+        migration.fill_isbn13(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(sorted(Book.objects.values_list('isbn13', flat=True)), ['9780141439587', '9780441013593'])
+
+    def test_books_without_an_isbn13_are_restocked(self):
+        # Saved before the column was filled in, restocked with the ISBN as stored
+        Book.objects.update(isbn13=None)
+        response = self.client.post(reverse('newbook'), {'title': 'Dune', 'author': 'Frank Herbert',
+                                                         'isbn': '978-0-441-01359-3', 'quantity_purchased': 2})
+        self.assertEqual(response.json(), {'success': True})
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.quantity_total, 4)
+
+    def test_invalid_stored_isbns_match_as_stored(self):
+        # Neither has an ISBN-13, the second fails the check digit
+        old = Book.objects.create(title='Old', author='Unknown', isbn='ABC-1', quantity_available=1, quantity_total=1)
+        typo = Book.objects.create(title='Typo', author='Unknown', isbn='1234567890123', quantity_available=1,
+                                   quantity_total=1)
+        self.assertEqual((old.isbn13, typo.isbn13), (None, None))
+        for q, titles in (('ABC', ['Old']), ('abc-1', ['Old']), ('1234567890123', ['Typo']), ('ABD', [])):
+            self.assertEqual(self.search(q), titles, q)
+        member = Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M1002')
+        Transaction.objects.create(book=typo, member=member, transaction_type='issue')
+        response = self.client.post(reverse('search_for_transaction'), json.dumps({'q': '1234567890123', 'field': 'book'}),
+                                    content_type='application/json')
+        self.assertEqual([result['book_title'] for result in response.json()['results']], ['Typo'])
+
+        response = self.client.get(reverse('lookup'), {'kind': 'book', 'q': '1234567890123'})
+        self.assertEqual([result['id'] for result in response.json()['results']], [typo.pk])
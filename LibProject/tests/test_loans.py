@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import F
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.archive import archive_transactions
+from LibApp.circulation import apply_batch
+from LibApp.loans import backfill_loans
+from LibApp.models import Book, Loan, Member, Transaction
+
+class LoanTests(TestCase):
+    def setUp(self):
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        quantity_available=3, quantity_total=3)
+        self.emma = Book.objects.create(title='Emma', author='Jane Austen', isbn='9780141439587',
+                                        quantity_available=3, quantity_total=3)
+        self.john = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+        self.jane = Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M1002')
+
+    def circulate(self, book, member, transaction_type):
+        return Transaction.objects.create(book=book, member=member, transaction_type=transaction_type)
+
+    def open_loans(self):
+        return sorted(Loan.objects.open().values_list('book__title', 'member__member_id'))
+
+    def test_issue_opens_and_return_closes_the_oldest_loan(self):
+        first = self.circulate(self.dune, self.john, 'issue')
+        second = self.circulate(self.dune, self.john, 'issue')
+        self.circulate(self.dune, self.jane, 'issue')
+        self.assertEqual(self.open_loans(), [('Dune', 'M1001'), ('Dune', 'M1001'), ('Dune', 'M1002')])
+
+        returned = self.circulate(self.dune, self.john, 'return')
+        loan = Loan.objects.get(returned_at__isnull=False)
+        self.assertEqual((loan.member_id, loan.issued_at, loan.returned_at),
+                         (self.john.pk, first.transaction_date, returned.transaction_date))
+        self.assertEqual(Loan.objects.open().get(member=self.john).issued_at, second.transaction_date)
+
+        # A return with nothing on loan closes nothing
+        self.circulate(self.emma, self.jane, 'return')
+        self.assertEqual(Loan.objects.count(), 3)
+
+    def test_batch_checkout(self):
+        self.circulate(self.dune, self.john, 'issue')
+        apply_batch(self.john.pk, [{'action': 'return', 'book': self.dune.pk}, {'action': 'issue', 'book': self.emma.pk},
+                                   {'action': 'issue', 'book': self.dune.pk}, {'action': 'return', 'book': self.emma.pk},
+                                   {'action': 'issue', 'book': self.emma.pk}])
+        self.assertEqual(self.open_loans(), [('Dune', 'M1001'), ('Emma', 'M1001')])
+        self.assertEqual(Loan.objects.filter(returned_at__isnull=False).count(), 2)
+
+    def test_backfill_pairs_the_history_in_order(self):
+        start = datetime(2024, 3, 1, 12, tzinfo=dt_timezone.utc)
+        history = [(self.dune, self.john, 'issue'), (self.dune, self.john, 'issue'), (self.dune, self.jane, 'issue'),
+                   (self.dune, self.john, 'return'), (self.emma, self.jane, 'issue'), (self.emma, self.jane, 'return')]
+        Transaction.objects.bulk_create(Transaction(book=book, member=member, transaction_type=transaction_type)
+                                        for book, member, transaction_type in history)
+        # transaction_date is auto_now_add, spread the history out afterwards
+        for day, pk in enumerate(Transaction.objects.order_by('pk').values_list('pk', flat=True)):
+            Transaction.objects.filter(pk=pk).update(transaction_date=start + timedelta(days=day))
+        # John's issues are archived, his return is not
+        self.assertEqual(archive_transactions(before=start + timedelta(days=2)), 2)
+        Loan.objects.create(book=self.emma, member=self.john, issued_at=start, due_at=start)
+
+        # Every chunk replaces its books' loans, so running it twice is the same
+        for _ in range(2):
+            self.assertEqual(backfill_loans(chunk_size=1), 4)
+        loans = sorted((loan.book.title, loan.member.member_id, loan.issued_at.day,
+                        loan.returned_at and loan.returned_at.day) for loan in Loan.objects.all())
+        self.assertEqual(loans, [('Dune', 'M1001', 1, 4), ('Dune', 'M1001', 2, None), ('Dune', 'M1002', 3, None),
+                                 ('Emma', 'M1002', 5, 6)])
+        self.assertFalse(Loan.objects.exclude(due_at=F('issued_at') + timedelta(days=14)).exists())
+
+    def test_backfill_skips_returns_with_nothing_on_loan(self):
+        # John returns Dune on the 1st, before ever borrowing it, then borrows
+        # it twice and returns it once. Jane borrows it once and returns it twice
+        history = [(self.john, 'issue', 2), (self.john, 'issue', 3), (self.john, 'return', 4),
+                   (self.jane, 'issue', 5), (self.jane, 'return', 6), (self.jane, 'return', 7),
+                   (self.jane, 'issue', 8), (self.john, 'return', 1)]
+        Transaction.objects.bulk_create(Transaction(book=self.dune, member=member, transaction_type=transaction_type)
+                                        for member, transaction_type, _ in history)
+        # John's early return is entered last, it has the highest id
+        for pk, (_, _, day) in zip(Transaction.objects.order_by('pk').values_list('pk', flat=True), history):
+            Transaction.objects.filter(pk=pk).update(transaction_date=datetime(2024, 3, day, 12, tzinfo=dt_timezone.utc))
+
+        self.assertEqual(backfill_loans(), 4)
+        loans = sorted((loan.member.member_id, loan.issued_at.day, loan.returned_at and loan.returned_at.day)
+                       for loan in Loan.objects.all())
+        self.assertEqual(loans, [('M1001', 2, 4), ('M1001', 3, None), ('M1002', 5, 6), ('M1002', 8, None)])
+
+    def test_views(self):
+        self.circulate(self.dune, self.john, 'issue')
+        self.circulate(self.emma, self.john, 'issue')
+        self.circulate(self.dune, self.jane, 'issue')
+
+        response = self.client.get(reverse('member_loans', args=[self.john.pk]))
+        self.assertEqual([loan['title'] for loan in response.json()['loans']], ['Dune', 'Emma'])
+        response = self.client.get(reverse('book_loans', args=[self.dune.pk]))
+        self.assertEqual([loan['member_id'] for loan in response.json()['loans']], ['M1001', 'M1002'])
+
+        self.circulate(self.emma, self.john, 'return')
+        response = self.client.get(reverse('book_loans', args=[self.emma.pk]))
+        self.assertEqual(response.json(), {'loans': []})
+        self.assertEqual(self.client.get(reverse('member_loans', args=[999])).status_code, 404)
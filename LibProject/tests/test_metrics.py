@@ -0,0 +1,46 @@
+import json
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.metrics import REGISTRY, Histogram
+from LibApp.models import Member
+
+class HistogramTests(TestCase):
+    def test_buckets_are_cumulative_and_inclusive(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 9):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.samples()), [(1, 2), (5, 3), ('+Inf', 4)])
+        self.assertEqual((histogram.sum, histogram.count), (13, 4))
+
+class MetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        REGISTRY.reset()
+        Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+
+    def metric_lines(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode().splitlines()
+
+    def test_requests_are_recorded_per_url_name(self):
+        # Two different searches, a repeated one would be answered from the cache
+        for query in ('john', 'jo'):
+            self.client.post(reverse('search_for_member'), json.dumps({'q': query, 'field': 'name'}),
+                             content_type='application/json')
+        self.client.get('/no/such/page/')
+
+        lines = self.metric_lines()
+        self.assertIn('libapp_http_responses_total{view="search_for_member",status="200"} 2', lines)
+        self.assertIn('libapp_http_responses_total{view="<unresolved>",status="404"} 1', lines)
+        self.assertIn('libapp_http_request_duration_seconds_count{view="search_for_member"} 2', lines)
+
+        # The search runs one query per request
+        self.assertIn('libapp_db_queries_per_request_bucket{view="search_for_member",le="0"} 0', lines)
+        self.assertIn('libapp_db_queries_per_request_bucket{view="search_for_member",le="1"} 2', lines)
+        self.assertIn('libapp_db_queries_per_request_sum{view="search_for_member"} 2', lines)
+
+    def test_response_sizes_are_recorded(self):
+        response = self.client.post(reverse('search_for_member'), json.dumps({'q': 'john', 'field': 'name'}),
+                                    content_type='application/json')
+        self.assertIn(f'libapp_http_response_size_bytes_sum{{view="search_for_member"}} {len(response.content)}',
+                      self.metric_lines())
@@ -36,6 +36,37 @@ class TransactionModelTests(TestCase):
         self.assertEqual(self.member.outstanding_debt, 5)
         self.assertEqual(self.book.quantity_available, 4)
 
+    def test_issue_fails_cleanly_when_out_of_stock(self):
+        self.book.quantity_available = 0
+        self.book.save()
+        with self.assertRaises(ValidationError):
+            Transaction.objects.create(book=self.book, member=self.member, transaction_type='issue', fee_charged=10)
+
+        # Nothing was recorded and the member was not charged
+        self.assertFalse(Transaction.objects.exists())
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.outstanding_debt, 0)
+
+    def test_rejected_issue_leaves_stock_untouched(self):
+        self.member.outstanding_debt = 495
+        self.member.save()
+        with self.assertRaises(ValidationError):
+            Transaction.objects.create(book=self.book, member=self.member, transaction_type='issue', fee_charged=10)
+
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.quantity_available, 5)
+
+    def test_counters_are_updated_in_the_database(self):
+        # A stale copy of the book must not overwrite other columns or counts
+        Book.objects.filter(pk=self.book.pk).update(title='Renamed Book', quantity_available=3)
+        Transaction.objects.create(book=self.book, member=self.member, transaction_type='issue', fee_charged=10, amount_paid=5)
+        Transaction.objects.create(book=self.book, member=self.member, transaction_type='return')
+
+        book = Book.objects.get(pk=self.book.pk)
+        self.assertEqual(book.title, 'Renamed Book')
+        self.assertEqual(book.quantity_available, 3)
+        self.assertEqual(Member.objects.get(pk=self.member.pk).outstanding_debt, 5)
+
 class BookTestCase(TestCase):
     def setUp(self):
         self.book = Book.objects.create(
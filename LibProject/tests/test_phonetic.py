@@ -0,0 +1,89 @@
+import io
+import json
+from importlib import import_module
+from types import SimpleNamespace
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.models import Member, MemberNameWord
+from LibApp.phonetic import backfill_name_keys, phonetic_key, soundex
+
+class SoundexTests(TestCase):
+    def test_codes(self):
+        for word, code in (('robert', 'R163'), ('rupert', 'R163'), ('ashcraft', 'A261'), ('tymczak', 'T522'),
+                           ('pfister', 'P236'), ('honeyman', 'H555'), ('lee', 'L000')):
+            self.assertEqual(soundex(word), code, word)
+        self.assertEqual(phonetic_key("Seán O'Brien-Smith"), 'S500 O165 S530')
+        self.assertEqual(phonetic_key('Jon Smyth'), phonetic_key('John Smith'))
+
+class PhoneticNameSearchTests(TestCase):
+    def setUp(self):
+        self.john = Member.objects.create(name='John Smith', email='john@example.com', member_id='M1001')
+        self.jon = Member.objects.create(name='Jon Smyth', email='jon@example.com', member_id='M1002')
+        Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M1003')
+        Member.objects.create(name='Johanna Smit', email='johanna@example.com', member_id='M1004')
+
+    def search(self, q, **data):
+        response = self.client.post(reverse('search_for_member'), json.dumps({'q': q, 'field': 'name', **data}),
+                                    content_type='application/json')
+        return response.json()
+
+    def names(self, q, **data):
+        return [result['name'] for result in self.search(q, **data)['results']]
+
+    def test_spelling_variants_match(self):
+        self.assertEqual(self.names('john smith'), ['John Smith', 'Jon Smyth'])
+        self.assertEqual(self.names('Jon Smyth'), ['John Smith', 'Jon Smyth'])
+        self.assertEqual(self.names('jon'), ['John Smith', 'Jon Smyth'])
+        # Sounding alike is not enough when the spelling is far off
+        self.assertEqual(self.names('jane'), ['Jane Smith'])
+        # The last word may be typed in part
+        self.assertEqual(self.names('jo'), ['John Smith', 'Jon Smyth', 'Johanna Smit'])
+        self.assertEqual(self.names('johanna sm'), ['Johanna Smit'])
+        self.assertEqual(len(self.names('')), 4)
+
+    def test_pages_of_refined_candidates(self):
+        first = self.search('john smith', limit=1)
+        self.assertEqual([result['name'] for result in first['results']], ['John Smith'])
+        self.assertEqual(self.names('john smith', limit=1, cursor=first['next_cursor']), ['Jon Smyth'])
+
+    def test_any_word_and_substrings_match(self):
+        self.assertEqual(self.names('smith'), ['John Smith', 'Jon Smyth', 'Jane Smith', 'Johanna Smit'])
+        self.assertEqual(self.names('smyth', match='prefix'), ['John Smith', 'Jon Smyth', 'Jane Smith'])
+        Member.objects.create(name='Mary Ann Jones', email='mary@example.com', member_id='M1005')
+        self.assertEqual(self.names('ann jones'), ['Mary Ann Jones'])
+        self.assertEqual(self.names('jones ann'), [])
+        # Parts of words only by substring
+        self.assertEqual(self.names('ohn'), ['John Smith'])
+        self.assertEqual(self.names('ohn', match='prefix'), [])
+
+        self.john.name = 'John Brown'
+        self.john.save()
+        self.assertEqual(self.names('broun', match='prefix'), ['John Brown'])
+        self.assertEqual(self.names('smith', match='prefix'), ['Jon Smyth', 'Jane Smith', 'Johanna Smit'])
+
+    def test_backfill(self):
+        MemberNameWord.objects.all().delete()
+        Member.objects.update(name_key=None)
+        self.assertEqual(self.names('john', match='prefix'), [])
+        self.assertEqual(backfill_name_keys(chunk_size=1), 4)
+        self.assertEqual(self.names('john', match='prefix'), ['John Smith', 'Jon Smyth'])
+        self.assertEqual(MemberNameWord.objects.filter(member=self.john).count(), 2)
+
+        output = io.StringIO()
+        call_command('backfill_name_keys', stdout=output)
+        self.assertIn('0 members updated', output.getvalue())
+
+    def test_migration_fills_in_the_name_keys(self):
+        MemberNameWord.objects.all().delete()
+        Member.objects.update(name_key=None)
+        migration = import_module('LibApp.migrations.0014_backfill_name_keys')
+        migration.fill_name_keys(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(Member.objects.get(pk=self.jon.pk).name_key, 'J500 S530')
+        self.assertEqual(self.names('jon', match='prefix'), ['John Smith', 'Jon Smyth'])
+
+        output = io.StringIO()
+        call_command('backfill_name_keys', stdout=output)
+        self.assertIn('0 members updated', output.getvalue())
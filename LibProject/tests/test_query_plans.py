@@ -0,0 +1,142 @@
+import json
+import unittest
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from LibApp.autocomplete import build_indexes
+from LibApp.isbn import isbn13_check_digit
+from LibApp.models import Book, Loan, Member, Transaction
+from LibApp.phonetic import backfill_name_keys
+from LibApp.search_cache import get_cache
+
+def full_scans(sql):
+    # Plan steps that read a whole table, per vendor
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            # Scans of the full-text virtual table are index lookups
+            return [row[-1] for row in cursor.fetchall()
+                    if row[-1].startswith('SCAN ') and 'VIRTUAL TABLE' not in row[-1]]
+        cursor.execute(f'EXPLAIN {sql}')
+        columns = [column[0] for column in cursor.description]
+        return [f"{row['table']}: {row['type']}" for row in (dict(zip(columns, values)) for values in cursor.fetchall())
+                if row['type'] in ('ALL', 'index')]
+
+
+@unittest.skipUnless(connection.vendor in ('sqlite', 'mysql'), 'Plan inspection is written for SQLite and MySQL')
+class SearchQueryPlanTests(TestCase):
+    # Every search and lookup must be answered from an index. The endpoints are
+    # called as the pages do and the plan of each SELECT they run is checked.
+    # Member names, emails and ids match substrings by default, which no index
+    # can serve: those searches may scan the member table, and only it, see
+    # SUBSTRING_SEARCHES. Their prefix mode is indexed
+
+    SEARCHES = [
+        ('search_for_book', {'q': '978', 'field': 'isbn'}),
+        ('search_for_book', {'q': '0-06-230000-8', 'field': 'isbn'}),
+        ('search_for_book', {'q': 'ABC-1', 'field': 'isbn'}),
+        ('search_for_book', {'q': 'sapiens', 'field': 'title'}),
+        ('search_for_book', {'q': 'harari', 'field': 'author'}),
+        ('search_for_member', {'q': 'john', 'field': 'name', 'match': 'prefix'}),
+        ('search_for_member', {'q': 'doe', 'field': 'name', 'match': 'prefix'}),
+        ('search_for_member', {'q': 'john1', 'field': 'email', 'match': 'prefix'}),
+        ('search_for_member', {'q': 'm10', 'field': 'member_id', 'match': 'prefix'}),
+        ('search_for_transaction', {'q': '978', 'field': 'book'}),
+        ('search_for_transaction', {'q': '978-0-06-230000-3', 'field': 'book'}),
+        ('search_for_transaction', {'q': 'ABC-1', 'field': 'book'}),
+        ('search_for_transaction', {'q': 'm10', 'field': 'member', 'match': 'prefix'}),
+        ('search_for_transaction', {'q': 'iss', 'field': 'transaction_type', 'match': 'prefix'}),
+        ('search_for_transaction', {'q': 'ssue', 'field': 'transaction_type'}),
+        ('search_for_transaction', {'q': 'm10', 'field': 'member', 'archived': True, 'match': 'prefix'}),
+    ]
+    # The default searches of the member pages and of the transaction page by
+    # member, none of them reads the transactions without an index
+    SUBSTRING_SEARCHES = [
+        ('search_for_member', {'q': 'ohn', 'field': 'name'}),
+        ('search_for_member', {'q': 'n1', 'field': 'email'}),
+        ('search_for_member', {'q': '10', 'field': 'member_id'}),
+        ('search_for_transaction', {'q': '10', 'field': 'member'}),
+        ('search_for_transaction', {'q': '10', 'field': 'member', 'archived': True}),
+    ]
+    LOOKUPS = [
+        ('book', '978-00'),
+        ('book', '1234567890123'),
+        ('book', 'sapiens'),
+        ('member', 'M10'),
+        ('member', 'john'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        # bulk_create skips the save methods, the ISBN-13 is given and the name keys filled in
+        isbns = [f'97800623{n:04d}' + isbn13_check_digit(f'97800623{n:04d}') for n in range(60)]
+        books = Book.objects.bulk_create(
+            Book(title=f'Sapiens {n}', author='Yuval Noah Harari', isbn=isbn, isbn13=isbn, quantity_available=5, quantity_total=5)
+            for n, isbn in enumerate(isbns))
+        members = Member.objects.bulk_create(
+            Member(name=f'John Doe {n}', email=f'john{n}@example.com', member_id=f'M10{n:03d}') for n in range(60))
+        backfill_name_keys()
+        # Stored ISBNs that are no valid ISBN have no ISBN-13
+        books += Book.objects.bulk_create(
+            Book(title=f'Old {n}', author='Unknown', isbn=isbn, quantity_available=1, quantity_total=1)
+            for n, isbn in enumerate([f'ABC-{n}' for n in range(12)] + ['1234567890123']))
+        Transaction.objects.bulk_create(
+            Transaction(book=book, member=member, transaction_type='issue') for book, member in zip(books, members * 2))
+        Loan.objects.bulk_create(
+            Loan(book=book, member=member, issued_at=transaction.transaction_date, due_at=transaction.transaction_date)
+            for book, member, transaction in zip(books[:60], members, Transaction.objects.order_by('pk')))
+        build_indexes()
+
+    def setUp(self):
+        # A page cached by an earlier test would run no query to inspect
+        get_cache().clear()
+
+    def assertIndexed(self, label, queries, member_scans=False):
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects, f'{label} ran no SELECT')
+        for sql in selects:
+            with self.subTest(label, sql=sql):
+                scans = full_scans(sql)
+                if member_scans:
+                    # The member table, or a subquery of it under Django's U0 alias
+                    scans = [scan for scan in scans
+                             if scan.removeprefix('SCAN ').split(':')[0].split()[0] not in ('LibApp_member', 'U0')]
+                self.assertEqual(scans, [])
+
+    def test_searches_use_indexes(self):
+        self.check_searches(self.SEARCHES)
+
+    def test_substring_searches_scan_the_members_only(self):
+        self.check_searches(self.SUBSTRING_SEARCHES, member_scans=True)
+
+    def check_searches(self, searches, member_scans=False):
+        for view, data in searches:
+            # The first page and a page resumed from a cursor
+            for page in (data, dict(data, limit=1)):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.post(reverse(view), json.dumps(page), content_type='application/json')
+                self.assertTrue(response.json()['results'], f'{view} {page} found nothing')
+                self.assertIndexed(f'{view} {page}', queries.captured_queries, member_scans)
+
+                next_cursor = response.json()['next_cursor']
+                if next_cursor:
+                    with CaptureQueriesContext(connection) as queries:
+                        self.client.post(reverse(view), json.dumps(dict(page, cursor=next_cursor)),
+                                         content_type='application/json')
+                    self.assertIndexed(f'{view} {page} next page', queries.captured_queries, member_scans)
+
+    def test_lookups_use_indexes(self):
+        for kind, q in self.LOOKUPS:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('lookup'), {'kind': kind, 'q': q})
+            self.assertTrue(response.json()['results'], f'lookup {kind} {q} found nothing')
+            self.assertIndexed(f'lookup {kind} {q}', queries.captured_queries)
+
+    def test_open_loans_use_indexes(self):
+        loan = Loan.objects.first()
+        for view, pk in (('member_loans', loan.member_id), ('book_loans', loan.book_id)):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(view, args=[pk]))
+            self.assertTrue(response.json()['loans'], f'{view} found nothing')
+            self.assertIndexed(view, queries.captured_queries)
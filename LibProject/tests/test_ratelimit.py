@@ -0,0 +1,59 @@
+import json
+import time
+from django.contrib.auth.models import User
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from LibApp.metrics import REGISTRY
+from LibApp.ratelimit import SHED_METRIC, Limiter
+
+def limits(**search):
+    return {'search': {'views': ('search_for_book', 'search_for_member'), **search}}
+
+class RateLimitTests(TestCase):
+    def search(self, client=None):
+        return (client or self.client).post(reverse('search_for_book'), json.dumps({'q': 'dune', 'field': 'title'}),
+                                            content_type='application/json')
+
+    @override_settings(RATE_LIMITS=limits(rate=0.01, burst=2))
+    def test_client_over_its_rate_gets_429(self):
+        refused = REGISTRY.counter_value(SHED_METRIC, endpoint='search', reason='rate')
+        self.assertEqual([self.search().status_code for _ in range(3)], [200, 200, 429])
+        response = self.search()
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '100'))
+        self.assertEqual(REGISTRY.counter_value(SHED_METRIC, endpoint='search', reason='rate'), refused + 2)
+        # The bucket is the endpoint class's, other endpoints are not limited
+        response = self.client.post(reverse('search_for_member'), json.dumps({'q': 'jane', 'field': 'name'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.client.get(reverse('lookup'), {'kind': 'book', 'q': 'dune'}).status_code, 200)
+
+        # Other clients have buckets of their own
+        self.assertEqual(self.search(Client(REMOTE_ADDR='10.0.0.2')).status_code, 200)
+        self.client.force_login(User.objects.create_user('librarian', password='secret'))
+        self.assertEqual(self.search().status_code, 200)
+
+    @override_settings(RATE_LIMITS=limits(rate=50, burst=1))
+    def test_bucket_refills(self):
+        self.assertEqual(self.search().status_code, 200)
+        response = self.search()
+        self.assertEqual((response.status_code, response['Retry-After']), (429, '1'))
+        time.sleep(0.05)
+        self.assertEqual(self.search().status_code, 200)
+
+    @override_settings(RATE_LIMITS=limits(rate=100, burst=100, concurrency=1))
+    def test_concurrency_cap(self):
+        # The slot is given back when the response is
+        self.assertEqual([self.search().status_code for _ in range(3)], [200, 200, 200])
+        with override_settings(RATE_LIMITS=limits(rate=100, burst=100, concurrency=0)):
+            response = self.search()
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+        # A request shed for load costs the client no token
+        with override_settings(RATE_LIMITS=limits(rate=0.01, burst=1, concurrency=0)):
+            self.assertEqual([self.search(Client(REMOTE_ADDR='10.0.0.3')).status_code for _ in range(2)], [503, 503])
+        with override_settings(RATE_LIMITS=limits(rate=0.01, burst=1, concurrency=1)):
+            self.assertEqual(self.search(Client(REMOTE_ADDR='10.0.0.3')).status_code, 200)
+
+        limiter = Limiter()
+        self.assertEqual([limiter.acquire('search', 2) for _ in range(3)], [True, True, False])
+        limiter.release('search')
+        self.assertTrue(limiter.acquire('search', 2))
@@ -0,0 +1,88 @@
+import json
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connections
+from django.http import JsonResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from django.urls import reverse
+from LibApp import replicas
+from LibApp.metrics import REGISTRY
+from LibApp.models import Book, Member, StatCounter
+from LibApp.replicas import replica_reads
+from LibApp.search_cache import REQUESTS_METRIC, get_cache, written_key
+
+@replica_reads
+def rename_view(request, book_id):
+    # Reads the book, renames it and reads it again
+    before = Book.objects.get(pk=book_id).title
+    Book.objects.filter(pk=book_id).update(title='Dune Messiah')
+    return JsonResponse({'before': before, 'after': Book.objects.get(pk=book_id).title})
+
+
+# Run with LibProject.test_settings, which has a primary and a replica database.
+# The two are not kept in sync here, so where a row was read from shows which
+# database served the read
+@skipUnless('replica' in settings.DATABASES, 'Needs the replica database of LibProject.test_settings')
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593')
+        Book.objects.using('replica').create(id=self.dune.pk, title='Dune', author='Frank Herbert', isbn='9780441013593')
+        Book.objects.using('replica').create(title='Emma', author='Jane Austen', isbn='9780141439587')
+        Member.objects.using('replica').create(name='Jane Smith', email='jane@example.com', member_id='M1002')
+        replicas._down_until.clear()
+
+    def search(self, endpoint, **data):
+        response = self.client.post(reverse(endpoint), json.dumps(data), content_type='application/json')
+        return response.json()['results']
+
+    def test_searches_and_reports_read_from_the_replica(self):
+        self.assertEqual([book['title'] for book in self.search('search_for_book', q='emma', field='title')], ['Emma'])
+        self.assertEqual([member['name'] for member in self.search('search_for_member', q='jane', field='name')],
+                         ['Jane Smith'])
+
+        self.client.force_login(User.objects.create_user('librarian', password='secret'))
+        StatCounter.objects.using('replica').create(name='active_members', value=7)
+        self.assertEqual(self.client.get(reverse('dashboard_stats')).json()['active_members'], 7)
+        # The export is read from the database as it streams
+        response = self.client.get(reverse('export', args=['books']))
+        self.assertIn('Emma', b''.join(response.streaming_content).decode())
+
+        # Anything else reads the primary
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Dune'])
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        response = rename_view(RequestFactory().get('/'), self.dune.pk)
+        self.assertEqual(json.loads(response.content), {'before': 'Dune', 'after': 'Dune Messiah'})
+        self.assertEqual(Book.objects.using('replica').get(pk=self.dune.pk).title, 'Dune')
+
+    def test_unavailable_replica_falls_back_to_the_primary(self):
+        with mock.patch.object(connections['replica'], 'ensure_connection', side_effect=OperationalError):
+            self.assertEqual(self.search('search_for_book', q='emma', field='title'), [])
+        # Left alone for a while even though it is back
+        self.assertEqual(self.search('search_for_member', q='jane', field='name'), [])
+
+        replicas._down_until.clear()
+        self.assertEqual(len(self.search('search_for_member', q='jane s', field='name')), 1)
+
+    def test_searches_read_from_a_lagging_replica_are_not_cached(self):
+        get_cache().clear()
+        REGISTRY.reset()
+        # Renamed on the primary, the replica has not caught up yet
+        Member.objects.create(id=Member.objects.using('replica').get().pk, name='Jane Doe', email='jane@example.com',
+                              member_id='M1002')
+        for _ in range(2):
+            self.assertEqual([member['name'] for member in self.search('search_for_member', q='jane', field='name')],
+                             ['Jane Smith'])
+        self.assertEqual(REGISTRY.counter_value(REQUESTS_METRIC, endpoint='member', result='miss'), 2)
+
+        # Once the replica may have caught up its pages are cached again
+        Member.objects.using('replica').update(name='Jane Doe')
+        get_cache().delete(written_key(Member))
+        for _ in range(2):
+            self.assertEqual([member['name'] for member in self.search('search_for_member', q='jane', field='name')],
+                             ['Jane Doe'])
+        self.assertEqual(REGISTRY.counter_value(REQUESTS_METRIC, endpoint='member', result='hit'), 1)
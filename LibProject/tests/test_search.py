@@ -0,0 +1,62 @@
+from unittest import skipUnless
+from django.db import connection
+from django.test import TransactionTestCase
+from LibApp.models import Book
+from LibApp.pagination import decode_cursor
+from LibApp.search import get_book_search_backend, search_books, tokenize
+
+# InnoDB only makes FULLTEXT changes visible on commit, so these tests commit
+class BookFullTextSearchTests(TransactionTestCase):
+    def setUp(self):
+        self.sapiens = Book.objects.create(title='Sapiens: A Brief History of Humankind', author='Yuval Noah Harari', isbn='9780062316097')
+        self.deus = Book.objects.create(title='Homo Deus', author='Yuval Noah Harari', isbn='9780062464316')
+        self.origin = Book.objects.create(title='On the Origin of Species', author='Charles Darwin', isbn='9780451529060')
+
+    def test_tokenize_strips_search_operators(self):
+        self.assertEqual(tokenize('"Sapiens" AND -history*'), ['sapiens', 'and', 'history'])
+
+    def test_title_search_matches_word_prefixes(self):
+        books, next_cursor = search_books('title', 'sapi hist', None, 10)
+        self.assertEqual(books, [self.sapiens])
+        self.assertIsNone(next_cursor)
+
+    def test_search_is_restricted_to_the_field(self):
+        books, _ = search_books('author', 'harari', None, 10)
+        self.assertCountEqual(books, [self.sapiens, self.deus])
+        books, _ = search_books('title', 'harari', None, 10)
+        self.assertEqual(books, [])
+
+    def test_results_follow_the_ranked_cursor(self):
+        first_page, next_cursor = search_books('author', 'yuval', None, 1)
+        self.assertEqual(len(first_page), 1)
+        self.assertEqual(len(decode_cursor(next_cursor)), 2)
+
+        second_page, next_cursor = search_books('author', 'yuval', decode_cursor(next_cursor), 1)
+        self.assertEqual(len(second_page), 1)
+        self.assertNotEqual(first_page, second_page)
+        self.assertIsNone(next_cursor)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.origin.title = 'The Descent of Man'
+        self.origin.save()
+        self.assertEqual(search_books('title', 'origin', None, 10)[0], [])
+        self.assertEqual(search_books('title', 'descent', None, 10)[0], [self.origin])
+
+        self.origin.delete()
+        self.assertEqual(search_books('title', 'descent', None, 10)[0], [])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite specific backend')
+    def test_sqlite_uses_fts5(self):
+        self.assertEqual(type(get_book_search_backend()).__name__, 'SQLiteFTS5Backend')
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite specific backend')
+    def test_install_restores_triggers_lost_with_a_table_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER "LibApp_book_fts_ai"')
+        dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593')
+        self.assertEqual(search_books('title', 'dune', None, 10)[0], [])
+
+        get_book_search_backend().install()
+        self.assertEqual(search_books('title', 'dune', None, 10)[0], [dune])
+        Book.objects.create(title='Dune Messiah', author='Frank Herbert', isbn='9780593098233')
+        self.assertEqual(len(search_books('title', 'dune', None, 10)[0]), 2)
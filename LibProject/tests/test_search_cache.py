@@ -0,0 +1,107 @@
+import json
+import shutil
+import tempfile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from LibApp.metrics import REGISTRY
+from LibApp.models import Book, Member, Purchases, Transaction
+from LibApp.search_cache import REQUESTS_METRIC
+
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        REGISTRY.reset()
+        self.book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        quantity_available=3, quantity_total=3)
+        self.member = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+
+    def search(self, url_name, query, field):
+        response = self.client.post(reverse(url_name), json.dumps({'q': query, 'field': field}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def counts(self, endpoint):
+        return tuple(REGISTRY.counter_value(REQUESTS_METRIC, endpoint=endpoint, result=result)
+                     for result in ('hit', 'miss'))
+
+    def test_repeated_search_is_answered_without_queries(self):
+        first = self.search('search_for_member', 'John', 'name')
+        with self.assertNumQueries(0):
+            # The query is normalized, the case does not make a new entry
+            second = self.search('search_for_member', 'jOHN', 'name')
+        self.assertEqual(first, second)
+        self.assertEqual(self.counts('member'), (1, 1))
+        self.assertIn(f'{REQUESTS_METRIC}{{endpoint="member",result="hit"}} 1',
+                      self.client.get(reverse('metrics')).content.decode().splitlines())
+
+    def test_pages_and_fields_are_cached_apart(self):
+        Member.objects.create(name='Johnny Cash', email='cash@example.com', member_id='M1002')
+        self.search('search_for_member', 'john', 'name')
+        self.search('search_for_member', 'john', 'email')
+        response = self.client.post(reverse('search_for_member'), json.dumps({'q': 'john', 'field': 'name', 'limit': 1}),
+                                    content_type='application/json')
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertEqual(self.counts('member'), (0, 3))
+
+    def test_saving_a_model_invalidates_its_searches(self):
+        self.search('search_for_member', 'john', 'name')
+        self.member.name = 'John Smith'
+        self.member.save()
+        self.assertEqual(self.search('search_for_member', 'john', 'name')[0]['name'], 'John Smith')
+        self.assertEqual(self.counts('member'), (0, 2))
+
+    def test_restocking_invalidates_book_searches(self):
+        self.search('search_for_book', '978044', 'isbn')
+        # Restocking adds the copies with update(), which sends no signals
+        Purchases.objects.create(title='Dune', author='Frank Herbert', isbn='978-0-441-01359-3', quantity_purchased=3)
+        self.assertEqual(self.search('search_for_book', '978044', 'isbn')[0]['quantity_available'], 6)
+
+    def test_transactions_invalidate_book_and_member_searches(self):
+        self.search('search_for_book', '978044', 'isbn')
+        self.search('search_for_member', 'M1001', 'member_id')
+        Transaction.objects.create(book=self.book, member=self.member, transaction_type='issue', fee_charged=20)
+
+        self.assertEqual(self.search('search_for_book', '978044', 'isbn')[0]['quantity_available'], 2)
+        self.assertEqual(self.search('search_for_member', 'M1001', 'member_id')[0]['debt'], '20.00')
+
+    def test_transaction_search_follows_deletes_and_related_rows(self):
+        transaction = Transaction.objects.create(book=self.book, member=self.member, transaction_type='issue')
+        self.assertEqual(len(self.search('search_for_transaction', 'M1001', 'member')), 1)
+
+        # The results show the member's name
+        self.member.name = 'Jane Doe'
+        self.member.save()
+        self.assertEqual(self.search('search_for_transaction', 'M1001', 'member')[0]['member_name'], 'Jane Doe')
+
+        transaction.delete()
+        self.assertEqual(self.search('search_for_transaction', 'M1001', 'member'), [])
+
+    def test_batch_checkout_invalidates_searches(self):
+        # bulk_create and update() send no signals
+        self.search('search_for_book', '978044', 'isbn')
+        self.client.post(reverse('batch_checkout'), json.dumps({'member': self.member.pk, 'items': [
+            {'book': self.book.pk, 'action': 'issue'}]}), content_type='application/json')
+        self.assertEqual(self.search('search_for_book', '978044', 'isbn')[0]['quantity_available'], 2)
+        self.assertEqual(len(self.search('search_for_transaction', 'M1001', 'member')), 1)
+
+    def test_invalid_cursor_is_not_cached(self):
+        for _ in range(2):
+            response = self.client.post(reverse('search_for_member'), json.dumps({'q': 'john', 'field': 'name', 'cursor': '!'}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.counts('member'), (0, 2))
+
+    def test_other_cache_backends(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        caches = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'search': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }
+        with override_settings(CACHES=caches, SEARCH_CACHE_ALIAS='search'):
+            self.search('search_for_member', 'john', 'name')
+            self.search('search_for_member', 'john', 'name')
+            self.member.name = 'John Smith'
+            self.member.save()
+            self.assertEqual(self.search('search_for_member', 'john', 'name')[0]['name'], 'John Smith')
+        self.assertEqual(self.counts('member'), (1, 2))
@@ -0,0 +1,91 @@
+import io
+import json
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.forms import MembersForm, PurchasesForm
+from LibApp.exporter import export_queryset
+from LibApp.importer import import_manifest
+from LibApp.models import ArchivedTransaction, Book, Loan, Member, PurgeJob, Transaction
+from LibApp.purge import purge_batch, purge_deleted
+from LibApp.stats import get_stats
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        self.dune = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593',
+                                        quantity_available=5, quantity_total=5)
+        self.emma = Book.objects.create(title='Emma', author='Jane Austen', isbn='9780141439587',
+                                        quantity_available=5, quantity_total=5)
+        self.john = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+        self.jane = Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M1002', outstanding_debt=4)
+        for member in (self.john, self.jane, self.john):
+            Transaction.objects.create(book=self.dune, member=member, transaction_type='issue')
+        Transaction.objects.create(book=self.emma, member=self.john, transaction_type='issue')
+        first = Transaction.objects.order_by('pk').first()
+        ArchivedTransaction.objects.create(id=first.pk - 1, book=self.dune, member=self.john, transaction_type='return',
+                                           transaction_date=first.transaction_date)
+
+    def search(self, endpoint, **data):
+        response = self.client.post(reverse(endpoint), json.dumps(data), content_type='application/json')
+        return response.json()['results']
+
+    def test_deleted_book_is_hidden_at_once_and_purged_in_batches(self):
+        self.assertEqual(len(self.search('search_for_transaction', q='M1001', field='member')), 3)
+        response = self.client.post(reverse('delete_book', args=[self.dune.pk]))
+        job = PurgeJob.objects.get(pk=response.json()['purge_job'])
+        # Three transactions, the archived one and three loans
+        self.assertEqual((job.kind, job.object_id, job.total, job.purged), ('book', self.dune.pk, 7, 0))
+
+        self.assertEqual(self.search('search_for_book', q='9780441', field='isbn'), [])
+        self.assertEqual([result['book_title'] for result in self.search('search_for_transaction', q='M1001', field='member')],
+                         ['Emma'])
+        self.assertEqual(self.client.post(reverse('delete_book', args=[self.dune.pk])).status_code, 404)
+        # Nor is its history exported
+        self.assertEqual([row[4] for row in export_queryset('transactions')], ['Emma'])
+        self.assertEqual(list(export_queryset('archived_transactions')), [])
+        self.assertEqual([row[2] for row in export_queryset('books')], ['Emma'])
+        # Its copies left the counters with the delete, not again with the purge
+        self.assertEqual((get_stats()['copies_available'], get_stats()['books_on_loan']), (4, 1))
+        self.assertEqual(Transaction.objects.filter(book_id=self.dune.pk).count(), 3)
+
+        self.assertEqual([purge_batch(job, batch_size=2) for _ in range(5)], [2, 1, 1, 2, 1])
+        self.assertEqual(self.client.get(reverse('purge_status', args=[job.pk])).json(),
+                         {'kind': 'book', 'object_id': self.dune.pk, 'total': 7, 'purged': 7, 'finished': False})
+        self.assertEqual(purge_batch(job), 0)
+        self.assertTrue(self.client.get(reverse('purge_status', args=[job.pk])).json()['finished'])
+        self.assertFalse(Book.all_objects.filter(pk=self.dune.pk).exists())
+        self.assertEqual(get_stats()['copies_available'], 4)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_deleted_member_is_purged_by_the_worker(self):
+        response = self.client.post(reverse('delete_member', args=[self.jane.pk]))
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(self.search('search_for_member', q='jane', field='name'), [])
+        self.assertEqual((get_stats()['active_members'], get_stats()['outstanding_debt']), (1, '0.00'))
+
+        output = io.StringIO()
+        call_command('purge_deleted', batch_size=1, stdout=output)
+        self.assertIn('1 deletes finished', output.getvalue())
+        self.assertEqual(PurgeJob.objects.get().purged, 2)
+        self.assertFalse(Member.all_objects.filter(pk=self.jane.pk).exists())
+        self.assertEqual(Loan.objects.count(), 3)
+        self.assertEqual(purge_deleted(), 0)
+
+    def test_keys_of_deleted_rows_stay_taken_until_purged(self):
+        self.client.post(reverse('delete_book', args=[self.dune.pk]))
+        self.client.post(reverse('delete_member', args=[self.john.pk]))
+
+        form = PurchasesForm({'title': 'Dune', 'author': 'Frank Herbert', 'isbn': '9780441013593', 'quantity_purchased': 1})
+        self.assertIn('isbn', form.errors)
+        form = MembersForm({'name': 'John Doe', 'email': 'john@example.com', 'member_id': 'M1001'})
+        self.assertIn('member_id', form.errors)
+
+        report = import_manifest(io.StringIO('title,author,isbn,quantity_purchased\n'
+                                             'Dune,Frank Herbert,9780441013593,2\n'
+                                             'Emma,Jane Austen,9780141439587,2\n'), 'csv')
+        self.assertEqual(report.imported, 1)
+        self.assertEqual(report.rejected, [{'line': 2, 'error': 'ISBN belongs to a deleted book that is still being purged'}])
+
+        purge_deleted()
+        self.assertTrue(PurchasesForm({'title': 'Dune', 'author': 'Frank Herbert', 'isbn': '9780441013593',
+                                       'quantity_purchased': 1}).is_valid())
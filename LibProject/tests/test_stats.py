@@ -0,0 +1,91 @@
+import io
+import json
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from LibApp.importer import import_manifest
+from LibApp.models import Book, Member, Transaction, Purchases, StatCounter
+from LibApp.stats import get_stats, reconcile
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        self.member = Member.objects.create(name='Test Member', email='test@example.com', member_id='1234', outstanding_debt=20)
+        Purchases.objects.create(title='Test Book', author='Test Author', isbn='1234567890123', quantity_purchased=3)
+        self.book = Book.objects.get(isbn='1234567890123')
+
+    def assertInStep(self):
+        # The running totals match a full recount
+        self.assertEqual(reconcile(), {})
+
+    def test_writes_keep_the_counters_in_step(self):
+        Purchases.objects.create(title='Other Book', author='Other Author', isbn='1234567890124', quantity_purchased=2)
+        Transaction.objects.create(book=self.book, member=self.member, transaction_type='issue', fee_charged=10, amount_paid=4)
+        Transaction.objects.create(book=self.book, member=self.member, transaction_type='issue', fee_charged=5)
+        Transaction.objects.create(book=self.book, member=self.member, transaction_type='return')
+        self.assertEqual(get_stats(), {'books_on_loan': 1, 'copies_available': 4, 'active_members': 1,
+                                       'outstanding_debt': '31.00', 'issues_today': 2})
+        self.assertInStep()
+
+        book = Book.objects.get(pk=self.book.pk)
+        book.quantity_total = 10
+        book.save()
+        self.assertInStep()
+
+        # Deletes take the copies from the row, not from a stale instance
+        other_book = Book.objects.get(isbn='1234567890124')
+        fresh = Book.objects.get(pk=other_book.pk)
+        fresh.quantity_available = 1
+        fresh.save()
+        other_book.delete()
+        self.assertEqual(get_stats()['copies_available'], 2)
+
+        other_member = Member.objects.create(name='Other Member', email='other@example.com', member_id='5678', outstanding_debt=7)
+        other_member.delete()
+        self.assertEqual(get_stats()['outstanding_debt'], '31.00')
+        self.assertInStep()
+
+    def test_bulk_paths_keep_the_counters_in_step(self):
+        self.client.post(reverse('batch_checkout'), json.dumps({'member': self.member.pk, 'items': [
+            {'book': self.book.pk, 'action': 'issue', 'fee_charged': '10'},
+            {'book': self.book.pk, 'action': 'issue'},
+        ]}), content_type='application/json')
+        self.assertEqual(get_stats()['issues_today'], 2)
+        self.assertInStep()
+
+        transaction = Transaction.objects.first()
+        self.client.post(reverse('edit_transaction', args=[transaction.pk]), {
+            'book': self.book.pk, 'member': self.member.pk, 'transaction_type': 'issue',
+            'fee_charged': '10', 'amount_paid': '5',
+        })
+        self.assertInStep()
+
+        manifest = 'title,author,isbn,quantity_purchased\nNew Book,Author,9780000000001,4\nTest Book,Test Author,1234567890123,1\n'
+        import_manifest(io.StringIO(manifest))
+        self.assertInStep()
+
+    def test_reading_the_stats_does_not_aggregate(self):
+        with self.assertNumQueries(1):
+            stats = get_stats()
+        self.assertEqual(stats['copies_available'], 3)
+
+        User.objects.create_user(username='librarian', password='password')
+        self.client.login(username='librarian', password='password')
+        response = self.client.get(reverse('dashboard_stats'))
+        self.assertEqual(response.json(), stats)
+
+        response = self.client.get(reverse('lib_dashboard'))
+        self.assertContains(response, '<h3 id="stat-copies_available">3</h3>', html=True)
+
+    def test_reconcile_corrects_drift(self):
+        StatCounter.objects.filter(name='copies_available').update(value=100)
+        StatCounter.objects.filter(name='active_members').delete()
+
+        self.assertEqual(reconcile(), {'copies_available': (Decimal('100'), 3), 'active_members': (Decimal('0'), 1)})
+        self.assertEqual(get_stats()['copies_available'], 3)
+        self.assertEqual(get_stats()['active_members'], 1)
+
+        output = io.StringIO()
+        call_command('reconcile_stats', stdout=output)
+        self.assertEqual(output.getvalue().strip(), 'Dashboard statistics are in step')
@@ -0,0 +1,106 @@
+import io
+from datetime import timedelta
+from unittest import mock, skipIf
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from LibApp import purge
+from LibApp.models import Member, PurgeJob, Task, Transaction, Book
+from LibApp.tasks import claim, enqueue, run_due, run_task
+
+calls = []
+
+def flaky(name, failures):
+    # Fails the first `failures` calls for a name
+    calls.append(name)
+    if calls.count(name) <= failures:
+        raise RuntimeError(f'{name} failed')
+
+TASKS = {'flaky': 'tests.test_tasks.flaky'}
+
+@mock.patch.dict('LibApp.tasks.TASKS', TASKS)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_failed_task_is_retried_with_backoff_then_given_up(self):
+        task = enqueue('flaky', 'mail', failures=5, max_attempts=2)
+        self.assertEqual(run_due(), (0, 1))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertIn('RuntimeError: mail failed', task.last_error)
+        # Not due again before its retry delay
+        self.assertGreater(task.available_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(run_due(), (0, 0))
+
+        Task.objects.update(available_at=timezone.now())
+        self.assertEqual(run_due(), (0, 1))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, calls), (Task.FAILED, 2, ['mail', 'mail']))
+        self.assertIsNotNone(task.finished_at)
+
+        enqueue('flaky', 'report', failures=1)
+        Task.objects.filter(status=Task.QUEUED).update(available_at=timezone.now())
+        run_due()
+        Task.objects.filter(status=Task.QUEUED).update(available_at=timezone.now())
+        self.assertEqual(run_due(), (1, 0))
+        self.assertEqual(Task.objects.get(args=['report']).status, Task.DONE)
+
+        with self.assertRaises(ValueError):
+            enqueue('unknown')
+
+    def test_lapsed_claim_is_taken_over(self):
+        enqueue('flaky', 'export', failures=0)
+        stalled = claim(timeout=60)
+        self.assertIsNone(claim(timeout=60))
+
+        # The first worker died or overran its visibility timeout
+        Task.objects.update(available_at=timezone.now())
+        retry = claim(timeout=60)
+        self.assertEqual((retry.pk, retry.attempts), (stalled.pk, 2))
+        self.assertTrue(run_task(retry))
+        finished_at = Task.objects.get().finished_at
+        # The first worker coming back doesn't overwrite the outcome
+        run_task(stalled)
+        self.assertEqual(Task.objects.values_list('status', 'attempts', 'finished_at').get(),
+                         (Task.DONE, 2, finished_at))
+
+        # Past its attempts a lapsed task fails instead of running again
+        task = enqueue('flaky', 'import', failures=0, max_attempts=1)
+        claim(timeout=0)
+        self.assertEqual(run_due(), (0, 1))
+        task.refresh_from_db()
+        self.assertEqual((task.status, calls.count('import')), (Task.FAILED, 0))
+
+    def test_deleted_member_is_purged_by_the_task_worker(self):
+        book = Book.objects.create(title='Dune', author='Frank Herbert', isbn='9780441013593', quantity_available=5,
+                                   quantity_total=5)
+        jane = Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M1002')
+        for _ in range(3):
+            Transaction.objects.create(book=book, member=jane, transaction_type='issue')
+        self.client.post(reverse('delete_member', args=[jane.pk]))
+        self.assertEqual(Task.objects.get().name, 'purge_job')
+
+        # A job outlasting its slice goes on in another task
+        with mock.patch.object(purge, 'TASK_SECONDS', 0):
+            self.assertEqual(run_due(), (3, 0))
+        self.assertEqual(Task.objects.filter(status=Task.DONE).count(), 3)
+        self.assertFalse(Member.all_objects.filter(pk=jane.pk).exists())
+        self.assertEqual(PurgeJob.objects.get().purged, 6)
+
+        output = io.StringIO()
+        call_command('run_tasks', workers=1, keep_days=0, stdout=output)
+        self.assertIn('0 tasks completed, 0 attempts failed, 3 old tasks pruned', output.getvalue())
+
+
+# Worker threads have their own connections, see test_concurrency
+@skipIf(connection.vendor == 'sqlite', 'Concurrent writers need a server database')
+class ConcurrentWorkerTests(TransactionTestCase):
+    def test_each_task_runs_once(self):
+        for n in range(40):
+            enqueue('send_email', f'Notice {n}', 'Your book is due', None, [f'member{n}@example.com'])
+        self.assertEqual(run_due(workers=4), (40, 0))
+        self.assertEqual(sorted(message.subject for message in mail.outbox), sorted(f'Notice {n}' for n in range(40)))
@@ -1,9 +1,12 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.core import mail
-from LibApp.models import Book, Member, Transaction, Purchases
+from LibApp.models import Book, Member, Transaction, Purchases, StatCounter
+from LibApp.stats import issues_key
 from LibApp.forms import TransactionsForm
+from LibApp.autocomplete import build_indexes
+from LibApp.tasks import run_due
 import json
 from decimal import Decimal
 
@@ -55,8 +58,10 @@ class CustomPasswordResetViewTestCase(TestCase):
         # Make a POST request to the password reset view with a valid email
         response = self.client.post(reverse('password_reset'), {'email': 'test@example.com'})
         
-        # Check if the email was sent successfully
+        # Check if the email was queued, then sent by the task worker
         self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(run_due(), (1, 0))
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn('test@example.com', mail.outbox[0].to)
 
@@ -115,7 +120,8 @@ class SearchBookViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'searchbook.html')
 
-class SearchForBookViewTestCase(TestCase):
+# Title searches use the full-text index, which InnoDB only updates on commit
+class SearchForBookViewTestCase(TransactionTestCase):
     def setUp(self):
         self.client = Client()
         self.book1 = Book.objects.create(title='Book1', author='Author1', isbn='1234567890123', quantity_available=5)
@@ -140,6 +146,30 @@ class SearchForBookViewTestCase(TestCase):
         self.assertIn('results', response.json())
         self.assertEqual(len(response.json()['results']), 0)
 
+    def test_search_for_book_paginates_with_cursor(self):
+        Book.objects.create(title='Book3', author='Author3', isbn='1234567890125', quantity_available=1)
+        data = {'q': 'Book', 'field': 'title', 'limit': 2}
+        response = self.client.post(reverse('search_for_book'), json.dumps(data), content_type='application/json')
+
+        # The first page is full and points at the next one
+        first_page = response.json()
+        self.assertEqual([book['title'] for book in first_page['results']], ['Book1', 'Book2'])
+        self.assertIsNotNone(first_page['next_cursor'])
+
+        # Following the cursor returns the remaining book and no further cursor
+        data['cursor'] = first_page['next_cursor']
+        response = self.client.post(reverse('search_for_book'), json.dumps(data), content_type='application/json')
+        second_page = response.json()
+        self.assertEqual([book['title'] for book in second_page['results']], ['Book3'])
+        self.assertIsNone(second_page['next_cursor'])
+
+    def test_search_for_book_invalid_cursor(self):
+        data = {'q': 'Book', 'field': 'title', 'cursor': 'not-a-cursor'}
+        response = self.client.post(reverse('search_for_book'), json.dumps(data), content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Invalid cursor')
+
     def test_search_for_book_get_not_allowed(self):
         response = self.client.get(reverse('search_for_book'))
         
@@ -283,6 +313,33 @@ class SearchForMemberViewTestCase(TestCase):
         self.assertTrue('results' in response.json())
         self.assertEqual(len(response.json()['results']), 1)  # Check if exactly one member is returned
 
+    def test_search_for_member_page_size_is_capped(self):
+        for i in range(3):
+            Member.objects.create(name=f'Member {i}', email=f'member{i}@example.com', member_id=f'M{i}')
+
+        # An empty query matches everyone but only one page is returned
+        with self.settings(SEARCH_MAX_PAGE_SIZE=2):
+            data = {'q': '', 'field': 'name', 'limit': 1000}
+            response = self.client.post(reverse('search_for_member'), data, content_type='application/json')
+
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNotNone(response.json()['next_cursor'])
+
+    def test_search_for_member_keys_match_substrings(self):
+        Member.objects.create(name='John Doe', email='john@gmail.com', member_id='M0042')
+        Member.objects.create(name='Jane Smith', email='gmailfan@example.com', member_id='M1042')
+
+        def search(q, field, **extra):
+            data = json.dumps({'q': q, 'field': field, **extra})
+            response = self.client.post(reverse('search_for_member'), data, content_type='application/json')
+            return sorted(member['member_id'] for member in response.json()['results'])
+
+        self.assertEqual(search('gmail', 'email'), ['M0042', 'M1042'])
+        self.assertEqual(search('0042', 'member_id'), ['M0042'])
+        # The indexed prefix mode matches from the start only
+        self.assertEqual(search('gmail', 'email', match='prefix'), ['M1042'])
+        self.assertEqual(search('0042', 'member_id', match='prefix'), [])
+
     def test_search_for_member_post_invalid_query(self):
         # Create a POST request with invalid search parameters
         data = {
@@ -422,6 +479,107 @@ class NewTransactionViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.json()['success'], False)
 
+class TransactionLookupTestCase(TransactionTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.book = Book.objects.create(title='Sapiens', author='Yuval Noah Harari', isbn='9780062316097', quantity_available=5, quantity_total=5)
+        self.other_book = Book.objects.create(title='Homo Deus', author='Yuval Noah Harari', isbn='9780062464316', quantity_available=5, quantity_total=5)
+        self.member = Member.objects.create(name='John Doe', email='john@example.com', member_id='M1001')
+        self.other_member = Member.objects.create(name='Jane Smith', email='jane@example.com', member_id='M2002')
+        build_indexes()
+
+    def lookup(self, kind, q):
+        response = self.client.get(reverse('lookup'), {'kind': kind, 'q': q})
+        return [result['label'] for result in response.json()['results']]
+
+    def test_new_transaction_form_does_not_load_books_or_members(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('newtransaction'))
+        self.assertNotContains(response, 'Sapiens')
+        self.assertNotContains(response, 'John Doe')
+
+    def test_edit_transaction_form_renders_only_the_chosen_rows(self):
+        transaction = Transaction.objects.create(book=self.book, member=self.member, transaction_type='issue')
+        response = self.client.get(reverse('edit_transaction', args=[transaction.pk]))
+        self.assertContains(response, f'<option value="{self.book.pk}" selected>Sapiens by Yuval Noah Harari</option>', html=True)
+        self.assertContains(response, f'<option value="{self.member.pk}" selected>John Doe - M1001</option>', html=True)
+        self.assertNotContains(response, 'Homo Deus')
+        self.assertNotContains(response, 'Jane Smith')
+
+    def test_lookup_books_by_isbn_and_title(self):
+        self.assertEqual(self.lookup('book', '978-0062-316'), ['Sapiens by Yuval Noah Harari'])
+        self.assertEqual(self.lookup('book', 'homo'), ['Homo Deus by Yuval Noah Harari'])
+
+    def test_lookup_members_by_member_id_and_name(self):
+        self.assertEqual(self.lookup('member', 'M2'), ['Jane Smith - M2002'])
+        self.assertEqual(self.lookup('member', 'joh'), ['John Doe - M1001'])
+
+    def test_lookup_members_sharing_a_name(self):
+        namesake = Member.objects.create(name='John Doe', email='john.doe@example.com', member_id='M3003')
+        response = self.client.get(reverse('lookup'), {'kind': 'member', 'q': 'john doe'})
+        self.assertEqual(sorted(result['id'] for result in response.json()['results']), [self.member.pk, namesake.pk])
+
+    def test_lookup_unknown_kind(self):
+        response = self.client.get(reverse('lookup'), {'kind': 'purchase', 'q': 'sap'})
+        self.assertEqual(response.status_code, 400)
+
+class BatchCheckoutViewTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.book1 = Book.objects.create(title='Book1', author='Author1', isbn='1234567890123', quantity_available=1, quantity_total=1)
+        self.book2 = Book.objects.create(title='Book2', author='Author2', isbn='1234567890124', quantity_available=0, quantity_total=1)
+        self.member = Member.objects.create(name='Test Member', email='test@example.com', member_id='12345', outstanding_debt=480)
+
+    def post_batch(self, items, member=None):
+        data = {'member': member or self.member.pk, 'items': items}
+        return self.client.post(reverse('batch_checkout'), json.dumps(data), content_type='application/json')
+
+    def test_batch_applies_items_in_order_with_per_item_results(self):
+        response = self.post_batch([
+            {'book': self.book2.pk, 'action': 'return', 'amount_paid': '5'},
+            {'book': self.book2.pk, 'action': 'issue', 'fee_charged': '10'},
+            {'book': self.book1.pk, 'action': 'issue', 'fee_charged': '20'},
+            {'book': self.book2.pk, 'action': 'issue'},
+            {'book': 'abc', 'action': 'issue'},
+        ])
+
+        results = response.json()['results']
+        self.assertFalse(response.json()['success'])
+        self.assertEqual([result['success'] for result in results], [True, True, False, False, False])
+        self.assertEqual(results[2]['error'], 'Outstanding debt cannot exceed 500.')
+        self.assertEqual(results[3]['error'], 'No copies of this book are available.')
+
+        # Only the accepted items were recorded and applied
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.book1.refresh_from_db()
+        self.book2.refresh_from_db()
+        self.assertEqual((self.book1.quantity_available, self.book2.quantity_available), (1, 0))
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.outstanding_debt, 490)
+
+    def test_batch_query_count_does_not_grow_with_items(self):
+        Book.objects.filter(pk=self.book1.pk).update(quantity_available=50)
+        items = [{'book': self.book1.pk, 'action': 'issue'} for _ in range(20)]
+
+        # Lock books, lock member, lock open loans, bulk insert of the
+        # transactions and of the loans, one stock update, three dashboard
+        # counters, in a savepoint
+        StatCounter.objects.create(name=issues_key())
+        with self.assertNumQueries(11):
+            response = self.post_batch(items)
+
+        self.assertTrue(response.json()['success'])
+        self.book1.refresh_from_db()
+        self.assertEqual(self.book1.quantity_available, 30)
+
+    def test_unknown_member(self):
+        response = self.post_batch([{'book': self.book1.pk, 'action': 'issue'}], member=999)
+        self.assertEqual(response.status_code, 404)
+
+    def test_empty_batch(self):
+        response = self.post_batch([])
+        self.assertEqual(response.status_code, 400)
+
 class SearchTransactionViewTestCase(TestCase):
     def test_search_transaction_view(self):
         # Make a GET request to the search_transaction view
@@ -452,6 +610,38 @@ class SearchForTransactionViewTestCase(TestCase):
         response_data = response.json()
         self.assertIn('results', response_data)
 
+    def test_search_for_transaction_query_count_is_constant(self):
+        book = Book.objects.create(title='Test Book', author='Test Author', isbn='1234567890123', quantity_available=50)
+        member = Member.objects.create(name='Test Member', email='test@example.com', member_id='12345')
+        post_data = json.dumps({'q': '1234567890123', 'field': 'book'})
+
+        # One joined query serves the page whether it holds one or many rows
+        for expected_count in (1, 20):
+            while Transaction.objects.count() < expected_count:
+                Transaction.objects.create(book=book, member=member, transaction_type='issue')
+            with self.assertNumQueries(1):
+                response = self.client.post(reverse('search_for_transaction'), data=post_data, content_type='application/json')
+            self.assertEqual(len(response.json()['results']), expected_count)
+
+        result = response.json()['results'][0]
+        self.assertEqual(result['book_title'], 'Test Book')
+        self.assertEqual(result['member_name'], 'Test Member')
+        self.assertEqual(result['fee_charged'], '0.00')
+
+    def test_search_for_transaction_keys_match_substrings(self):
+        book = Book.objects.create(title='Test Book', author='Test Author', isbn='1234567890123', quantity_available=5)
+        member = Member.objects.create(name='Test Member', email='test@example.com', member_id='M0042')
+        Transaction.objects.create(book=book, member=member, transaction_type='issue')
+
+        def search(q, field, **extra):
+            data = json.dumps({'q': q, 'field': field, **extra})
+            response = self.client.post(reverse('search_for_transaction'), data, content_type='application/json')
+            return len(response.json()['results'])
+
+        self.assertEqual((search('ssue', 'transaction_type'), search('0042', 'member')), (1, 1))
+        self.assertEqual((search('ssue', 'transaction_type', match='prefix'), search('m00', 'member', match='prefix')),
+                         (0, 1))
+
     def test_search_for_transaction_get(self):
         # Make a GET request to the search_for_transaction view
         response = self.client.get(reverse('search_for_transaction'))
@@ -537,4 +727,33 @@ class EditTransactionViewTestCase(TestCase):
         # Check if the member's outstanding debt is updated correctly
         self.member.refresh_from_db()  # Refresh the member instance from the database
         expected_outstanding_debt = initial_outstanding_debt - updated_amount_paid
-        self.assertEqual(self.member.outstanding_debt, expected_outstanding_debt)
\ No newline at end of file
+        self.assertEqual(self.member.outstanding_debt, expected_outstanding_debt)
+    def test_edit_issue_of_the_last_copy(self):
+        last = Book.objects.create(title='Last Copy', author='Test Author', isbn='9780441013593', quantity_available=1,
+                                   quantity_total=1)
+        transaction = Transaction.objects.create(book=last, member=self.member, transaction_type='issue')
+        form_data = {'book': last.pk, 'member': self.member.pk, 'transaction_type': 'issue', 'fee_charged': '3',
+                     'amount_paid': '0'}
+        response = self.client.post(reverse('edit_transaction', args=[transaction.pk]), form_data)
+        self.assertEqual(response.status_code, 200)
+        # The stock is left alone, the debt moves by the fee added
+        last.refresh_from_db()
+        self.member.refresh_from_db()
+        self.assertEqual((last.quantity_available, self.member.outstanding_debt), (0, Decimal('8')))
+
+        # Moving the issue to a book without copies is refused on the form
+        form_data['book'] = self.book.pk
+        Book.objects.filter(pk=self.book.pk).update(quantity_available=0)
+        response = self.client.post(reverse('edit_transaction', args=[transaction.pk]), dict(form_data, amount_paid='2'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No copies of this book are available', str(response.context['form'].non_field_errors()))
+        transaction.refresh_from_db()
+        self.member.refresh_from_db()
+        self.assertEqual((transaction.book_id, transaction.amount_paid, self.member.outstanding_debt),
+                         (last.pk, 0, Decimal('8')))
+
+        Book.objects.filter(pk=self.book.pk).update(quantity_available=1)
+        self.client.post(reverse('edit_transaction', args=[transaction.pk]), form_data)
+        last.refresh_from_db()
+        self.book.refresh_from_db()
+        self.assertEqual((last.quantity_available, self.book.quantity_available), (1, 0))